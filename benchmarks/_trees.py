@@ -0,0 +1,88 @@
+"""
+Helpers to generate synthetic source trees for the benchmarks.
+"""
+
+import os
+
+# Every how many packages a setup_package.py and a .pyx file are added
+DENSITIES = {"sparse": 100, "dense": 10}
+
+SETUP_PACKAGE = """\
+from os.path import join
+
+from setuptools import Extension
+
+
+def get_extensions():
+    return [Extension("{name}.module", [join({path!r}, "module.c")])]
+"""
+
+MODULE_C = """\
+#include <Python.h>
+
+static struct PyModuleDef moduledef = {PyModuleDef_HEAD_INIT, "module", NULL, -1, NULL};
+
+PyMODINIT_FUNC PyInit_module(void) { return PyModule_Create(&moduledef); }
+"""
+
+MODULE_PYX = """\
+def add(int a, int b):
+    return a + b
+"""
+
+
+def _write(path, content=""):
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def make_tree(root, packages, density="sparse"):
+    """
+    Create a source tree in ``root`` with ``packages`` packages.
+
+    The packages are grouped in sub-packages of 100 packages of a single
+    top-level package. Depending on ``density``, one in 100 (``'sparse'``)
+    or one in 10 (``'dense'``) packages defines an extension in a
+    ``setup_package.py`` file, and as many packages contain a ``.pyx`` file.
+    The tree also contains a few directories which should be skipped, such
+    as ``build`` and ``.git``.
+    """
+
+    every = DENSITIES[density]
+
+    top = os.path.join(root, "synthetic")
+    os.makedirs(top)
+    _write(os.path.join(top, "__init__.py"))
+
+    for i in range(packages):
+        group = os.path.join(top, f"group{i // 100:03d}")
+        if i % 100 == 0:
+            os.makedirs(group)
+            _write(os.path.join(group, "__init__.py"))
+
+        path = os.path.join(group, f"pkg{i:05d}")
+        os.makedirs(os.path.join(path, "tests"))
+        _write(os.path.join(path, "__init__.py"))
+        _write(os.path.join(path, "core.py"), "def f():\n    pass\n")
+        _write(os.path.join(path, "tests", "__init__.py"))
+        _write(os.path.join(path, "tests", "test_core.py"))
+
+        if i % every == 0:
+            name = os.path.relpath(path, root).replace(os.sep, ".")
+            _write(
+                os.path.join(path, "setup_package.py"),
+                SETUP_PACKAGE.format(name=name, path=os.path.relpath(path, root)),
+            )
+            _write(os.path.join(path, "module.c"), MODULE_C)
+
+        if i % every == 1:
+            _write(os.path.join(path, "fast.pyx"), MODULE_PYX)
+
+    for name in ("build", "docs", ".git"):
+        os.makedirs(os.path.join(root, name))
+        for i in range(max(1, packages // 10)):
+            _write(os.path.join(root, name, f"file{i}.txt"))
+
+    _write(os.path.join(root, "setup.py"))
+
+    return root
@@ -0,0 +1,116 @@
+"""
+Benchmarks for the discovery of packages and extensions in source trees.
+"""
+
+import os
+from typing import ClassVar
+
+from setuptools import find_packages
+
+from extension_helpers import get_extensions
+from extension_helpers._setup_helpers import get_cython_extensions
+from extension_helpers._utils import walk_skip_hidden
+
+try:
+    from extension_helpers._source_tree import index_source_tree
+except ImportError:  # Older versions, when benchmarking past commits
+    index_source_tree = None
+
+from ._trees import DENSITIES, make_tree
+
+PACKAGES = [10, 1000, 10000]
+
+
+def _require_index_source_tree(*params):
+    # asv skips benchmarks whose setup raises NotImplementedError
+    if index_source_tree is None:
+        raise NotImplementedError()
+
+
+class Discovery:
+    """
+    Benchmarks for the discovery of extensions in synthetic source trees of
+    varying size, with the persistent cache disabled.
+    """
+
+    params: ClassVar[list] = [PACKAGES, list(DENSITIES)]
+    param_names: ClassVar[list[str]] = ["packages", "density"]
+    timeout = 600
+
+    def setup_cache(self):
+        # This is run once, in a temporary directory which is also the
+        # working directory of the benchmarks.
+        for packages in PACKAGES:
+            for density in DENSITIES:
+                make_tree(os.path.abspath(f"tree-{packages}-{density}"), packages, density)
+
+    def setup(self, packages, density):
+        self._environ = os.environ.copy()
+        os.environ["EXTENSION_HELPERS_CACHE_DIR"] = ""
+        os.environ.pop("EXTENSION_HELPERS_DISCOVERY_CACHE", None)
+
+        # get_extensions() should be called from the root of the source tree
+        self._cwd = os.getcwd()
+        os.chdir(f"tree-{packages}-{density}")
+
+        self.packages = find_packages()
+
+    def teardown(self, packages, density):
+        os.chdir(self._cwd)
+        os.environ.clear()
+        os.environ.update(self._environ)
+
+    def time_get_extensions(self, packages, density):
+        get_extensions()
+
+    def peakmem_get_extensions(self, packages, density):
+        get_extensions()
+
+    def time_get_cython_extensions(self, packages, density):
+        get_cython_extensions(".", self.packages)
+
+    def time_index_source_tree(self, packages, density):
+        index_source_tree(".")
+
+    time_index_source_tree.setup = _require_index_source_tree
+
+    def time_walk_skip_hidden(self, packages, density):
+        for _ in walk_skip_hidden("."):
+            pass
+
+
+class CachedDiscovery:
+    """
+    Benchmarks for the discovery of extensions when the discovery manifest
+    is up to date.
+    """
+
+    params: ClassVar[list] = [PACKAGES]
+    param_names: ClassVar[list[str]] = ["packages"]
+    timeout = 600
+
+    def setup_cache(self):
+        for packages in PACKAGES:
+            make_tree(os.path.abspath(f"tree-{packages}"), packages, "dense")
+
+    def setup(self, packages):
+        self._environ = os.environ.copy()
+        os.environ["EXTENSION_HELPERS_CACHE_DIR"] = os.path.abspath(f"cache-{packages}")
+        os.environ["EXTENSION_HELPERS_DISCOVERY_CACHE"] = "1"
+
+        self._cwd = os.getcwd()
+        os.chdir(f"tree-{packages}")
+
+        # Make sure the manifest exists
+        get_extensions()
+
+    def teardown(self, packages):
+        os.chdir(self._cwd)
+        os.environ.clear()
+        os.environ.update(self._environ)
+
+    def time_get_extensions(self, packages):
+        get_extensions()
+
+    def peakmem_get_extensions(self, packages):
+        get_extensions()
@@ -0,0 +1,169 @@
+"""
+Benchmarks for the compiler and pkg-config probes which are typically run
+from setup_package.py files.
+"""
+
+import os
+import shutil
+import tempfile
+from typing import ClassVar
+
+from extension_helpers import _openmp_helpers, _setup_helpers, pkg_config
+from extension_helpers._openmp_helpers import check_openmp_support
+
+PC_FILE = """\
+prefix=/opt/{name}
+Name: {name}
+Description: Benchmark package
+Version: 1.0
+Cflags: -I${{prefix}}/include
+Libs: -L${{prefix}}/lib -l{name}
+"""
+
+
+def _clear_cache(module, name):
+    # In-process caches do not exist in older versions
+    cache = getattr(module, name, None)
+    if cache is not None:
+        cache.clear()
+
+
+def _clear_probe_results():
+    # Probe results were cached by _openmp_helpers before the probe engine
+    # was added
+    try:
+        from extension_helpers import _probes
+    except ImportError:
+        _clear_cache(_openmp_helpers, "_PROBE_RESULTS")
+    else:
+        _clear_cache(_probes, "_PROBE_RESULTS")
+
+
+def _require_pkg_config_batch(*params):
+    # asv skips benchmarks whose setup raises NotImplementedError
+    if not hasattr(_setup_helpers, "pkg_config_batch"):
+        raise NotImplementedError("pkg_config_batch is not available")
+
+
+class OpenMP:
+    """
+    Benchmarks for check_openmp_support, both when the compiler actually
+    needs to be run and when the result is cached.
+    """
+
+    timeout = 300
+    number = 1
+    repeat = 5
+
+    def setup(self):
+        self._environ = os.environ.copy()
+        self._cache_dir = tempfile.mkdtemp()
+        os.environ["EXTENSION_HELPERS_CACHE_DIR"] = self._cache_dir
+        _clear_probe_results()
+
+    def teardown(self):
+        os.environ.clear()
+        os.environ.update(self._environ)
+        shutil.rmtree(self._cache_dir)
+
+    def time_check_openmp_support_uncached(self):
+        os.environ["EXTENSION_HELPERS_CACHE_DIR"] = ""
+        _clear_probe_results()
+        check_openmp_support()
+
+    def time_check_openmp_support_cached_on_disk(self):
+        check_openmp_support()
+        _clear_probe_results()
+        check_openmp_support()
+
+    def time_check_openmp_support_cached_in_process(self):
+        check_openmp_support()
+        check_openmp_support()
+
+
+class FeatureProbes:
+    """
+    Benchmarks for running several independent compiler probes, one at a
+    time or as a single batch.
+    """
+
+    params: ClassVar[list] = [1, 10]
+    param_names: ClassVar[list[str]] = ["probes"]
+    timeout = 300
+    number = 1
+    repeat = 5
+
+    def setup(self, probes):
+        try:
+            from extension_helpers import Probe
+        except ImportError:
+            raise NotImplementedError("the probe engine is not available") from None
+
+        self._environ = os.environ.copy()
+        os.environ["EXTENSION_HELPERS_CACHE_DIR"] = ""
+        _clear_probe_results()
+        self.probes = [Probe(f"int f{i}(void) {{ return {i}; }}\n") for i in range(probes)]
+
+    def teardown(self, probes):
+        os.environ.clear()
+        os.environ.update(self._environ)
+
+    def time_run_probes_sequential(self, probes):
+        from extension_helpers import run_probes
+
+        for probe in self.probes:
+            run_probes([probe])
+
+    def time_run_probes_batch(self, probes):
+        from extension_helpers import run_probes
+
+        run_probes(self.probes)
+
+
+class PkgConfig:
+    """
+    Benchmarks for pkg_config, for 1 to 100 lookups of different packages.
+    """
+
+    params: ClassVar[list] = [1, 10, 100]
+    param_names: ClassVar[list[str]] = ["lookups"]
+    timeout = 300
+    number = 1
+    repeat = 5
+
+    def setup(self, lookups):
+        if shutil.which("pkg-config") is None:
+            raise NotImplementedError("pkg-config is not available")
+
+        self._environ = os.environ.copy()
+        self._pc_dir = tempfile.mkdtemp()
+        for i in range(lookups):
+            with open(os.path.join(self._pc_dir, f"bench{i}.pc"), "w") as f:
+                f.write(PC_FILE.format(name=f"bench{i}"))
+
+        os.environ["PKG_CONFIG_LIBDIR"] = self._pc_dir
+        os.environ.pop("PKG_CONFIG_PATH", None)
+        os.environ["EXTENSION_HELPERS_CACHE_DIR"] = ""
+        _clear_cache(_setup_helpers, "_PKG_CONFIG_RESULTS")
+
+    def teardown(self, lookups):
+        os.environ.clear()
+        os.environ.update(self._environ)
+        shutil.rmtree(self._pc_dir)
+
+    def time_pkg_config(self, lookups):
+        _clear_cache(_setup_helpers, "_PKG_CONFIG_RESULTS")
+        for i in range(lookups):
+            pkg_config([f"bench{i}"], [f"bench{i}"])
+
+    def time_pkg_config_repeated(self, lookups):
+        # The same lookup done by every setup_package.py file
+        _clear_cache(_setup_helpers, "_PKG_CONFIG_RESULTS")
+        for _ in range(lookups):
+            pkg_config(["bench0"], ["bench0"])
+
+    def time_pkg_config_batch(self, lookups):
+        _clear_cache(_setup_helpers, "_PKG_CONFIG_RESULTS")
+        _setup_helpers.pkg_config_batch([([f"bench{i}"], [f"bench{i}"]) for i in range(lookups)])
+
+    time_pkg_config_batch.setup = _require_pkg_config_batch
@@ -1,8 +1,25 @@
 import sys
 from configparser import ConfigParser
 
+from ._build_ext import BuildExt  # noqa: F401
 from ._openmp_helpers import add_openmp_flags_if_available  # noqa: F401
-from ._setup_helpers import get_compiler, get_extensions, pkg_config  # noqa: F401
+from ._probes import (  # noqa: F401
+    Probe,
+    compiles,
+    has_flag,
+    has_function,
+    has_header,
+    has_linker_flag,
+    run_probes,
+    run_probes_async,
+)
+from ._setup_helpers import (  # noqa: F401
+    get_compiler,
+    get_extensions,
+    pkg_config,
+    pkg_config_batch,
+)
+from ._simd import add_simd_variants  # noqa: F401
 from ._utils import import_file, write_if_different  # noqa: F401
 from .version import version as __version__  # noqa: F401
 
@@ -11,10 +28,15 @@ def _finalize_distribution_hook(distribution):
     """
     Entry point for setuptools which allows extension-helpers to be enabled
     from setup.cfg without the need for setup.py.
+
+    Extensions are collected lazily, only once a command that needs them
+    (such as ``build_ext``) is run.
     """
     import os
     from pathlib import Path
 
+    from ._setup_helpers import set_lazy_extensions
+
     if sys.version_info >= (3, 11):
         import tomllib
     else:
@@ -29,7 +51,7 @@ def _finalize_distribution_hook(distribution):
         if cfg.has_option("extension-helpers", "use_extension_helpers"):
             found_config = True
             if cfg.get("extension-helpers", "use_extension_helpers").lower() == "true":
-                distribution.ext_modules = get_extensions()
+                set_lazy_extensions(distribution)
 
     pyproject = Path(distribution.src_root or os.curdir, "pyproject.toml")
     if pyproject.exists() and not found_config:
@@ -41,4 +63,4 @@ def _finalize_distribution_hook(distribution):
                 and "use_extension_helpers" in pyproject_cfg["tool"]["extension-helpers"]
                 and pyproject_cfg["tool"]["extension-helpers"]["use_extension_helpers"]
             ):
-                distribution.ext_modules = get_extensions()
+                set_lazy_extensions(distribution)
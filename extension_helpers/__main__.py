@@ -0,0 +1,31 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+Command-line interface to the extension-helpers caches, e.g.::
+
+    python -m extension_helpers cache stats
+"""
+
+import argparse
+import sys
+
+from ._object_cache import format_object_cache_stats, get_object_cache_stats
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(prog="python -m extension_helpers")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    cache_parser = subparsers.add_parser("cache", help="inspect the object cache")
+    cache_subparsers = cache_parser.add_subparsers(dest="action", required=True)
+    cache_subparsers.add_parser("stats", help="show the statistics of the object cache")
+
+    args = parser.parse_args(args)
+
+    if args.command == "cache" and args.action == "stats":
+        print(format_object_cache_stats(get_object_cache_stats()))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
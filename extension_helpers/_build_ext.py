@@ -0,0 +1,771 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module provides a ``build_ext`` command class which can be used instead
+of the default setuptools one to build the extensions returned by
+:func:`~extension_helpers.get_extensions` more efficiently.
+"""
+
+import functools
+import itertools
+import logging
+import os
+import queue
+import shlex
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from setuptools.command.build_ext import Library
+from setuptools.command.build_ext import build_ext as SetuptoolsBuildExt
+
+from ._cython import cythonize_extensions
+from ._launcher import (
+    apply_compiler_launcher,
+    format_stats_difference,
+    get_compiler_launcher,
+    get_launcher_stats,
+)
+from ._lto import check_lto_support, get_lto_flags, get_lto_mode
+from ._object_cache import get_object_cache
+from ._pch import PrecompiledHeaders, get_precompiled_headers_config
+from ._pgo import (
+    get_compiler_family,
+    get_pgo_command,
+    get_pgo_flags,
+    merge_profiles,
+    run_training_command,
+)
+from ._probes import has_flag, has_linker_flag
+from ._shared import (
+    compile_options,
+    find_shared_sources,
+    is_outdated,
+    remove_shared_sources,
+)
+from ._trace import BuildTrace, get_trace_filename
+from ._unity import apply_unity_build, get_unity_build_options
+from ._utils import get_env_flag
+
+__all__ = ["BuildExt"]
+
+log = logging.getLogger(__name__)
+
+# Priorities used when scheduling jobs - lower values are run first. Linking
+# is given precedence so that extensions are completed as early as possible.
+_LINK_PRIORITY = 0
+_COMPILE_PRIORITY = 1
+
+
+def _get_size(filenames):
+    """
+    Return the total size of the given files, ignoring files which do not
+    exist (yet).
+    """
+    size = 0
+    for filename in filenames:
+        try:
+            size += os.path.getsize(filename)
+        except OSError:
+            pass
+    return size
+
+
+def _add_flags(args, flags):
+    """
+    Return ``args`` followed by the flags from ``flags`` which it does not
+    already contain.
+    """
+    return [*args, *(flag for flag in flags if flag not in args)]
+
+
+class _JobScheduler:
+    """
+    A minimal thread pool which runs jobs in order of priority.
+
+    Each job typically spawns a compiler or linker process, so the number of
+    worker threads sets the number of such processes running concurrently.
+    """
+
+    def __init__(self, jobs):
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"build-job-{i}", daemon=True)
+            for i in range(jobs)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, priority, func, *args, **kwargs):
+        future = Future()
+        self._queue.put((priority, next(self._counter), future, func, args, kwargs))
+        return future
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put(((float("inf"),), next(self._counter), None, None, None, None))
+        for thread in self._threads:
+            thread.join()
+
+    def _worker(self):
+        while True:
+            _, _, future, func, args, kwargs = self._queue.get()
+            if future is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as exc:  # noqa: BLE001
+                future.set_exception(exc)
+
+
+class BuildExt(SetuptoolsBuildExt):
+    """
+    A ``build_ext`` command which compiles extensions in parallel.
+
+    Rather than building one extension after the other, the sources of all
+    extensions are compiled concurrently. Extensions with the largest sources
+    are started first, and each extension is linked as soon as all of its
+    object files are available.
+
+    If a compiler launcher such as ccache or sccache is configured with the
+    ``EXTENSION_HELPERS_COMPILER_LAUNCHER`` environment variable, it is put in
+    front of the compiler commands.
+
+    If the ``EXTENSION_HELPERS_OBJECT_CACHE`` environment variable or the
+    ``object-cache`` option in ``pyproject.toml`` is set, compiled object files
+    are stored in a cache shared between builds, and retrieved from it
+    instead of compiling the same source with the same options again.
+
+    If the ``EXTENSION_HELPERS_TRACE`` environment variable is set, the time
+    and resources used by each step of the build are written to the file it
+    points to in the Chrome trace event format.
+
+    Before building, the Cython sources of all extensions are converted to
+    C/C++ in parallel, skipping modules which are up to date.
+
+    C/C++ sources which several extensions compile with the same options are
+    only compiled once, and the object files are linked into each of these
+    extensions.
+
+    If unity builds are enabled with the ``EXTENSION_HELPERS_UNITY_BUILD``
+    environment variable or the ``unity-build`` option in ``pyproject.toml``,
+    the C/C++ sources of each extension are merged into a few translation
+    units.
+
+    If link-time optimization is enabled with the ``EXTENSION_HELPERS_LTO``
+    environment variable or the ``lto`` option in ``pyproject.toml``, and is
+    supported by the compiler, the LTO flags are added to all extensions.
+
+    If precompiled headers are configured with the ``precompiled-headers``
+    option in ``pyproject.toml`` and supported by the compiler, the headers
+    are compiled once for each combination of compiler options and used when
+    compiling the sources of the extensions.
+
+    If the ``EXTENSION_HELPERS_PGO`` environment variable is set, extensions
+    are built with profile-guided optimization: they are first built with
+    instrumentation, then a training command is run, and the extensions are
+    rebuilt using the recorded profile data.
+
+    The number of concurrent jobs is taken from the ``--parallel`` (``-j``)
+    option of the command if set, otherwise from the
+    ``EXTENSION_HELPERS_BUILD_JOBS`` environment variable, and defaults to
+    the number of CPUs.
+
+    To use this command, pass it to ``setup()``::
+
+        from extension_helpers import BuildExt, get_extensions
+        setup(..., ext_modules=get_extensions(), cmdclass={"build_ext": BuildExt})
+
+    or declare it in the ``[tool.setuptools.cmdclass]`` section of
+    ``pyproject.toml``.
+    """
+
+    _trace = None
+    _inplace = False
+    _shared_sources = ()
+    _precompiled_headers = None
+
+    def run(self):
+        # The setuptools command builds extensions in the build directory and
+        # only copies them to the source tree afterwards, so we need to record
+        # whether --inplace was given before it is reset.
+        self._inplace = bool(self.inplace)
+        super().run()
+
+    def get_build_jobs(self):
+        """
+        Return the number of jobs to run concurrently.
+        """
+
+        if self.parallel:
+            if self.parallel is True:
+                return os.cpu_count() or 1
+            return max(1, int(self.parallel))
+
+        jobs = os.environ.get("EXTENSION_HELPERS_BUILD_JOBS")
+        if jobs:
+            try:
+                return max(1, int(jobs))
+            except ValueError:
+                raise ValueError(
+                    f"EXTENSION_HELPERS_BUILD_JOBS should be an integer, got {jobs!r}"
+                ) from None
+
+        return os.cpu_count() or 1
+
+    def cythonize_extensions(self, jobs):
+        """
+        Convert the Cython sources of all extensions to C/C++ before building.
+
+        Cython is run for several modules in parallel, and modules whose
+        sources and dependencies have not changed since the last build are
+        skipped. This can be disabled by setting the
+        ``EXTENSION_HELPERS_PRECYTHONIZE`` environment variable to ``0``, in
+        which case the sources are converted one at a time while building.
+        """
+
+        if not get_env_flag("EXTENSION_HELPERS_PRECYTHONIZE", default=True):
+            return
+
+        # Options which change where or how sources are generated are left
+        # to the build_ext command from Cython.
+        if getattr(self, "cython_c_in_temp", False) or getattr(self, "cython_gdb", False):
+            return
+
+        directives = getattr(self, "cython_directives", None)
+
+        cythonize_extensions(
+            self.extensions,
+            jobs=jobs,
+            force=self.force,
+            directives=directives if isinstance(directives, dict) else None,
+            include_dirs=getattr(self, "cython_include_dirs", None) or (),
+            cplus=getattr(self, "cython_cplus", False),
+            trace=self._trace,
+        )
+
+    def setup_shared_sources(self):
+        """
+        Arrange for the C/C++ sources which several extensions compile with
+        the same options to be compiled only once, unless the
+        ``EXTENSION_HELPERS_SHARE_SOURCES`` environment variable is set to
+        ``0``.
+
+        The shared sources are removed from the extensions, and the object
+        files compiled from them are added to the ``extra_objects`` of the
+        extensions instead.
+        """
+
+        self._shared_sources = []
+
+        if not get_env_flag("EXTENSION_HELPERS_SHARE_SOURCES", default=True):
+            return
+
+        shared = find_shared_sources(self.extensions)
+        if not shared:
+            return
+
+        # Sources shared with different options are compiled in different
+        # directories so that their object files do not overwrite each other.
+        output_dirs = {}
+
+        for source, exts in shared:
+            options = compile_options(exts[0])
+            if options not in output_dirs:
+                output_dirs[options] = os.path.join(
+                    self.build_temp, "shared", str(len(output_dirs))
+                )
+            output_dir = output_dirs[options]
+            (obj,) = self.compiler.object_filenames([source], output_dir=output_dir)
+
+            for ext in exts:
+                # The language used for linking is determined from the
+                # sources, which should still include the shared ones.
+                if ext.language is None:
+                    ext.language = self.compiler.detect_language(ext.sources)
+                remove_shared_sources(ext, [source])
+                ext.extra_objects = [*ext.extra_objects, obj]
+
+            self._shared_sources.append((source, obj, exts[0], output_dir))
+
+        log.info(
+            "compiling %d sources shared by several extensions only once",
+            len(self._shared_sources),
+        )
+
+    def setup_unity_build(self):
+        """
+        Merge the C/C++ sources of each extension into at most the number of
+        translation units set by the ``EXTENSION_HELPERS_UNITY_BUILD``
+        environment variable or the ``unity-build`` option in
+        ``pyproject.toml``, if unity builds are enabled.
+        """
+
+        units, exclude = get_unity_build_options()
+        if not units:
+            return
+
+        generated = apply_unity_build(
+            self.extensions, os.path.join(self.build_temp, "unity"), units, exclude=exclude
+        )
+        if generated:
+            log.info("unity build: compiling %d merged translation units", len(generated))
+
+    def setup_lto(self, jobs):
+        """
+        Add the flags for link-time optimization to all extensions, if this
+        is enabled with the ``EXTENSION_HELPERS_LTO`` environment variable or
+        the ``lto`` option in ``pyproject.toml`` and supported by the
+        compiler.
+
+        Since up to ``jobs`` extensions can be linked at the same time, each
+        link is given an equal share of the ``jobs`` for the optimization,
+        so that the total number of threads used by the linkers does not
+        exceed ``jobs``.
+
+        Returns
+        -------
+        mode : str or None
+            The LTO mode used, or `None` if LTO is not used.
+        """
+
+        mode = get_lto_mode()
+        if mode is None:
+            return None
+
+        compiler_type = self.compiler.compiler_type
+        family = get_compiler_family(self.compiler)
+
+        flags = get_lto_flags(compiler_type, family, mode)
+        if flags is None or not check_lto_support(*flags):
+            log.warning(
+                "%s link-time optimization is not supported by the compiler, "
+                "building extensions without it",
+                mode,
+            )
+            return None
+
+        if mode == "thin" and family != "clang":
+            log.info("thin link-time optimization is only supported by clang, using full LTO")
+            mode = "full"
+
+        concurrent_links = max(1, min(jobs, len(self.extensions)))
+        link_jobs = max(1, jobs // concurrent_links)
+        compile_flags, link_flags = get_lto_flags(compiler_type, family, mode, jobs=link_jobs)
+        for ext in self.extensions:
+            ext.extra_compile_args = _add_flags(ext.extra_compile_args, compile_flags)
+            ext.extra_link_args = _add_flags(ext.extra_link_args, link_flags)
+
+        log.info("using %s link-time optimization (%s)", mode, shlex.join(link_flags))
+
+        return mode
+
+    def setup_precompiled_headers(self):
+        """
+        Prepare the precompiled headers configured with the
+        ``precompiled-headers`` option in ``pyproject.toml``, if the compiler
+        supports them.
+
+        The headers themselves are only compiled when the first extension
+        using them is built, since the compiler options can still change
+        until then (for instance for profile-guided optimization).
+
+        Returns
+        -------
+        headers : `~extension_helpers._pch.PrecompiledHeaders` or None
+            The precompiled headers, or `None` if they are not used.
+        """
+
+        config = get_precompiled_headers_config()
+        if not config:
+            return None
+
+        family = get_compiler_family(self.compiler)
+        if family is None:
+            log.warning(
+                "precompiled headers are not supported with the %s compiler, "
+                "building extensions without them",
+                self.compiler.compiler_type,
+            )
+            return None
+
+        log.info("using precompiled headers")
+
+        return PrecompiledHeaders(
+            self.compiler, family, os.path.join(self.build_temp, "pch"), config
+        )
+
+    def setup_compiler_launcher(self):
+        """
+        Put the compiler launcher (such as ccache or sccache), if one is
+        configured, in front of the compiler commands.
+
+        Returns
+        -------
+        launcher : list of str or None
+            The launcher command, or `None` if no launcher is used.
+        """
+
+        launcher = get_compiler_launcher()
+        if launcher is None:
+            return None
+
+        applied = False
+        for compiler in (self.compiler, getattr(self, "shlib_compiler", None)):
+            if compiler is not None:
+                applied = apply_compiler_launcher(compiler, launcher) or applied
+
+        if applied:
+            log.info("using compiler launcher %s", shlex.join(launcher))
+
+        return launcher
+
+    def setup_object_cache(self):
+        """
+        Retrieve compiled object files from the object cache, if it is
+        enabled with the ``EXTENSION_HELPERS_OBJECT_CACHE`` environment
+        variable or the ``object-cache`` option in ``pyproject.toml``.
+
+        Returns
+        -------
+        cache : `~extension_helpers._object_cache.ObjectCache` or None
+            The object cache, or `None` if it is not used.
+        """
+
+        cache = get_object_cache()
+        if cache is None:
+            return None
+
+        applied = False
+        for compiler in (self.compiler, getattr(self, "shlib_compiler", None)):
+            if compiler is not None:
+                applied = cache.apply(compiler) or applied
+
+        if not applied:
+            log.warning(
+                "the object cache is not supported with the %s compiler",
+                self.compiler.compiler_type,
+            )
+            return None
+
+        log.info("using the object cache in %s", cache.directory)
+
+        return cache
+
+    def setup_trace(self):
+        """
+        Start recording the steps of the build if the
+        ``EXTENSION_HELPERS_TRACE`` environment variable is set to the name of
+        a file to write the trace to.
+
+        Returns
+        -------
+        trace : `~extension_helpers._trace.BuildTrace` or None
+        """
+
+        filename = get_trace_filename()
+        if filename is None:
+            return None
+
+        trace = BuildTrace(filename)
+        for compiler in (self.compiler, getattr(self, "shlib_compiler", None)):
+            if compiler is not None:
+                trace.trace_compiler(compiler)
+
+        return trace
+
+    def build_extensions(self):
+        self.check_extensions_list(self.extensions)
+
+        jobs = self.get_build_jobs()
+
+        self._trace = self.setup_trace()
+
+        try:
+            self.cythonize_extensions(jobs)
+            self.setup_shared_sources()
+            self.setup_unity_build()
+            self.setup_lto(jobs)
+            self._precompiled_headers = self.setup_precompiled_headers()
+
+            pgo_command = get_pgo_command()
+            # The compiler is identified before the launcher is applied
+            pgo_family = get_compiler_family(self.compiler) if pgo_command else None
+
+            launcher = self.setup_compiler_launcher()
+            stats_before = get_launcher_stats(launcher)
+            object_cache = self.setup_object_cache()
+
+            try:
+                if pgo_command:
+                    self.build_with_pgo(jobs, pgo_command, pgo_family)
+                else:
+                    self._build_all_extensions(jobs)
+            finally:
+                if stats_before is not None:
+                    stats_after = get_launcher_stats(launcher)
+                    if stats_after is not None:
+                        log.info(format_stats_difference(launcher, stats_before, stats_after))
+                if object_cache is not None:
+                    object_cache.close()
+                    log.info(object_cache.format_summary())
+        finally:
+            if self._trace is not None:
+                self._trace.write()
+                log.info(
+                    "build trace written to %s\n%s",
+                    self._trace.filename,
+                    self._trace.format_summary(),
+                )
+                self._trace = None
+
+    def build_with_pgo(self, jobs, command, family):
+        """
+        Build the extensions with profile-guided optimization.
+
+        The extensions are first built with instrumentation, then
+        ``command`` is run from the current directory with the instrumented
+        extensions in the Python path (or in the source tree for ``--inplace``
+        builds), and the extensions are finally rebuilt using the profile data
+        written by the training command. The profile data is written to the
+        ``pgo`` directory of the temporary build directory, which is cleared
+        beforehand.
+
+        If the compiler does not support profile-guided optimization, the
+        extensions are built normally.
+        """
+
+        if family is None or not (
+            has_flag("-fprofile-generate") and has_linker_flag("-fprofile-generate")
+        ):
+            log.warning(
+                "profile-guided optimization is not supported by the compiler, "
+                "building extensions without it"
+            )
+            self._build_all_extensions(jobs)
+            return
+
+        profile_dir = os.path.abspath(os.path.join(self.build_temp, "pgo"))
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        os.makedirs(profile_dir)
+
+        original_args = [
+            (ext, list(ext.extra_compile_args), list(ext.extra_link_args))
+            for ext in self.extensions
+        ]
+
+        def build(stage, profile):
+            compile_flags, link_flags = get_pgo_flags(family, stage, profile)
+            for ext, compile_args, link_args in original_args:
+                ext.extra_compile_args = compile_args + compile_flags
+                ext.extra_link_args = link_args + link_flags
+            self._build_all_extensions(jobs)
+
+        # Both builds need to rebuild all extensions
+        force = self.force
+        self.force = True
+
+        try:
+            log.info("PGO: building instrumented extensions")
+            build("generate", profile_dir)
+
+            # For --inplace builds, the training command is run against the
+            # source tree, so the instrumented extensions are copied there.
+            if self._inplace:
+                self.copy_extensions_to_source()
+
+            log.info("PGO: running training command %s", shlex.join(command))
+            run_training_command(command, pythonpath=self._get_extension_roots())
+
+            log.info("PGO: building optimized extensions")
+            build("use", merge_profiles(family, profile_dir))
+        finally:
+            self.force = force
+            for ext, compile_args, link_args in original_args:
+                ext.extra_compile_args = compile_args
+                ext.extra_link_args = link_args
+
+    def _get_extension_roots(self):
+        # The directories from which the built extensions can be imported
+        roots = []
+        for ext in self.extensions:
+            root = os.path.dirname(self.get_ext_fullpath(ext.name))
+            for _ in range(ext.name.count(".")):
+                root = os.path.dirname(root)
+            root = os.path.abspath(root)
+            if root not in roots:
+                roots.append(root)
+        return roots
+
+    def build_extension(self, ext):
+        if self._trace is None:
+            return self._build_extension(ext)
+        with self._trace.extension(ext.name):
+            return self._build_extension(ext)
+
+    def _build_extension(self, ext):
+        flags = self._get_precompiled_header_flags(ext)
+        if not flags:
+            return super().build_extension(ext)
+
+        original_args = ext.extra_compile_args
+        ext.extra_compile_args = [*original_args, *flags]
+        try:
+            return super().build_extension(ext)
+        finally:
+            ext.extra_compile_args = original_args
+
+    def _get_precompiled_header_flags(self, ext):
+        headers = self._precompiled_headers
+        if headers is None or isinstance(ext, Library):
+            return []
+
+        # Nothing is compiled for extensions which are up to date, so there is
+        # no need to build their precompiled header.
+        ext_path = self.get_ext_fullpath(ext.name)
+        if not (self.force or is_outdated(ext_path, [*ext.sources, *ext.depends])):
+            return []
+
+        get_flags = functools.partial(headers.get_flags, ext, debug=self.debug, force=self.force)
+
+        # In parallel builds, the header is compiled as one of the jobs
+        scheduler = getattr(self, "_scheduler", None)
+        if scheduler is None:
+            return get_flags()
+        rank = getattr(self._local, "rank", 0)
+        return scheduler.submit(
+            (_COMPILE_PRIORITY, rank), self._in_current_extension(get_flags)
+        ).result()
+
+    def _compile_shared_sources(self, jobs):
+        # The object files of the shared sources need to exist before any of
+        # the extensions using them is linked.
+        pending = [
+            (source, obj, ext, output_dir)
+            for source, obj, ext, output_dir in self._shared_sources
+            if self.force or is_outdated(obj, [source, *ext.depends])
+        ]
+        if not pending:
+            return
+
+        compiler = self.compiler
+        if not getattr(compiler, "initialized", True):
+            compiler.initialize()
+
+        def compile(source, ext, output_dir):
+            macros = [*ext.define_macros, *((undef,) for undef in ext.undef_macros)]
+            return compiler.compile(
+                [source],
+                output_dir=output_dir,
+                macros=macros,
+                include_dirs=ext.include_dirs,
+                debug=self.debug,
+                extra_postargs=ext.extra_compile_args,
+                depends=ext.depends,
+            )
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(compile, source, ext, output_dir)
+                for source, _, ext, output_dir in pending
+            ]
+            for future in futures:
+                future.result()
+
+    def _build_all_extensions(self, jobs):
+        self._compile_shared_sources(jobs)
+
+        if jobs == 1 or len(self.extensions) == 0:
+            self._build_extensions_serial()
+            return
+
+        # Libraries may be linked against by other extensions, and are built
+        # with a different compiler instance, so we build them first.
+        libraries = [ext for ext in self.extensions if isinstance(ext, Library)]
+        extensions = [ext for ext in self.extensions if not isinstance(ext, Library)]
+
+        for ext in libraries:
+            with self._filter_build_errors(ext):
+                self.build_extension(ext)
+
+        # Start the largest extensions first, since they are the most likely
+        # to determine the total build time.
+        extensions.sort(key=lambda ext: _get_size(ext.sources), reverse=True)
+
+        log.info("building %d extensions using %d parallel jobs", len(extensions), jobs)
+
+        self._build_extensions_scheduled(extensions, jobs)
+
+    def _build_extensions_scheduled(self, extensions, jobs):
+        compiler = self.compiler
+
+        # Some compilers (e.g. MSVC) are initialized lazily on first use,
+        # which is not thread-safe, so we make sure this happens here.
+        if not getattr(compiler, "initialized", True):
+            compiler.initialize()
+
+        self._scheduler = _JobScheduler(jobs)
+        self._local = threading.local()
+
+        original_compile = compiler.compile
+        original_link = compiler.link_shared_object
+        compiler.compile = functools.partial(self._compile_scheduled, original_compile)
+        compiler.link_shared_object = functools.partial(self._link_scheduled, original_link)
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(extensions)) as executor:
+                futures = [
+                    executor.submit(self._build_extension_scheduled, ext, rank)
+                    for rank, ext in enumerate(extensions)
+                ]
+                for future in futures:
+                    future.result()
+        finally:
+            del compiler.compile
+            del compiler.link_shared_object
+            self._scheduler.shutdown()
+            del self._scheduler
+
+    def _build_extension_scheduled(self, ext, rank):
+        self._local.rank = rank
+        with self._filter_build_errors(ext):
+            self.build_extension(ext)
+
+    def _compile_scheduled(self, compile, sources, *args, **kwargs):
+        # Split up the compilation of an extension into one job per source
+        # file so that sources from all extensions can be compiled
+        # concurrently. Within an extension, the largest sources go first.
+        rank = getattr(self._local, "rank", 0)
+        compile = self._in_current_extension(compile)
+        futures = [
+            self._scheduler.submit(
+                (_COMPILE_PRIORITY, rank, -_get_size([source])), compile, [source], *args, **kwargs
+            )
+            for source in sources
+        ]
+        objects = []
+        for future in futures:
+            objects.extend(future.result())
+        return objects
+
+    def _link_scheduled(self, link, *args, **kwargs):
+        rank = getattr(self._local, "rank", 0)
+        link = self._in_current_extension(link)
+        return self._scheduler.submit((_LINK_PRIORITY, rank), link, *args, **kwargs).result()
+
+    def _in_current_extension(self, func):
+        # Jobs are run in the threads of the scheduler, so the extension being
+        # built needs to be passed on to them for the build trace.
+        trace = self._trace
+        if trace is None:
+            return func
+
+        name = trace.current_extension()
+
+        def wrapper(*args, **kwargs):
+            with trace.extension(name):
+                return func(*args, **kwargs)
+
+        return wrapper
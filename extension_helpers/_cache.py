@@ -0,0 +1,139 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements a small persistent cache which is used to store the
+results of expensive build-time checks (such as compiler probes) so that
+they do not need to be repeated for every extension and every build.
+
+Each entry is stored as an individual JSON file whose name is derived from a
+hash of the entry key. Entries are written atomically, which means that
+several builds running concurrently can safely share the same cache
+directory.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+
+from ._utils import _write_atomic
+
+__all__ = []
+
+log = logging.getLogger(__name__)
+
+# This should be incremented whenever the format of the cached data changes
+CACHE_VERSION = 1
+
+
+def get_cache_dir():
+    """
+    Determine the directory used for the persistent cache.
+
+    The location can be set with the ``EXTENSION_HELPERS_CACHE_DIR``
+    environment variable. Setting this variable to an empty string disables
+    the persistent cache.
+
+    Returns
+    -------
+    cache_dir : str or None
+        The path to the cache directory, or `None` if the persistent cache is
+        disabled.
+    """
+
+    cache_dir = os.environ.get("EXTENSION_HELPERS_CACHE_DIR")
+
+    if cache_dir is not None:
+        return cache_dir or None
+
+    if sys.platform == "win32":
+        base_dir = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base_dir = os.path.expanduser(os.path.join("~", "Library", "Caches"))
+    else:
+        base_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(
+            os.path.join("~", ".cache")
+        )
+
+    return os.path.join(base_dir, "extension-helpers")
+
+
+def hash_key(*parts):
+    """
+    Compute a stable hexadecimal digest for a key made of JSON-serializable
+    parts.
+    """
+    data = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _entry_path(namespace, key):
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+    return os.path.join(cache_dir, f"{namespace}-v{CACHE_VERSION}", key + ".json")
+
+
+def read_cache(namespace, key, default=None):
+    """
+    Read an entry from the persistent cache.
+
+    Parameters
+    ----------
+    namespace : str
+        The name of the group of entries the entry belongs to, e.g.
+        ``'probes'``.
+    key : str
+        The key of the entry, typically computed with :func:`hash_key`.
+    default : object, optional
+        The value to return if the entry does not exist or cannot be read.
+
+    Returns
+    -------
+    value : object
+        The cached value, or ``default``.
+    """
+
+    path = _entry_path(namespace, key)
+
+    if path is None:
+        return default
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["value"]
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        log.debug("Ignoring unreadable cache entry %s: %s", path, exc)
+        return default
+
+
+def write_cache(namespace, key, value):
+    """
+    Write an entry to the persistent cache.
+
+    Failures to write the cache (for instance because the cache directory is
+    read-only) are not considered errors and are silently ignored.
+
+    Parameters
+    ----------
+    namespace : str
+        The name of the group of entries the entry belongs to, e.g.
+        ``'probes'``.
+    key : str
+        The key of the entry, typically computed with :func:`hash_key`.
+    value : object
+        The value to store, which should be JSON-serializable.
+    """
+
+    path = _entry_path(namespace, key)
+
+    if path is None:
+        return
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, json.dumps({"value": value}).encode("utf-8"))
+    except OSError as exc:
+        log.debug("Could not write cache entry %s: %s", path, exc)
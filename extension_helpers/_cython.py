@@ -0,0 +1,452 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements a stage which converts the Cython sources of
+extensions to C/C++ before the extensions are built. Cython is run for
+several modules in parallel, and modules whose sources, ``.pxd``/``.pxi``
+dependencies and directives have not changed since they were last converted
+are skipped.
+"""
+
+import fnmatch
+import hashlib
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from setuptools import Extension
+
+from ._cache import get_cache_dir, hash_key, read_cache, write_cache
+from ._trace import get_resource_usage
+from ._utils import get_extension_helpers_config
+
+__all__ = []
+
+log = logging.getLogger(__name__)
+
+# As for the scanning of #include directives, this does not try to fully
+# parse Cython code - any statement that looks like a cimport or include is
+# taken into account, which can only result in additional dependencies.
+_CIMPORT_RE = re.compile(rb"^[ \t]*cimport[ \t]+([^#\n]+)", re.MULTILINE)
+_FROM_CIMPORT_RE = re.compile(
+    rb"^[ \t]*from[ \t]+(\.*[\w.]*)[ \t]+cimport[ \t]+([^#\n]+)", re.MULTILINE
+)
+_INCLUDE_RE = re.compile(rb"^[ \t]*include[ \t]+[\"']([^\"'\n]+)[\"']", re.MULTILINE)
+
+# The cimports and includes found in each file, keyed by path. Each value is
+# a ((mtime_ns, size), (cimports, includes)) tuple.
+_SCAN_CACHE = {}
+
+# The .pxd file found for each (module name, include path) pair
+_PXD_CACHE = {}
+
+
+def _split_names(names):
+    # Convert e.g. "(a as b, c)" to ["a", "c"]
+    result = []
+    for name in names.decode("utf-8", "replace").strip().strip("()\\").split(","):
+        name = name.split(" as ")[0].strip(" \t()\\")
+        if name:
+            result.append(name)
+    return result
+
+
+def scan_cython_file(filename):
+    """
+    Return the modules cimported and the files included by a Cython file.
+
+    Parameters
+    ----------
+    filename : str
+        The path to a ``.pyx``, ``.pxd`` or ``.pxi`` file.
+
+    Returns
+    -------
+    cimports : list of str
+        The names of the modules which may be cimported. Relative names start
+        with one or more dots. For ``from module cimport name``, both
+        ``module`` and ``module.name`` are included since ``name`` can be a
+        sub-module.
+    includes : list of str
+        The names of the files included with ``include``.
+    """
+
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return [], []
+
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _SCAN_CACHE.get(filename)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    try:
+        with open(filename, "rb") as f:
+            content = f.read()
+    except OSError:
+        return [], []
+
+    cimports = []
+    for names in _CIMPORT_RE.findall(content):
+        cimports.extend(_split_names(names))
+    for module, names in _FROM_CIMPORT_RE.findall(content):
+        module = module.decode("utf-8", "replace")
+        if module.strip("."):
+            cimports.append(module)
+        separator = "" if module.endswith(".") else "."
+        cimports.extend(module + separator + name for name in _split_names(names))
+
+    includes = [name.decode("utf-8", "replace") for name in _INCLUDE_RE.findall(content)]
+
+    _SCAN_CACHE[filename] = (signature, (cimports, includes))
+
+    return cimports, includes
+
+
+def _absolute_module_name(name, package):
+    if not name.startswith("."):
+        return name
+    level = len(name) - len(name.lstrip("."))
+    parts = package.split(".") if package else []
+    if level - 1 > len(parts):
+        return None
+    parts = parts[: len(parts) - (level - 1)]
+    if name[level:]:
+        parts.append(name[level:])
+    return ".".join(parts) or None
+
+
+def _find_pxd(module, include_path):
+    key = (module, include_path)
+    if key not in _PXD_CACHE:
+        parts = module.split(".")
+        _PXD_CACHE[key] = None
+        for directory in include_path:
+            base = os.path.join(directory, *parts)
+            for candidate in (base + ".pxd", os.path.join(base, "__init__.pxd")):
+                if os.path.isfile(candidate):
+                    _PXD_CACHE[key] = os.path.normpath(candidate)
+                    break
+            if _PXD_CACHE[key] is not None:
+                break
+    return _PXD_CACHE[key]
+
+
+def find_cython_dependencies(source, module, include_path=()):
+    """
+    Find the ``.pxd`` and included files which a Cython source depends on,
+    directly or indirectly.
+
+    Parameters
+    ----------
+    source : str
+        The path to the ``.pyx`` file.
+    module : str
+        The full name of the module the ``.pyx`` file is compiled to, which
+        is needed to resolve relative cimports.
+    include_path : iterable of str, optional
+        The directories in which to look for ``.pxd`` and included files.
+
+    Returns
+    -------
+    dependencies : list of str
+        The paths to the dependencies, in the order in which they were found.
+    """
+
+    include_path = tuple(include_path)
+    source = os.path.normpath(source)
+
+    seen = {source}
+    dependencies = []
+    stack = []
+
+    def add(path, module, is_package):
+        if path not in seen:
+            seen.add(path)
+            dependencies.append(path)
+            stack.append((path, module, is_package))
+
+    # A .pxd file next to the .pyx file is always used
+    pxd = os.path.splitext(source)[0] + ".pxd"
+    if os.path.isfile(pxd):
+        add(pxd, module, False)
+
+    stack.insert(0, (source, module, False))
+
+    while stack:
+        filename, module, is_package = stack.pop()
+        package = module if is_package else module.rpartition(".")[0]
+        cimports, includes = scan_cython_file(filename)
+        for name in cimports:
+            absolute = _absolute_module_name(name, package)
+            if absolute is None:
+                continue
+            path = _find_pxd(absolute, include_path)
+            if path is not None:
+                add(path, absolute, os.path.basename(path) == "__init__.pxd")
+        for name in includes:
+            for directory in (os.path.dirname(filename), *include_path):
+                path = os.path.normpath(os.path.join(directory, name))
+                if os.path.isfile(path):
+                    # Included files are part of the module including them
+                    add(path, module, is_package)
+                    break
+
+    return dependencies
+
+
+def get_cython_directives_config(srcdir="."):
+    """
+    Return the Cython directives declared in the
+    ``[tool.extension-helpers.cython-directives]`` section of
+    ``pyproject.toml``.
+
+    The keys of this section are module names, package names or glob-style
+    patterns matched against module names, and the values are tables of
+    Cython directives.
+
+    Returns
+    -------
+    config : list of tuple
+        The ``(pattern, directives)`` pairs, in the order in which they are
+        declared.
+    """
+
+    config = get_extension_helpers_config(srcdir).get("cython-directives", {})
+    if not isinstance(config, dict):
+        raise TypeError("The cython-directives option in pyproject.toml should be a table")
+
+    for pattern, directives in config.items():
+        if not isinstance(directives, dict):
+            raise TypeError(
+                f"The Cython directives for {pattern!r} in pyproject.toml should be a table"
+            )
+
+    return list(config.items())
+
+
+def get_module_directives(config, name):
+    """
+    Return the Cython directives which apply to the module ``name``.
+
+    A pattern applies to a module if it matches its name or the name of one of
+    its parent packages. When several patterns apply, the ones declared later
+    take precedence.
+
+    Parameters
+    ----------
+    config : list of tuple
+        The ``(pattern, directives)`` pairs returned by
+        `get_cython_directives_config`.
+    name : str
+        The full name of the module.
+    """
+
+    parts = name.split(".")
+    packages = [".".join(parts[:index]) for index in range(1, len(parts) + 1)]
+
+    directives = {}
+    for pattern, values in config:
+        if any(fnmatch.fnmatchcase(package, pattern) for package in packages):
+            directives.update(values)
+    return directives
+
+
+def _format_directives(directives):
+    if not directives:
+        return "default directives"
+    return ", ".join(f"{key}={value!r}" for key, value in sorted(directives.items()))
+
+
+def _hash_file(filename):
+    with open(filename, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _run_cython(name, source, options):
+    from Cython.Build import cythonize
+
+    start = time.perf_counter()
+    cpu_start, _ = get_resource_usage()
+
+    extension = Extension(name, [source], language=options["language"])
+    try:
+        cythonize(
+            [extension],
+            force=True,
+            quiet=True,
+            # Cython extends this with lists, so it cannot be a tuple
+            include_path=list(options["include_path"]),
+            compiler_directives=options["directives"],
+        )
+    except Exception as exc:  # noqa: BLE001
+        # Cython exceptions cannot always be transferred from worker
+        # processes, so we convert them to a standard exception here.
+        raise RuntimeError(f"Cython failed to convert {source}: {exc}") from None
+
+    # Return the resources used for the build trace. The peak memory use is
+    # the one of the process, which may include previous conversions.
+    cpu_end, max_rss = get_resource_usage()
+    return {
+        "start": start,
+        "end": time.perf_counter(),
+        "cpu_time": None if cpu_start is None else cpu_end - cpu_start,
+        "max_rss": max_rss,
+        "pid": os.getpid(),
+    }
+
+
+def _is_up_to_date(key, source, output, dependencies):
+    if not os.path.isfile(output):
+        return False
+    if get_cache_dir() is None:
+        # Without the cache, fall back to comparing modification times
+        output_mtime = os.path.getmtime(output)
+        return all(os.path.getmtime(path) <= output_mtime for path in [source, *dependencies])
+    return read_cache("cython", key) == _hash_file(output)
+
+
+def cythonize_extensions(
+    extensions, jobs=1, force=False, directives=None, include_dirs=(), cplus=False, trace=None
+):
+    """
+    Convert the Cython sources of extensions to C/C++ sources.
+
+    The ``.c`` or ``.cpp`` files are generated next to the ``.pyx`` files, as
+    would be done by ``Cython.Build.cythonize``, and replace the ``.pyx``
+    files in the ``sources`` of the extensions. Nothing is done if Cython is
+    not installed.
+
+    Parameters
+    ----------
+    extensions : list of `setuptools.Extension`
+        The extensions to process. Only extensions with exactly one ``.pyx``
+        source file are considered.
+    jobs : int, optional
+        The number of processes to use to run Cython.
+    force : bool, optional
+        If `True`, all modules are converted even if they are up to date.
+    directives : dict, optional
+        Cython compiler directives to use for all extensions, which are
+        combined with the ``cython_directives`` of each extension.
+    include_dirs : iterable of str, optional
+        Additional directories in which to look for ``.pxd`` files.
+    cplus : bool, optional
+        If `True`, C++ sources are generated for all extensions.
+    trace : `~extension_helpers._trace.BuildTrace`, optional
+        If specified, the conversion of each module is recorded in this trace.
+
+    Returns
+    -------
+    converted : list of str
+        The ``.pyx`` files which were converted.
+    """
+
+    try:
+        from Cython import __version__ as cython_version
+    except ImportError:
+        return []
+
+    search_path = [path for path in sys.path if path and os.path.isdir(path)]
+
+    tasks = []
+    up_to_date = 0
+
+    for ext in extensions:
+        pyx_sources = [source for source in ext.sources if source.endswith(".pyx")]
+        if len(pyx_sources) != 1:
+            continue
+        if getattr(ext, "cython_c_in_temp", False) or getattr(ext, "cython_gdb", False):
+            continue
+
+        source = pyx_sources[0]
+
+        # The directory containing the top-level package is always searched
+        # for .pxd files, followed by the include directories and sys.path.
+        root = os.path.dirname(source)
+        for _ in range(ext.name.count(".")):
+            root = os.path.dirname(root)
+        include_path = (
+            root or ".",
+            *ext.include_dirs,
+            *getattr(ext, "cython_include_dirs", ()),
+            *include_dirs,
+        )
+
+        options = {
+            "language": "c++" if cplus or ext.language == "c++" else "c",
+            "include_path": include_path,
+            "directives": {**(directives or {}), **getattr(ext, "cython_directives", {})},
+        }
+
+        output = os.path.splitext(source)[0] + (".cpp" if options["language"] == "c++" else ".c")
+
+        dependencies = find_cython_dependencies(
+            source, ext.name, include_path=include_path + tuple(search_path)
+        )
+        key = hash_key(
+            cython_version,
+            os.path.abspath(source),
+            os.path.abspath(output),
+            options,
+            [(path, _hash_file(path)) for path in [source, *dependencies]],
+        )
+
+        if force or not _is_up_to_date(key, source, output, dependencies):
+            tasks.append((ext.name, source, options, key, output))
+        else:
+            log.debug("%s is up to date (%s)", ext.name, _format_directives(options["directives"]))
+            up_to_date += 1
+
+        ext.sources = [output if path == source else path for path in ext.sources]
+
+    if not tasks:
+        if up_to_date:
+            log.info("all %d Cython modules are up to date", up_to_date)
+        return []
+
+    # As for setup_package.py files, processes are only used if they can be
+    # forked, since other start methods would re-run setup.py in each process.
+    from ._setup_helpers import _get_fork_context
+
+    context = _get_fork_context() if jobs > 1 and len(tasks) > 1 else None
+
+    log.info(
+        "cythonizing %d modules (%d up to date) using %d processes",
+        len(tasks),
+        up_to_date,
+        1 if context is None else min(jobs, len(tasks)),
+    )
+
+    # Report the directives with which each module is converted, since they
+    # can come from the build_ext command, the extension or pyproject.toml.
+    for name, _, options, _, _ in tasks:
+        log.info("cythonizing %s with %s", name, _format_directives(options["directives"]))
+
+    if context is None:
+        results = [_run_cython(name, source, options) for name, source, options, _, _ in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks)), mp_context=context) as pool:
+            futures = [
+                pool.submit(_run_cython, name, source, options)
+                for name, source, options, _, _ in tasks
+            ]
+            results = [future.result() for future in futures]
+
+    if trace is not None:
+        for (name, source, options, _, _), result in zip(tasks, results, strict=True):
+            trace.add_event(
+                os.path.basename(source),
+                "cythonize",
+                extension=name,
+                directives=options["directives"],
+                **result,
+            )
+
+    for _, _, _, key, output in tasks:
+        write_cache("cython", key, _hash_file(output))
+
+    return [source for _, source, _, _, _ in tasks]
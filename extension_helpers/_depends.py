@@ -0,0 +1,148 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements a lightweight scanner for ``#include`` directives in
+C/C++ sources, which is used to automatically fill in the ``depends``
+attribute of extensions so that they are rebuilt when a header changes.
+"""
+
+import os
+import re
+
+from ._source_tree import SOURCE_EXTENSIONS
+
+__all__ = []
+
+# This deliberately does not try to evaluate the preprocessor: includes inside
+# conditional blocks are always considered, which can only result in
+# additional dependencies, and includes using macros are ignored.
+_INCLUDE_RE = re.compile(rb'^[ \t]*#[ \t]*include[ \t]*(?:"([^"\n]+)"|<([^>\n]+)>)', re.MULTILINE)
+
+# The includes found in each file, keyed by path. Each value is a
+# ((mtime_ns, size), includes) tuple, so that files are only scanned again if
+# they have changed.
+_SCAN_CACHE = {}
+
+
+def scan_includes(filename):
+    """
+    Return the files included by ``filename``.
+
+    Parameters
+    ----------
+    filename : str
+        The path to a C/C++ source or header file.
+
+    Returns
+    -------
+    includes : list
+        A list of ``(name, quoted)`` tuples, where ``quoted`` is `True` for
+        ``#include "name"`` and `False` for ``#include <name>``. If the file
+        cannot be read, an empty list is returned.
+    """
+
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return []
+
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _SCAN_CACHE.get(filename)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    try:
+        with open(filename, "rb") as f:
+            content = f.read()
+    except OSError:
+        return []
+
+    includes = []
+    for quoted_name, angle_name in _INCLUDE_RE.findall(content):
+        name = quoted_name or angle_name
+        try:
+            includes.append((name.decode("utf-8").strip(), bool(quoted_name)))
+        except UnicodeDecodeError:
+            continue
+
+    _SCAN_CACHE[filename] = (signature, includes)
+
+    return includes
+
+
+def _resolve_include(name, quoted, including_file, include_dirs):
+    # As for most compilers, quoted includes are first looked up relative to
+    # the including file, and then in the include directories.
+    if quoted:
+        candidates = [os.path.dirname(including_file), *include_dirs]
+    else:
+        candidates = include_dirs
+    for directory in candidates:
+        path = os.path.normpath(os.path.join(directory, name))
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _is_relative_to(path, root):
+    try:
+        return os.path.commonpath([path, root]) == root
+    except ValueError:
+        return False
+
+
+def find_dependencies(sources, include_dirs=(), root="."):
+    """
+    Find the headers which ``sources`` depend on, directly or indirectly.
+
+    Only the headers located in ``root`` are returned (and scanned for
+    further includes), since headers from other locations, such as the
+    system or the Python and Numpy headers, are not expected to change
+    between builds.
+
+    Parameters
+    ----------
+    sources : list of str
+        The source files to scan. Files which are not C/C++ sources (for
+        instance ``.pyx`` files) are ignored.
+    include_dirs : list of str, optional
+        The directories in which to look for included files.
+    root : str, optional
+        The root of the source tree.
+
+    Returns
+    -------
+    depends : list of str
+        The paths to the headers, in the order in which they were found.
+    """
+
+    root = os.path.realpath(root)
+    include_dirs = list(include_dirs)
+
+    stack = [source for source in reversed(sources) if source.endswith(SOURCE_EXTENSIONS)]
+    seen = set(stack)
+    depends = []
+
+    while stack:
+        filename = stack.pop()
+        for name, quoted in scan_includes(filename):
+            path = _resolve_include(name, quoted, filename, include_dirs)
+            if path is None or path in seen:
+                continue
+            seen.add(path)
+            if not _is_relative_to(os.path.realpath(path), root):
+                continue
+            depends.append(path)
+            stack.append(path)
+
+    return depends
+
+
+def add_dependencies(extension, root="."):
+    """
+    Add the headers which the sources of ``extension`` depend on to its
+    ``depends`` attribute.
+    """
+
+    depends = find_dependencies(extension.sources, extension.include_dirs, root=root)
+    existing = {os.path.normpath(path) for path in extension.depends}
+    extension.depends.extend(path for path in depends if path not in existing)
@@ -0,0 +1,170 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements the support for compiler launchers such as ccache
+and sccache, which are placed in front of the compiler command to cache the
+results of compilations across builds.
+"""
+
+import json
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+
+from ._utils import get_extension_helpers_config
+
+__all__ = []
+
+log = logging.getLogger(__name__)
+
+# Launchers detected when the launcher is set to 'auto', in order of preference
+KNOWN_LAUNCHERS = ("ccache", "sccache")
+
+# The compiler commands which are prefixed with the launcher. Linker commands
+# are deliberately left alone since linking cannot be cached - in addition,
+# ``compiler_cxx`` is used as the linker for C++ extensions.
+_COMPILER_EXECUTABLES = ("compiler", "compiler_so", "compiler_so_cxx")
+
+
+def _launcher_name(executable):
+    return os.path.basename(executable).lower().removesuffix(".exe")
+
+
+def get_compiler_launcher(srcdir="."):
+    """
+    Determine the compiler launcher to use, if any.
+
+    The launcher is set with the ``EXTENSION_HELPERS_COMPILER_LAUNCHER``
+    environment variable or, if this is not set, the ``compiler-launcher``
+    option in the ``[tool.extension-helpers]`` section of ``pyproject.toml``.
+    This can be either ``auto``, in which case ccache or sccache are used
+    if they are installed, ``none``, or a command.
+
+    Returns
+    -------
+    launcher : list of str or None
+        The launcher command, or `None` if no launcher should be used.
+    """
+
+    launcher = os.environ.get("EXTENSION_HELPERS_COMPILER_LAUNCHER")
+    if launcher is None:
+        launcher = get_extension_helpers_config(srcdir).get("compiler-launcher")
+
+    if not launcher or launcher.strip().lower() == "none":
+        return None
+
+    if launcher.strip().lower() == "auto":
+        for name in KNOWN_LAUNCHERS:
+            executable = shutil.which(name)
+            if executable:
+                return [executable]
+        log.debug("No compiler launcher found")
+        return None
+
+    return shlex.split(launcher)
+
+
+def apply_compiler_launcher(ccompiler, launcher):
+    """
+    Prefix the compiler commands of ``ccompiler`` with ``launcher``.
+
+    Compilers which do not use commands (such as MSVC) and commands which
+    already start with a known launcher are left unchanged.
+
+    Returns
+    -------
+    applied : bool
+        `True` if the launcher was added to any command.
+    """
+
+    if not launcher:
+        return False
+
+    launcher_names = {*KNOWN_LAUNCHERS, _launcher_name(launcher[0])}
+
+    applied = False
+    for attr in _COMPILER_EXECUTABLES:
+        command = getattr(ccompiler, attr, None)
+        if not isinstance(command, list) or not command:
+            continue
+        if _launcher_name(command[0]) in launcher_names:
+            continue
+        setattr(ccompiler, attr, list(launcher) + command)
+        applied = True
+
+    return applied
+
+
+def get_launcher_stats(launcher):
+    """
+    Return the cache statistics of ``launcher``.
+
+    Returns
+    -------
+    stats : dict or None
+        A dictionary with the number of cache ``hits`` and ``misses``, or
+        `None` if the statistics could not be determined (for instance for
+        launchers other than ccache and sccache).
+    """
+
+    if not launcher:
+        return None
+
+    name = _launcher_name(launcher[0])
+    if name == "ccache":
+        command = [launcher[0], "--print-stats"]
+    elif name == "sccache":
+        command = [launcher[0], "--show-stats", "--stats-format=json"]
+    else:
+        return None
+
+    try:
+        output = subprocess.run(
+            command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True
+        ).stdout.decode("utf-8", errors="replace")
+    except (OSError, subprocess.SubprocessError) as exc:
+        log.debug("Could not get statistics from %s: %s", name, exc)
+        return None
+
+    try:
+        if name == "ccache":
+            return _parse_ccache_stats(output)
+        else:
+            return _parse_sccache_stats(output)
+    except (ValueError, KeyError, TypeError, AttributeError) as exc:
+        log.debug("Could not parse statistics from %s: %s", name, exc)
+        return None
+
+
+def _parse_ccache_stats(output):
+    values = {}
+    for line in output.splitlines():
+        key, _, value = line.partition("\t")
+        if value.strip().isdigit():
+            values[key.strip()] = int(value)
+    return {
+        "hits": values.get("direct_cache_hit", 0) + values.get("preprocessed_cache_hit", 0),
+        "misses": values.get("cache_miss", 0),
+    }
+
+
+def _parse_sccache_stats(output):
+    stats = json.loads(output)["stats"]
+    return {
+        "hits": sum(stats["cache_hits"]["counts"].values()),
+        "misses": sum(stats["cache_misses"]["counts"].values()),
+    }
+
+
+def format_stats_difference(launcher, before, after):
+    """
+    Return a summary of the cache statistics of a build, given the statistics
+    of the launcher before and after the build.
+    """
+
+    hits = after["hits"] - before["hits"]
+    misses = after["misses"] - before["misses"]
+    total = hits + misses
+    rate = f" ({100 * hits / total:.0f}% hit rate)" if total else ""
+    return f"{_launcher_name(launcher[0])}: {hits} cache hits, {misses} cache misses{rate}"
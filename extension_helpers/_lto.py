@@ -0,0 +1,122 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements the selection of the flags for link-time
+optimization (LTO), which lets the compiler optimize across the source files
+of an extension when it is linked.
+"""
+
+import logging
+import os
+
+from ._probes import Probe, run_probes
+from ._utils import get_extension_helpers_config
+
+__all__ = []
+
+log = logging.getLogger(__name__)
+
+LTO_MODES = ("full", "thin")
+
+# The code used to check that the compiler and linker support LTO
+_LTO_CODE = """
+static int add_one(int x) {
+  return x + 1;
+}
+
+int main(void) {
+  return add_one(-1);
+}
+"""
+
+
+def get_lto_mode(srcdir="."):
+    """
+    Determine which kind of link-time optimization to use, if any.
+
+    The mode is set with the ``EXTENSION_HELPERS_LTO`` environment variable
+    or, if this is not set, the ``lto`` option in the
+    ``[tool.extension-helpers]`` section of ``pyproject.toml``. This can be
+    ``full``, ``thin`` or ``none`` - boolean values are also accepted, with
+    true values meaning ``full``.
+
+    Returns
+    -------
+    mode : {'full', 'thin'} or None
+        The LTO mode, or `None` if LTO is disabled.
+    """
+
+    mode = os.environ.get("EXTENSION_HELPERS_LTO", "").strip()
+    if not mode:
+        mode = get_extension_helpers_config(srcdir).get("lto", "")
+
+    mode = str(mode).strip().lower()
+
+    if mode in ("", "none", "0", "false", "no", "off"):
+        return None
+    if mode in ("1", "true", "yes", "on"):
+        return "full"
+    if mode not in LTO_MODES:
+        raise ValueError(f"The LTO mode should be one of 'full', 'thin' or 'none', got {mode!r}")
+
+    return mode
+
+
+def get_lto_flags(compiler_type, family, mode, jobs=None):
+    """
+    Return the compiler and linker flags for link-time optimization.
+
+    Parameters
+    ----------
+    compiler_type : str
+        The type of the compiler, e.g. ``'unix'`` or ``'msvc'``.
+    family : {'gcc', 'clang'} or None
+        The compiler family for Unix-style compilers, as returned by
+        `~extension_helpers._pgo.get_compiler_family`.
+    mode : {'full', 'thin'}
+        The LTO mode. Thin LTO is only supported by clang, and full LTO is
+        used instead with other compilers.
+    jobs : int, optional
+        The maximum number of parallel jobs to use when optimizing at link
+        time. If not specified, the default of the compiler is used.
+
+    Returns
+    -------
+    flags : tuple of list of str, or None
+        The compiler and linker flags, or `None` if LTO is not supported
+        with this compiler.
+    """
+
+    if compiler_type == "msvc":
+        link_flags = ["/LTCG"]
+        if jobs:
+            # The linker uses at most 8 code generation threads
+            link_flags.append(f"/CGTHREADS:{min(jobs, 8)}")
+        return ["/GL"], link_flags
+
+    if family == "clang":
+        flag = "-flto=thin" if mode == "thin" else "-flto"
+        link_flags = [flag]
+        if jobs and mode == "thin":
+            link_flags.append(f"-flto-jobs={jobs}")
+        return [flag], link_flags
+
+    if family == "gcc":
+        return ["-flto"], [f"-flto={jobs}" if jobs else "-flto"]
+
+    return None
+
+
+def check_lto_support(compile_flags, link_flags):
+    """
+    Check whether a program can be compiled and linked with the given LTO
+    flags.
+    """
+
+    probe = Probe(
+        _LTO_CODE,
+        description="link-time optimization",
+        extra_compile_args=compile_flags,
+        extra_link_args=link_flags,
+        link=True,
+    )
+    return run_probes([probe])[0].success
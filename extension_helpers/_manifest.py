@@ -0,0 +1,211 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements the discovery manifest, which stores the list of
+extensions found by :func:`~extension_helpers.get_extensions` on disk so that
+it can be reused as long as nothing relevant in the source tree has changed.
+"""
+
+import hashlib
+import importlib.util
+import logging
+import os
+import sys
+
+from setuptools import Extension
+from setuptools.command.build_ext import Library
+
+from ._cache import hash_key, read_cache, write_cache
+
+__all__ = []
+
+log = logging.getLogger(__name__)
+
+# Environment variables which commonly influence the extensions defined in
+# setup_package.py files. In addition, any variable starting with
+# EXTENSION_HELPERS_ is taken into account.
+_ENVIRONMENT_VARIABLES = (
+    "CC",
+    "CXX",
+    "CFLAGS",
+    "CPPFLAGS",
+    "CXXFLAGS",
+    "LDFLAGS",
+    "PKG_CONFIG_PATH",
+    "PKG_CONFIG_LIBDIR",
+)
+
+
+def _hash_file(filename):
+    with open(filename, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_tree_fingerprint(index):
+    """
+    Compute a fingerprint of the parts of a source tree which are relevant to
+    the discovery of extensions.
+
+    The fingerprint includes the names of all packages (so that adding or
+    removing packages is detected) as well as the names and content hashes
+    of their ``setup_package.py`` and ``.pyx`` files. Other files, including
+    those generated during discovery such as the dispatch modules of SIMD
+    variants, are not taken into account.
+
+    Parameters
+    ----------
+    index : `~extension_helpers._source_tree.SourceTreeIndex`
+        The index of the source tree.
+    """
+
+    fingerprint = []
+
+    for package in index.packages:
+        filenames = list(index.pyx_files.get(package, []))
+        if package in index.setup_packages:
+            filenames.append(index.setup_packages[package])
+        hashes = {os.path.basename(fn): _hash_file(fn) for fn in filenames}
+        fingerprint.append((package, hashes))
+
+    return fingerprint
+
+
+def _get_environment_fingerprint():
+    from .version import version
+
+    numpy_spec = importlib.util.find_spec("numpy")
+
+    return {
+        "extension_helpers": version,
+        "python": sys.version,
+        "executable": sys.executable,
+        "platform": sys.platform,
+        "numpy": numpy_spec.origin if numpy_spec else None,
+        "environ": {
+            name: value
+            for name, value in sorted(os.environ.items())
+            if name in _ENVIRONMENT_VARIABLES
+            or (name.startswith("EXTENSION_HELPERS_") and name != "EXTENSION_HELPERS_CACHE_DIR")
+        },
+    }
+
+
+def _encode(value):
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    elif isinstance(value, list):
+        return [_encode(item) for item in value]
+    elif isinstance(value, tuple):
+        return {"tuple": [_encode(item) for item in value]}
+    elif isinstance(value, dict) and all(isinstance(key, str) for key in value):
+        return {"dict": {key: _encode(item) for key, item in value.items()}}
+    else:
+        raise TypeError(f"Cannot serialize value of type {type(value).__name__}")
+
+
+def _decode(value):
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    elif isinstance(value, dict):
+        if "tuple" in value:
+            return tuple(_decode(item) for item in value["tuple"])
+        else:
+            return {key: _decode(item) for key, item in value["dict"].items()}
+    else:
+        return value
+
+
+def serialize_extension(extension):
+    """
+    Convert an extension to a JSON-serializable dictionary.
+
+    Only instances of `setuptools.Extension` and the setuptools ``Library``
+    class whose attributes are plain Python objects (strings, numbers,
+    lists, tuples and dictionaries of these) can be serialized - a
+    `TypeError` is raised for any other extension.
+    """
+
+    if type(extension) not in (Extension, Library):
+        raise TypeError(f"Cannot serialize extension of type {type(extension).__name__}")
+
+    return {
+        "library": type(extension) is Library,
+        "attributes": _encode(vars(extension)),
+    }
+
+
+def deserialize_extension(data):
+    """
+    Re-create an extension from the output of :func:`serialize_extension`.
+    """
+
+    cls = Library if data["library"] else Extension
+    extension = cls.__new__(cls)
+    extension.__dict__.update(_decode(data["attributes"]))
+    return extension
+
+
+def _get_config_fingerprint(srcdir):
+    # The configuration in pyproject.toml, such as the Cython directives, is
+    # used when discovering extensions
+    filename = os.path.join(srcdir, "pyproject.toml")
+    return _hash_file(filename) if os.path.isfile(filename) else None
+
+
+def _get_manifest_key(index):
+    return hash_key(
+        os.path.abspath(index.srcdir),
+        get_tree_fingerprint(index),
+        _get_config_fingerprint(index.srcdir),
+        _get_environment_fingerprint(),
+    )
+
+
+def read_manifest(index):
+    """
+    Return the packages and extensions previously discovered in a source
+    tree, or `None` if the source tree has changed since.
+
+    Parameters
+    ----------
+    index : `~extension_helpers._source_tree.SourceTreeIndex`
+        The index of the source tree.
+
+    Returns
+    -------
+    result : tuple
+        A ``(key, packages, ext_modules)`` tuple, where ``packages`` and
+        ``ext_modules`` are `None` if no valid manifest is available. The
+        ``key`` should be passed to :func:`write_manifest`.
+    """
+
+    key = _get_manifest_key(index)
+    manifest = read_cache("discovery", key)
+
+    if manifest is None:
+        return key, None, None
+
+    try:
+        ext_modules = [deserialize_extension(data) for data in manifest["extensions"]]
+    except (KeyError, TypeError) as exc:
+        log.debug("Ignoring invalid discovery manifest: %s", exc)
+        return key, None, None
+
+    log.info("Reusing previously discovered extensions (source tree unchanged)")
+
+    return key, manifest["packages"], ext_modules
+
+
+def write_manifest(key, packages, ext_modules):
+    """
+    Store the packages and extensions discovered in a source tree.
+
+    If any of the extensions cannot be serialized, no manifest is written.
+    """
+
+    try:
+        extensions = [serialize_extension(ext) for ext in ext_modules]
+    except TypeError as exc:
+        log.debug("Not writing discovery manifest: %s", exc)
+        return
+
+    write_cache("discovery", key, {"packages": list(packages), "extensions": extensions})
@@ -0,0 +1,462 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements a local cache of compiled object files, which can be
+used instead of a compiler launcher such as ccache when none is installed.
+
+Object files are stored in the extension-helpers cache directory under a key
+derived from the preprocessed source, the identity of the compiler and the
+compiler arguments. When the cache grows beyond its maximum size, the least
+recently used object files are removed.
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+
+from ._cache import CACHE_VERSION, get_cache_dir, hash_key
+from ._launcher import KNOWN_LAUNCHERS, _launcher_name
+from ._probes import _get_compiler_version
+from ._utils import (
+    _write_atomic,
+    get_compiler_runner,
+    get_env_flag,
+    get_extension_helpers_config,
+)
+
+__all__ = []
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 5 * 1024**3
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+# Compilations whose output depends on files other than the source and the
+# headers it includes, or which write other files, are not cached.
+_UNCACHEABLE_PREFIXES = (
+    "-fprofile-use",
+    "-fauto-profile",
+    "-M",
+    "--coverage",
+    "-save-temps",
+    "-include-pch",
+)
+
+# When the cache is larger than its maximum size, least recently used object
+# files are removed until it is smaller than this fraction of the maximum, so
+# that this is not needed again after every build.
+_EVICTION_TARGET = 0.9
+
+_STATS_FILE = "stats.json"
+_LOCK_FILE = "lock"
+
+
+def parse_size(size):
+    """
+    Convert a size such as ``500M`` or ``2G`` (or a number of bytes) to a
+    number of bytes.
+    """
+
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", str(size), re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid size {size!r}, should be e.g. 500M or 2G")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def get_object_cache_options(srcdir="."):
+    """
+    Determine whether the object cache is enabled and its maximum size.
+
+    The cache is enabled by setting the ``EXTENSION_HELPERS_OBJECT_CACHE``
+    environment variable to ``1`` or the ``object-cache`` option in the
+    ``[tool.extension-helpers]`` section of ``pyproject.toml`` to ``true``. The
+    maximum size is set with the ``EXTENSION_HELPERS_OBJECT_CACHE_SIZE``
+    environment variable or the ``object-cache-size`` option, and defaults to
+    5 GB.
+
+    Returns
+    -------
+    enabled : bool
+    max_size : int
+        The maximum size of the cache in bytes.
+    """
+
+    config = get_extension_helpers_config(srcdir)
+
+    if "EXTENSION_HELPERS_OBJECT_CACHE" in os.environ:
+        enabled = get_env_flag("EXTENSION_HELPERS_OBJECT_CACHE")
+    else:
+        enabled = bool(config.get("object-cache", False))
+
+    max_size = os.environ.get("EXTENSION_HELPERS_OBJECT_CACHE_SIZE", "").strip()
+    if not max_size:
+        max_size = config.get("object-cache-size", DEFAULT_MAX_SIZE)
+
+    return enabled, parse_size(max_size)
+
+
+def get_object_cache_dir():
+    """
+    Return the directory in which object files are cached, or `None` if the
+    persistent cache is disabled.
+    """
+
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+    return os.path.join(cache_dir, f"objects-v{CACHE_VERSION}")
+
+
+@contextlib.contextmanager
+def _locked(directory):
+    # Lock the cache directory against other processes, so that they do not
+    # evict objects or update the statistics at the same time.
+    with open(os.path.join(directory, _LOCK_FILE), "a+b") as f:
+        if sys.platform == "win32":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _read_stats(directory):
+    try:
+        with open(os.path.join(directory, _STATS_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _iter_entries(directory):
+    # Yield the path, size and last use time of the cached object files
+    try:
+        subdirs = list(os.scandir(directory))
+    except OSError:
+        return
+    for subdir in subdirs:
+        if not subdir.is_dir():
+            continue
+        for entry in os.scandir(subdir.path):
+            # Temporary files being written start with a dot
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            yield entry.path, stat.st_size, stat.st_mtime
+
+
+class _Captured(Exception):
+    def __init__(self, command):
+        super().__init__(command)
+        self.command = command
+
+
+class ObjectCache:
+    """
+    A cache of compiled object files shared between builds.
+
+    Parameters
+    ----------
+    directory : str
+        The directory in which object files are cached.
+    max_size : int
+        The maximum total size of the cached object files, in bytes.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def apply(self, ccompiler):
+        """
+        Look up the object files compiled by ``ccompiler`` in the cache
+        before compiling them, and store them in the cache afterwards.
+
+        Only compilers which compile each source with a separate command
+        (i.e. not MSVC) are supported.
+
+        Returns
+        -------
+        applied : bool
+            `True` if the cache is used for ``ccompiler``.
+        """
+
+        if ccompiler.compiler_type == "msvc" or not hasattr(ccompiler, "_compile"):
+            return False
+
+        original_compile = ccompiler._compile
+        runner = get_compiler_runner(ccompiler)
+        original_run = getattr(ccompiler, runner)
+        local = self._local
+
+        def run(cmd, **kwargs):
+            if getattr(local, "capturing", False):
+                raise _Captured(cmd)
+            return original_run(cmd, **kwargs)
+
+        def _compile(obj, src, ext, cc_args, extra_postargs, pp_opts):
+            args = (obj, src, ext, cc_args, extra_postargs, pp_opts)
+
+            # The compiler class builds the command, which we capture rather
+            # than run in order to compute the key.
+            local.capturing = True
+            try:
+                original_compile(*args)
+            except _Captured as exc:
+                command = exc.command
+            else:
+                return
+            finally:
+                local.capturing = False
+
+            key = self.get_key(command, obj)
+            if key is not None and self.fetch(key, obj):
+                with self._lock:
+                    self.hits += 1
+                return
+
+            original_compile(*args)
+
+            with self._lock:
+                self.misses += 1
+            if key is not None:
+                self.store(key, obj)
+
+        setattr(ccompiler, runner, run)
+        ccompiler._compile = _compile
+
+        return True
+
+    def get_key(self, command, obj):
+        """
+        Return the key of the object file ``obj`` compiled by ``command``, or
+        `None` if the compilation cannot be cached.
+        """
+
+        if any(arg.startswith(_UNCACHEABLE_PREFIXES) for arg in command):
+            return None
+
+        command = [arg for arg in command if _launcher_name(arg) not in KNOWN_LAUNCHERS]
+
+        # The command without the output, which is not relevant
+        args = []
+        skip = False
+        for arg in command:
+            if skip:
+                skip = False
+            elif arg == "-o":
+                skip = True
+            else:
+                args.append(arg)
+
+        preprocessed = self._preprocess([arg for arg in args if arg != "-c"] + ["-E"])
+        if preprocessed is None:
+            return None
+
+        return hash_key(
+            "object",
+            _get_compiler_version(command[0]),
+            args,
+            hashlib.sha256(preprocessed).hexdigest(),
+        )
+
+    @staticmethod
+    def _preprocess(command):
+        env = None
+        if sys.platform == "darwin":
+            from distutils.util import MACOSX_VERSION_VAR, get_macosx_target_ver
+
+            target = get_macosx_target_ver()
+            if target:
+                env = {**os.environ, MACOSX_VERSION_VAR: target}
+
+        try:
+            process = subprocess.run(
+                command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False
+            )
+        except OSError:
+            return None
+
+        # Errors are reported when actually compiling
+        return process.stdout if process.returncode == 0 else None
+
+    def _entry_path(self, key, obj):
+        return os.path.join(self.directory, key[:2], key + os.path.splitext(obj)[1])
+
+    def fetch(self, key, obj):
+        """
+        Copy the cached object file with the given key to ``obj``.
+
+        Returns
+        -------
+        found : bool
+        """
+
+        path = self._entry_path(key, obj)
+        try:
+            shutil.copyfile(path, obj)
+            # The modification time is used to find the least recently used
+            # object files.
+            os.utime(path)
+        except OSError:
+            return False
+
+        log.debug("object cache hit for %s", obj)
+        return True
+
+    def store(self, key, obj):
+        """
+        Store the object file ``obj`` in the cache under the given key.
+        """
+
+        path = self._entry_path(key, obj)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(obj, "rb") as f:
+                _write_atomic(path, f.read())
+        except OSError as exc:
+            log.debug("Could not store %s in the object cache: %s", obj, exc)
+
+    def close(self):
+        """
+        Record the statistics of the build and remove the least recently used
+        object files if the cache is larger than its maximum size.
+        """
+
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with _locked(self.directory):
+                stats = _read_stats(self.directory)
+                stats["hits"] = stats.get("hits", 0) + self.hits
+                stats["misses"] = stats.get("misses", 0) + self.misses
+                stats["evictions"] = stats.get("evictions", 0) + self._evict()
+                _write_atomic(
+                    os.path.join(self.directory, _STATS_FILE), json.dumps(stats).encode("utf-8")
+                )
+        except OSError as exc:
+            log.debug("Could not update the object cache: %s", exc)
+
+    def _evict(self):
+        entries = list(_iter_entries(self.directory))
+        size = sum(entry_size for _, entry_size, _ in entries)
+        if size <= self.max_size:
+            return 0
+
+        evicted = 0
+        for path, entry_size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if size <= self.max_size * _EVICTION_TARGET:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            evicted += 1
+
+        log.debug("evicted %d object files from the object cache", evicted)
+        return evicted
+
+    def format_summary(self):
+        """
+        Return a summary of the cache hits and misses of the build.
+        """
+
+        total = self.hits + self.misses
+        rate = f" ({100 * self.hits / total:.0f}% hit rate)" if total else ""
+        return f"object cache: {self.hits} cache hits, {self.misses} cache misses{rate}"
+
+
+def get_object_cache(srcdir="."):
+    """
+    Return the object cache to use, or `None` if it is disabled.
+    """
+
+    enabled, max_size = get_object_cache_options(srcdir)
+    if not enabled:
+        return None
+
+    directory = get_object_cache_dir()
+    if directory is None:
+        log.warning("the object cache cannot be used since EXTENSION_HELPERS_CACHE_DIR is empty")
+        return None
+
+    return ObjectCache(directory, max_size)
+
+
+def get_object_cache_stats(srcdir="."):
+    """
+    Return the statistics of the object cache as a dictionary.
+    """
+
+    directory = get_object_cache_dir()
+    _, max_size = get_object_cache_options(srcdir)
+
+    stats = {
+        "directory": directory,
+        "max_size": max_size,
+        "objects": 0,
+        "size": 0,
+        "hits": 0,
+        "misses": 0,
+        "evictions": 0,
+    }
+
+    if directory is None:
+        return stats
+
+    for _, size, _ in _iter_entries(directory):
+        stats["objects"] += 1
+        stats["size"] += size
+    stats.update(_read_stats(directory))
+
+    return stats
+
+
+def format_object_cache_stats(stats):
+    """
+    Format the statistics returned by `get_object_cache_stats` for display.
+    """
+
+    if stats["directory"] is None:
+        return "The extension-helpers cache is disabled"
+
+    total = stats["hits"] + stats["misses"]
+    rate = f"{100 * stats['hits'] / total:.1f}%" if total else "n/a"
+    mb = 1024**2
+
+    lines = [
+        ("cache directory", stats["directory"]),
+        ("object files", stats["objects"]),
+        ("cache size", f"{stats['size'] / mb:.1f} MB / {stats['max_size'] / mb:.1f} MB"),
+        ("hits", stats["hits"]),
+        ("misses", stats["misses"]),
+        ("hit rate", rate),
+        ("evicted object files", stats["evictions"]),
+    ]
+    return "\n".join(f"{name:<22}{value}" for name, value in lines)
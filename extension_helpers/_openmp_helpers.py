@@ -13,22 +13,15 @@
 
 __doctest_skip__ = ["_get_flag_value_from_var"]
 
-import datetime
-import glob
 import logging
 import os
-import subprocess
 import sys
-import tempfile
-import time
 
-from setuptools.command.build_ext import (
-    customize_compiler,
-    get_config_var,
-    new_compiler,
-)
+from setuptools.command.build_ext import get_config_var
 
+from ._probes import Probe, compiles, run_probes
 from ._setup_helpers import get_compiler
+from ._utils import write_if_different
 
 __all__ = ["add_openmp_flags_if_available"]
 
@@ -43,16 +36,24 @@ except NameError:
 
 log = logging.getLogger(__name__)
 
+# The test program also reports whether the compiler is the Intel oneAPI
+# compiler, so that a single program is needed to determine both the flags
+# to use and whether they work.
 CCODE = """
 #include <omp.h>
 #include <stdio.h>
 int main(void) {
+#ifdef __INTEL_LLVM_COMPILER
+  printf("compiler=icx\\n");
+#endif
   #pragma omp parallel
   printf("nthreads=%d\\n", omp_get_num_threads());
   return 0;
 }
 """
 
+_ICX_MARKER = "compiler=icx"
+
 
 CCODE_ICX = """
 #ifndef __INTEL_LLVM_COMPILER
@@ -116,42 +117,42 @@ def _get_flag_value_from_var(flag, var, delim=" "):
                 return item[flag_length:]
 
 
-def _check_if_compiler_is_icx():
+def _openmp_probe(compile_flags, link_flags):
+    return Probe(
+        CCODE,
+        description="OpenMP support",
+        extra_compile_args=compile_flags,
+        extra_link_args=link_flags,
+        run=True,
+    )
+
+
+def _check_if_compiler_is_icx(compile_flags=(), link_flags=()):
     """
     Check whether the compiler is the Intel oneAPI compiler.
 
+    This builds and runs the OpenMP test program with ``-fopenmp``, which
+    reports whether the compiler is icx. For other compilers, the result of
+    `check_openmp_support` is then already known. A separate check is only
+    done if the test program cannot be built.
+
+    Parameters
+    ----------
+    compile_flags, link_flags : list of str, optional
+        Additional flags to use when building the test program.
+
     Returns
     -------
     result : bool
         `True` if the test passed, `False` otherwise.
     """
 
-    ccompiler = new_compiler()
-    customize_compiler(ccompiler)
-
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        start_dir = os.path.abspath(".")
-
-        try:
-            os.chdir(tmp_dir)
-
-            # Write test program
-            with open("test_icx.c", "w") as f:
-                f.write(CCODE_ICX)
-
-            os.mkdir("objects")
-
-            # Compile program
-            ccompiler.compile(["test_icx.c"], output_dir="objects")
-        except Exception:  # noqa: BLE001
-            is_icx = False
-        else:
-            is_icx = True
-
-        finally:
-            os.chdir(start_dir)
+    probe = _openmp_probe([*compile_flags, "-fopenmp"], [*link_flags, "-fopenmp"])
+    result = run_probes([probe])[0]
+    if result.success:
+        return _ICX_MARKER in result.output.splitlines()
 
-    return is_icx
+    return compiles(CCODE_ICX, description="Intel oneAPI compiler")
 
 
 def get_openmp_flags():
@@ -166,7 +167,10 @@ def get_openmp_flags():
     Notes
     -----
     The flags returned are not tested for validity, use
-    `check_openmp_support(openmp_flags=get_openmp_flags())` to do so.
+    `check_openmp_support(openmp_flags=get_openmp_flags())` to do so. The
+    test program built to determine the flags is the one used by
+    `check_openmp_support`, so with compilers other than the Intel oneAPI
+    compiler the result of this check is already cached.
     """
 
     compile_flags = []
@@ -184,7 +188,7 @@ def get_openmp_flags():
             link_flags.append("-L" + lib_path)
             link_flags.append("-Wl,-rpath," + lib_path)
 
-        if _check_if_compiler_is_icx():
+        if _check_if_compiler_is_icx(compile_flags, link_flags):
             openmp_flags = "-qopenmp"
         else:
             openmp_flags = "-fopenmp"
@@ -214,9 +218,6 @@ def check_openmp_support(openmp_flags=None):
         `True` if the test passed, `False` otherwise.
     """
 
-    ccompiler = new_compiler()
-    customize_compiler(ccompiler)
-
     if not openmp_flags:
         # customize_compiler() extracts info from os.environ. If certain keys
         # exist it uses these plus those from sysconfig.get_config_vars().
@@ -230,49 +231,26 @@ def check_openmp_support(openmp_flags=None):
     compile_flags = openmp_flags.get("compiler_flags")
     link_flags = openmp_flags.get("linker_flags")
 
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        start_dir = os.path.abspath(".")
-
-        try:
-            os.chdir(tmp_dir)
-
-            # Write test program
-            with open("test_openmp.c", "w") as f:
-                f.write(CCODE)
-
-            os.mkdir("objects")
-
-            # Compile, test program
-            ccompiler.compile(["test_openmp.c"], output_dir="objects", extra_postargs=compile_flags)
+    result = run_probes([_openmp_probe(compile_flags, link_flags)])[0]
 
-            # Link test program
-            objects = glob.glob(os.path.join("objects", "*" + ccompiler.obj_extension))
-            ccompiler.link_executable(objects, "test_openmp", extra_postargs=link_flags)
+    return result.success and _check_openmp_output(result.output)
 
-            # Run test program
-            output = subprocess.check_output("./test_openmp")
-            output = output.decode(sys.stdout.encoding or "utf-8").splitlines()
 
-            if "nthreads=" in output[0]:
-                nthreads = int(output[0].strip().split("=")[1])
-                if len(output) == nthreads:
-                    is_openmp_supported = True
-                else:
-                    log.warning(
-                        "Unexpected number of lines from output of test OpenMP "
-                        "program (output was {})".format(output)
-                    )
-                    is_openmp_supported = False
-            else:
-                log.warning("Unexpected output from test OpenMP program (output was %s)", output)
-                is_openmp_supported = False
-        except Exception:  # noqa: BLE001
-            is_openmp_supported = False
+def _check_openmp_output(output):
+    output = [line for line in output.splitlines() if line != _ICX_MARKER]
 
-        finally:
-            os.chdir(start_dir)
+    if output and "nthreads=" in output[0]:
+        nthreads = int(output[0].strip().split("=")[1])
+        if len(output) == nthreads:
+            return True
+        log.warning(
+            "Unexpected number of lines from output of test OpenMP "
+            "program (output was {})".format(output)
+        )
+    else:
+        log.warning("Unexpected output from test OpenMP program (output was %s)", output)
 
-    return is_openmp_supported
+    return False
 
 
 def is_openmp_supported():
@@ -316,7 +294,7 @@ def add_openmp_flags_if_available(extension):
 
 
 _IS_OPENMP_ENABLED_SRC = """
-# Autogenerated by {packagename}'s setup.py on {timestamp!s}
+# Autogenerated by {packagename}'s setup.py
 
 def is_openmp_enabled():
     \"\"\"
@@ -331,13 +309,10 @@ def generate_openmp_enabled_py(packagename, srcdir=".", disable_openmp=None):
     Generate ``package.openmp_enabled.is_openmp_enabled``, which can then be used
     to determine, post build, whether the package was built with or without
     OpenMP support.
-    """
 
-    epoch = int(os.environ.get("SOURCE_DATE_EPOCH", time.time()))
-    if sys.version_info >= (3, 11):
-        timestamp = datetime.datetime.fromtimestamp(epoch, datetime.UTC)
-    else:
-        timestamp = datetime.datetime.utcfromtimestamp(epoch)  # noqa: DTZ004
+    The file is only written if its content changes, so that it does not
+    appear modified after every build.
+    """
 
     if disable_openmp is not None:
         import builtins
@@ -349,11 +324,8 @@ def generate_openmp_enabled_py(packagename, srcdir=".", disable_openmp=None):
     else:
         openmp_support = is_openmp_supported()
 
-    src = _IS_OPENMP_ENABLED_SRC.format(
-        packagename=packagename, timestamp=timestamp, return_bool=openmp_support
-    )
+    src = _IS_OPENMP_ENABLED_SRC.format(packagename=packagename, return_bool=openmp_support)
 
     package_srcdir = os.path.join(srcdir, *packagename.split("."))
     is_openmp_enabled_py = os.path.join(package_srcdir, "openmp_enabled.py")
-    with open(is_openmp_enabled_py, "w") as f:
-        f.write(src)
+    write_if_different(is_openmp_enabled_py, src.encode("utf-8"))
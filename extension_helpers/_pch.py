@@ -0,0 +1,254 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements precompiled headers: the headers listed in
+``pyproject.toml`` are compiled once for each combination of compiler options
+used by the extensions including them, and the result is used when compiling
+the sources of these extensions instead of parsing the headers again.
+"""
+
+import fnmatch
+import logging
+import os
+import re
+import threading
+from concurrent.futures import Future
+
+from ._cache import hash_key
+from ._shared import is_outdated
+from ._utils import (
+    get_compiler_runner,
+    get_env_flag,
+    get_extension_helpers_config,
+    write_if_different,
+)
+
+__all__ = []
+
+log = logging.getLogger(__name__)
+
+# The languages for which headers can be precompiled, with the corresponding
+# values of the -x option
+PCH_LANGUAGES = {"c": "c-header", "c++": "c++-header"}
+
+# The extension of the precompiled header for each compiler family. GCC looks
+# for the .gch file next to the header given with -include, while clang is
+# given the precompiled header explicitly.
+_PCH_SUFFIXES = {"gcc": ".gch", "clang": ".pch"}
+
+_DEPENDENCY_SEPARATOR_RE = re.compile(r"(?<!\\)\s+")
+
+
+def get_precompiled_headers_config(srcdir="."):
+    """
+    Return the headers to precompile for each extension.
+
+    The headers are set with the ``precompiled-headers`` option in the
+    ``[tool.extension-helpers]`` section of ``pyproject.toml``, which can be
+    a list of headers to use for all extensions, or a table whose keys are
+    glob-style patterns matched against the names of extensions and whose
+    values are lists of headers. Precompiled headers can be disabled by
+    setting the ``EXTENSION_HELPERS_PRECOMPILED_HEADERS`` environment
+    variable to ``0``.
+
+    Returns
+    -------
+    config : list of tuple
+        The ``(pattern, headers)`` pairs, in the order in which they are
+        declared.
+    """
+
+    if not get_env_flag("EXTENSION_HELPERS_PRECOMPILED_HEADERS", default=True):
+        return []
+
+    config = get_extension_helpers_config(srcdir).get("precompiled-headers", [])
+    if isinstance(config, list):
+        config = {"*": config} if config else {}
+    elif not isinstance(config, dict):
+        raise TypeError(
+            "The precompiled-headers option in pyproject.toml should be a list or a table"
+        )
+
+    for pattern, headers in config.items():
+        if not isinstance(headers, list) or not all(isinstance(h, str) for h in headers):
+            raise TypeError(
+                f"The precompiled headers for {pattern!r} in pyproject.toml should be "
+                "a list of strings"
+            )
+
+    return list(config.items())
+
+
+def get_extension_headers(config, ext):
+    """
+    Return the headers to precompile for the extension ``ext``.
+
+    The ``precompiled_headers`` attribute of the extension is used if set,
+    otherwise the headers of the last pattern in ``config`` which matches
+    the name of the extension.
+    """
+
+    headers = getattr(ext, "precompiled_headers", None)
+    if headers is not None:
+        return list(headers)
+
+    headers = []
+    for pattern, values in config:
+        if fnmatch.fnmatchcase(ext.name, pattern):
+            headers = values
+    return list(headers)
+
+
+def get_pch_language(ccompiler, sources):
+    """
+    Return the language of ``sources`` if they are all C or all C++ sources,
+    and `None` otherwise, since a precompiled header can only be used for
+    one language.
+    """
+
+    languages = {ccompiler.language_map.get(os.path.splitext(source)[1]) for source in sources}
+    if len(languages) != 1:
+        return None
+    (language,) = languages
+    return language if language in PCH_LANGUAGES else None
+
+
+def read_dependency_file(filename):
+    """
+    Return the files listed in a dependency file written by the ``-MD``
+    option of GCC and clang, or `None` if it cannot be read.
+    """
+
+    try:
+        with open(filename, encoding="utf-8", errors="surrogateescape") as f:
+            content = f.read()
+    except OSError:
+        return None
+
+    _, _, dependencies = content.replace("\\\n", " ").partition(": ")
+    return [
+        dependency.replace("\\ ", " ")
+        for dependency in _DEPENDENCY_SEPARATOR_RE.split(dependencies.strip())
+        if dependency
+    ]
+
+
+class PrecompiledHeaders:
+    """
+    Build precompiled headers for the extensions compiled by ``ccompiler``,
+    each in a sub-directory of ``directory``.
+
+    A precompiled header is built for each combination of headers, language
+    and compiler options, the first time an extension using it is built, and
+    is only rebuilt if it is older than any of the files it depends on.
+    Since GCC and clang only use precompiled headers built with compatible
+    options, extensions with different options never share them.
+    """
+
+    def __init__(self, ccompiler, family, directory, config):
+        self.ccompiler = ccompiler
+        self.family = family
+        self.directory = directory
+        self.config = config
+        self.built = 0
+        self._lock = threading.Lock()
+        self._flags = {}
+
+    def get_flags(self, ext, debug=False, force=False):
+        """
+        Return the flags with which to compile the sources of ``ext`` to use
+        its precompiled header, building it if needed.
+
+        An empty list is returned if the extension does not use precompiled
+        headers, or if its header could not be precompiled.
+        """
+
+        headers = get_extension_headers(self.config, ext)
+        if not headers:
+            return []
+
+        language = get_pch_language(self.ccompiler, ext.sources)
+        if language is None:
+            log.info(
+                "not using precompiled headers for %s, which does not only have C or C++ sources",
+                ext.name,
+            )
+            return []
+
+        # The header is compiled with the same options as the sources, as
+        # done by the compile() method of the compiler.
+        macros = [*ext.define_macros, *((undef,) for undef in ext.undef_macros)]
+        _, _, extra_postargs, pp_opts, _ = self.ccompiler._setup_compile(
+            None, macros, ext.include_dirs, [], ext.depends, ext.extra_compile_args or []
+        )
+        cc_args = self.ccompiler._get_cc_args(pp_opts, debug, None)
+
+        executable = self.ccompiler.compiler_so
+        if language == "c++":
+            executable = getattr(self.ccompiler, "compiler_so_cxx", None) or executable
+
+        key = hash_key(self.family, executable, cc_args, extra_postargs, language, headers)
+
+        with self._lock:
+            future = self._flags.get(key)
+            owner = future is None
+            if owner:
+                future = self._flags[key] = Future()
+
+        if owner:
+            flags = []
+            try:
+                flags = self._build(
+                    os.path.join(self.directory, key[:16]),
+                    headers,
+                    [*executable, *cc_args, "-x", PCH_LANGUAGES[language]],
+                    extra_postargs,
+                    force,
+                )
+            finally:
+                future.set_result(flags)
+
+        return future.result()
+
+    def _build(self, directory, headers, command, extra_postargs, force):
+        os.makedirs(directory, exist_ok=True)
+
+        header = os.path.abspath(os.path.join(directory, "pch.h"))
+        output = header + _PCH_SUFFIXES[self.family]
+        dependency_file = os.path.join(directory, "pch.d")
+
+        content = "".join(f"#include <{name}>\n" for name in headers)
+        write_if_different(header, content.encode("utf-8"))
+
+        dependencies = read_dependency_file(dependency_file)
+        if force or dependencies is None or is_outdated(output, [header, *dependencies]):
+            log.info("precompiling %s", ", ".join(headers))
+            run = getattr(self.ccompiler, get_compiler_runner(self.ccompiler))
+            try:
+                run(
+                    [
+                        *command,
+                        header,
+                        "-o",
+                        output,
+                        *extra_postargs,
+                        "-MD",
+                        "-MF",
+                        dependency_file,
+                    ]
+                )
+            except Exception as exc:  # noqa: BLE001
+                log.warning(
+                    "could not precompile %s, compiling without precompiled headers: %s",
+                    ", ".join(headers),
+                    exc,
+                )
+                for filename in (output, dependency_file):
+                    if os.path.exists(filename):
+                        os.remove(filename)
+                return []
+            with self._lock:
+                self.built += 1
+
+        if self.family == "clang":
+            return ["-include-pch", output]
+        return ["-include", header]
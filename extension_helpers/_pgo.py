@@ -0,0 +1,206 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements the steps of profile-guided optimization (PGO)
+builds, in which extensions are first built with instrumentation, then
+exercised by a training command which records profile data, and finally
+rebuilt using the profile data to guide optimization.
+"""
+
+import glob
+import logging
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+
+from setuptools.errors import ExecError
+
+from ._launcher import KNOWN_LAUNCHERS, _launcher_name
+from ._probes import _get_compiler_version
+from ._utils import get_env_flag, get_extension_helpers_config
+
+__all__ = []
+
+log = logging.getLogger(__name__)
+
+
+def get_pgo_command(srcdir="."):
+    """
+    Determine the training command to use for profile-guided optimization.
+
+    Profile-guided optimization is only enabled if the
+    ``EXTENSION_HELPERS_PGO`` environment variable is set to ``1``. The
+    training command is set with the ``EXTENSION_HELPERS_PGO_COMMAND``
+    environment variable or, if this is not set, the ``pgo-command`` option in
+    the ``[tool.extension-helpers]`` section of ``pyproject.toml``. If the
+    command starts with ``python``, the Python interpreter running the build
+    is used.
+
+    Returns
+    -------
+    command : list of str or None
+        The training command, or `None` if profile-guided optimization is
+        disabled.
+    """
+
+    if not get_env_flag("EXTENSION_HELPERS_PGO"):
+        return None
+
+    command = os.environ.get("EXTENSION_HELPERS_PGO_COMMAND")
+    if command is None:
+        command = get_extension_helpers_config(srcdir).get("pgo-command")
+
+    if not command:
+        raise ValueError(
+            "EXTENSION_HELPERS_PGO is set but no training command was specified - set the "
+            "EXTENSION_HELPERS_PGO_COMMAND environment variable or the pgo-command option "
+            "in pyproject.toml"
+        )
+
+    if isinstance(command, str):
+        command = shlex.split(command)
+    else:
+        command = list(command)
+
+    if command[0] in ("python", "python3"):
+        command[0] = sys.executable
+
+    return command
+
+
+def get_compiler_family(ccompiler):
+    """
+    Return ``'gcc'`` or ``'clang'`` depending on the compiler used by
+    ``ccompiler``, or `None` for other compilers.
+    """
+
+    if ccompiler.compiler_type == "msvc":
+        return None
+
+    command = [
+        arg
+        for arg in getattr(ccompiler, "compiler_so", None) or []
+        if _launcher_name(arg) not in KNOWN_LAUNCHERS
+    ]
+    if not command:
+        return None
+
+    version = _get_compiler_version(command[0]).lower()
+    if "clang" in version:
+        return "clang"
+    if "gcc" in version or "free software foundation" in version:
+        return "gcc"
+    return None
+
+
+def get_pgo_flags(family, stage, profile):
+    """
+    Return the compiler and linker flags for a stage of a PGO build.
+
+    Parameters
+    ----------
+    family : {'gcc', 'clang'}
+        The compiler family, as returned by `get_compiler_family`.
+    stage : {'generate', 'use'}
+        Whether to build instrumented extensions, or to build extensions
+        using the profile data.
+    profile : str
+        The directory in which profile data is written when generating it,
+        and the profile data to use otherwise (as returned by
+        `merge_profiles`).
+
+    Returns
+    -------
+    compile_flags, link_flags : list of str
+    """
+
+    if stage == "generate":
+        flags = [f"-fprofile-generate={profile}"]
+        return flags, flags
+
+    flags = [f"-fprofile-use={profile}"]
+    if family == "gcc":
+        # Counters can be inconsistent for multi-threaded code (for instance
+        # with OpenMP), which GCC treats as an error by default.
+        flags.append("-fprofile-correction")
+    return flags, [f"-fprofile-use={profile}"]
+
+
+def find_llvm_profdata():
+    """
+    Return the command to run ``llvm-profdata``, or `None` if it cannot be
+    found. The ``LLVM_PROFDATA`` environment variable can be set to the
+    command to use.
+    """
+
+    if os.environ.get("LLVM_PROFDATA"):
+        return shlex.split(os.environ["LLVM_PROFDATA"])
+
+    executable = shutil.which("llvm-profdata")
+    if executable:
+        return [executable]
+
+    if sys.platform == "darwin" and shutil.which("xcrun"):
+        return ["xcrun", "llvm-profdata"]
+
+    return None
+
+
+def merge_profiles(family, profile_dir):
+    """
+    Prepare the profile data written to ``profile_dir`` by the training
+    command for use by the compiler.
+
+    For GCC, the profile data is used directly. For clang, the raw profile
+    files are merged with ``llvm-profdata``.
+
+    Returns
+    -------
+    profile : str
+        The profile data to pass to `get_pgo_flags`.
+    """
+
+    if family == "gcc":
+        if not glob.glob(os.path.join(profile_dir, "**", "*.gcda"), recursive=True):
+            raise ExecError(f"the PGO training command did not write profile data to {profile_dir}")
+        return profile_dir
+
+    raw_profiles = sorted(glob.glob(os.path.join(profile_dir, "*.profraw")))
+    if not raw_profiles:
+        raise ExecError(f"the PGO training command did not write profile data to {profile_dir}")
+
+    llvm_profdata = find_llvm_profdata()
+    if llvm_profdata is None:
+        raise ExecError(
+            "llvm-profdata is needed to merge the profile data written by clang, set the "
+            "LLVM_PROFDATA environment variable to the command to use"
+        )
+
+    profile = os.path.join(profile_dir, "merged.profdata")
+    try:
+        subprocess.run([*llvm_profdata, "merge", f"-output={profile}", *raw_profiles], check=True)
+    except (OSError, subprocess.CalledProcessError) as exc:
+        raise ExecError(f"could not merge the PGO profile data: {exc}") from exc
+
+    return profile
+
+
+def run_training_command(command, pythonpath=(), cwd=None):
+    """
+    Run the PGO training command, with the directories in ``pythonpath``
+    (containing the instrumented extensions) put in front of the
+    ``PYTHONPATH`` environment variable.
+    """
+
+    paths = [*pythonpath]
+    if os.environ.get("PYTHONPATH"):
+        paths.append(os.environ["PYTHONPATH"])
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(paths)}
+
+    try:
+        subprocess.run(command, env=env, cwd=cwd, check=True)
+    except OSError as exc:
+        raise ExecError(f"could not run the PGO training command: {exc}") from exc
+    except subprocess.CalledProcessError as exc:
+        raise ExecError(f"the PGO training command failed with exit code {exc.returncode}") from exc
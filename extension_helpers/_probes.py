@@ -0,0 +1,565 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements checks of the features supported by the compiler,
+such as whether a header is available or whether a flag is accepted. Several
+checks can be run at once, in which case they are compiled concurrently in a
+single temporary directory, and the results are cached both in-process and
+on disk.
+"""
+
+import asyncio
+import copy
+import functools
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from setuptools.command.build_ext import customize_compiler, new_compiler
+from setuptools.errors import ExecError
+
+from ._cache import hash_key, read_cache, write_cache
+from ._launcher import apply_compiler_launcher, get_compiler_launcher
+from ._utils import get_compiler_runner
+
+__all__ = [
+    "Probe",
+    "compiles",
+    "has_flag",
+    "has_function",
+    "has_header",
+    "has_linker_flag",
+    "run_probes",
+    "run_probes_async",
+]
+
+log = logging.getLogger(__name__)
+
+_EMPTY_MAIN = "int main(void) {\n  return 0;\n}\n"
+
+# In-process caches for compiler versions and probe results. Probe results
+# are also persisted on disk, see run_probes below.
+_COMPILER_VERSIONS = {}
+_PROBE_RESULTS = {}
+
+# A lock for each probe, which makes sure that a probe needed by several
+# threads at the same time is only run once.
+_PROBE_LOCKS = {}
+_PROBE_LOCKS_LOCK = threading.Lock()
+
+
+class ProbeResult(namedtuple("ProbeResult", ["success", "output"])):
+    """
+    The result of a `Probe`.
+
+    Attributes
+    ----------
+    success : bool
+        Whether all the steps of the probe succeeded.
+    output : str
+        The standard output of the test program if it was run, otherwise an
+        empty string.
+    """
+
+    __slots__ = ()
+
+    def __bool__(self):
+        return bool(self.success)
+
+
+class Probe:
+    """
+    A check of whether a piece of code can be compiled, and optionally linked
+    into an executable and run.
+
+    Parameters
+    ----------
+    code : str
+        The source code to compile.
+    description : str, optional
+        A short description of what is checked, used in the build log.
+    language : {'c', 'c++'}, optional
+        The language of the source code.
+    include_dirs : list of str, optional
+        Additional directories in which to look for headers.
+    extra_compile_args : list of str, optional
+        Additional arguments for the compiler.
+    libraries : list of str, optional
+        Libraries to link against.
+    library_dirs : list of str, optional
+        Additional directories in which to look for libraries.
+    extra_link_args : list of str, optional
+        Additional arguments for the linker.
+    link : bool, optional
+        If `True`, the code is also linked into an executable.
+    run : bool, optional
+        If `True`, the code is linked into an executable which is then run,
+        and the probe succeeds only if it exits without error.
+    reject_output : str, optional
+        If specified, the probe fails if the output of the compiler or the
+        linker contains this string. This is used to detect flags which are
+        ignored with a warning rather than rejected.
+    """
+
+    def __init__(
+        self,
+        code,
+        description=None,
+        language="c",
+        include_dirs=(),
+        extra_compile_args=(),
+        libraries=(),
+        library_dirs=(),
+        extra_link_args=(),
+        link=False,
+        run=False,
+        reject_output=None,
+    ):
+        if language not in ("c", "c++"):
+            raise ValueError(f"language should be 'c' or 'c++', got {language!r}")
+        self.code = code
+        self.description = description or "code"
+        self.language = language
+        self.include_dirs = list(include_dirs or ())
+        self.extra_compile_args = list(extra_compile_args or ())
+        self.libraries = list(libraries or ())
+        self.library_dirs = list(library_dirs or ())
+        self.extra_link_args = list(extra_link_args or ())
+        self.link = link or run
+        self.run = run
+        self.reject_output = reject_output
+
+    def __repr__(self):
+        return f"<Probe {self.description}>"
+
+    @classmethod
+    def header(cls, header, **kwargs):
+        """
+        Return a probe checking whether ``header`` can be included.
+        """
+        code = f"#include <{header}>\n\n{_EMPTY_MAIN}"
+        return cls(code, **{"description": f"header {header}", **kwargs})
+
+    @classmethod
+    def function(cls, function, headers=(), **kwargs):
+        """
+        Return a probe checking whether ``function`` can be linked against.
+
+        If ``headers`` are given, they are included and should declare the
+        function, otherwise the function is declared by the probe.
+        """
+        if headers:
+            includes = "".join(f"#include <{header}>\n" for header in headers)
+            code = (
+                f"{includes}\nint main(void) {{\n"
+                f"  void *volatile address = (void *)&{function};\n"
+                f"  return address == 0;\n}}\n"
+            )
+        else:
+            code = (
+                f'#ifdef __cplusplus\nextern "C"\n#endif\nchar {function}(void);\n\n'
+                f"int main(void) {{\n  return {function}();\n}}\n"
+            )
+        return cls(code, **{"description": f"function {function}", "link": True, **kwargs})
+
+    @classmethod
+    def flag(cls, flag, **kwargs):
+        """
+        Return a probe checking whether the compiler accepts ``flag``.
+        """
+        extra_compile_args = [*kwargs.pop("extra_compile_args", ()), flag]
+        return cls(
+            _EMPTY_MAIN,
+            **{
+                "description": f"compiler flag {flag}",
+                "extra_compile_args": extra_compile_args,
+                "reject_output": flag,
+                **kwargs,
+            },
+        )
+
+    @classmethod
+    def linker_flag(cls, flag, **kwargs):
+        """
+        Return a probe checking whether the linker accepts ``flag``.
+        """
+        extra_link_args = [*kwargs.pop("extra_link_args", ()), flag]
+        return cls(
+            _EMPTY_MAIN,
+            **{
+                "description": f"linker flag {flag}",
+                "extra_link_args": extra_link_args,
+                "link": True,
+                "reject_output": flag,
+                **kwargs,
+            },
+        )
+
+    def _key(self):
+        # Everything which can change the result of the probe
+        return {name: value for name, value in vars(self).items() if name != "description"}
+
+
+def _get_compiler_version(executable):
+    """
+    Return the output of ``executable --version``, or an empty string if the
+    version could not be determined.
+    """
+
+    if executable not in _COMPILER_VERSIONS:
+        try:
+            output = subprocess.run(
+                [executable, "--version"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                check=False,
+            ).stdout
+            version = output.decode("utf-8", errors="replace").strip()
+        except (OSError, subprocess.SubprocessError):
+            version = ""
+        _COMPILER_VERSIONS[executable] = version
+
+    return _COMPILER_VERSIONS[executable]
+
+
+def _compiler_fingerprint(ccompiler):
+    """
+    Return a dictionary identifying the compiler and the environment which
+    can influence the result of a probe.
+    """
+
+    command = list(getattr(ccompiler, "compiler_so", None) or [])
+    version = _get_compiler_version(command[0]) if command else ""
+
+    return {
+        "platform": sys.platform,
+        "compiler_type": ccompiler.compiler_type,
+        "command": command,
+        "version": version,
+        "environ": {var: os.environ.get(var) for var in ("CC", "CFLAGS", "LDFLAGS")},
+    }
+
+
+def _run_capture(ccompiler, output, cmd, env=None, translate_errors=False, **kwargs):
+    # This replaces the method which the compiler uses to run commands (see
+    # get_compiler_runner) so that the output of the compiler can be checked,
+    # and so that the errors of failed probes do not clutter the build log.
+    # The exceptions of distutils.spawn.spawn are raised if translate_errors
+    # is set, and those of subprocess otherwise.
+    log.debug(subprocess.list2cmdline(cmd))
+
+    if env is None and getattr(ccompiler, "_paths", None):
+        # MSVC needs the paths found when the compiler was initialized
+        env = {**os.environ, "PATH": ccompiler._paths}
+
+    if sys.platform == "darwin":
+        from distutils.util import MACOSX_VERSION_VAR, get_macosx_target_ver
+
+        target = get_macosx_target_ver()
+        if target:
+            env = {**(env if env is not None else os.environ), MACOSX_VERSION_VAR: target}
+
+    try:
+        process = subprocess.run(
+            cmd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False
+        )
+    except OSError as exc:
+        if translate_errors:
+            raise ExecError(f"command {cmd[0]!r} failed: {exc.args[-1]}") from exc
+        raise
+
+    output.append(process.stdout.decode("utf-8", errors="replace"))
+
+    if process.returncode:
+        if translate_errors:
+            raise ExecError(f"command {cmd[0]!r} failed with exit code {process.returncode}")
+        raise subprocess.CalledProcessError(process.returncode, cmd, process.stdout)
+
+
+def _run_probe(ccompiler, probe, directory):
+    """
+    Compile, and optionally link and run, the code of ``probe`` in
+    ``directory``, which should be an absolute path.
+    """
+
+    # Each probe uses its own copy of the compiler, so that the output of
+    # the commands it runs can be captured separately.
+    ccompiler = copy.copy(ccompiler)
+    compiler_output = []
+    runner = get_compiler_runner(ccompiler)
+    setattr(
+        ccompiler,
+        runner,
+        lambda cmd, **kwargs: _run_capture(
+            ccompiler, compiler_output, cmd, translate_errors=runner == "spawn", **kwargs
+        ),
+    )
+
+    os.makedirs(directory)
+    source = os.path.join(directory, "probe.cpp" if probe.language == "c++" else "probe.c")
+    with open(source, "w") as f:
+        f.write(probe.code)
+
+    output = ""
+    try:
+        objects = ccompiler.compile(
+            [source],
+            output_dir=directory,
+            include_dirs=probe.include_dirs,
+            extra_postargs=probe.extra_compile_args,
+        )
+        if probe.link:
+            ccompiler.link_executable(
+                objects,
+                "probe",
+                output_dir=directory,
+                libraries=probe.libraries,
+                library_dirs=probe.library_dirs,
+                extra_postargs=probe.extra_link_args,
+                target_lang=probe.language,
+            )
+        if probe.run:
+            executable = os.path.join(directory, ccompiler.executable_filename("probe"))
+            output = subprocess.run(
+                [executable], stdout=subprocess.PIPE, cwd=directory, check=True
+            ).stdout.decode("utf-8", errors="replace")
+    except Exception as exc:  # noqa: BLE001
+        log.debug("%s failed: %s\n%s", probe, exc, "".join(compiler_output))
+        return ProbeResult(False, "")
+
+    if probe.reject_output and probe.reject_output in "".join(compiler_output):
+        log.debug("%s rejected:\n%s", probe, "".join(compiler_output))
+        return ProbeResult(False, "")
+
+    return ProbeResult(True, output)
+
+
+def _get_probe_lock(key):
+    with _PROBE_LOCKS_LOCK:
+        return _PROBE_LOCKS.setdefault(key, threading.Lock())
+
+
+def _run_cached_probe(ccompiler, key, probe, directory):
+    with _get_probe_lock(key):
+        # Another thread may have run the probe in the meantime
+        if key in _PROBE_RESULTS:
+            return
+        result = _run_probe(ccompiler, probe, directory)
+        log.info("checking for %s: %s", probe.description, "yes" if result else "no")
+        # Failures are only cached in-process, since they can be caused by
+        # something missing, such as the OpenMP library, which can be
+        # installed later without changing the compiler or the environment.
+        if result:
+            write_cache("probes", key, list(result))
+        _PROBE_RESULTS[key] = result
+
+
+def run_probes(probes, max_workers=None):
+    """
+    Run several compiler probes.
+
+    The probes which have not been run before with the same compiler and
+    environment are compiled concurrently, each in its own sub-directory of
+    a single temporary directory. The results are cached in-process, and the
+    successful ones also on disk (see ``EXTENSION_HELPERS_CACHE_DIR``).
+
+    This function can be called from several threads at the same time, in
+    which case probes needed by several threads are only run once.
+
+    Parameters
+    ----------
+    probes : iterable of `Probe`
+        The probes to run.
+    max_workers : int, optional
+        The maximum number of probes to compile at the same time. This
+        defaults to the value used by `concurrent.futures.ThreadPoolExecutor`.
+
+    Returns
+    -------
+    results : list of tuple
+        The result of each probe, in the same order as ``probes``, as
+        ``(success, output)`` named tuples which evaluate to `True` if the
+        probe succeeded. ``output`` is the standard output of the test
+        program if it was run.
+    """
+
+    probes = list(probes)
+    if not probes:
+        return []
+
+    ccompiler = new_compiler()
+    customize_compiler(ccompiler)
+
+    fingerprint = _compiler_fingerprint(ccompiler)
+    keys = [hash_key("probe", probe._key(), fingerprint) for probe in probes]
+
+    # Probes which are not cached yet, keyed by cache key so that identical
+    # probes are only run once.
+    pending = {}
+    for probe, key in zip(probes, keys, strict=True):
+        if key in _PROBE_RESULTS or key in pending:
+            continue
+        result = read_cache("probes", key)
+        if result is None:
+            pending[key] = probe
+        else:
+            log.debug("Using cached result for %s", probe)
+            _PROBE_RESULTS[key] = ProbeResult(*result)
+
+    if pending:
+        # The launcher is applied after computing the keys since it does not
+        # change the result of the probes.
+        apply_compiler_launcher(ccompiler, get_compiler_launcher())
+
+        # Compilers which need to be initialized (such as MSVC) are
+        # initialized once rather than in every thread.
+        if not getattr(ccompiler, "initialized", True):
+            ccompiler.initialize()
+
+        with tempfile.TemporaryDirectory(prefix="extension-helpers-probes-") as workspace:
+            workspace = os.path.abspath(workspace)
+            tasks = [
+                (ccompiler, key, probe, os.path.join(workspace, f"probe{index}"))
+                for index, (key, probe) in enumerate(pending.items())
+            ]
+            if len(tasks) > 1 and max_workers != 1:
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    list(pool.map(lambda task: _run_cached_probe(*task), tasks))
+            else:
+                for task in tasks:
+                    _run_cached_probe(*task)
+
+    return [_PROBE_RESULTS[key] for key in keys]
+
+
+async def run_probes_async(probes, max_workers=None):
+    """
+    Run several compiler probes without blocking the event loop.
+
+    This is equivalent to `run_probes`, but the probes are run in the default
+    executor of the running event loop. The probes needed by different
+    extensions can then be run concurrently with `asyncio.gather`.
+
+    Parameters
+    ----------
+    probes : iterable of `Probe`
+        The probes to run.
+    max_workers : int, optional
+        The maximum number of probes to compile at the same time.
+
+    Returns
+    -------
+    results : list of tuple
+        The result of each probe, as returned by `run_probes`.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(run_probes, list(probes), max_workers=max_workers)
+    )
+
+
+def compiles(code, **kwargs):
+    """
+    Check whether ``code`` can be compiled.
+
+    Parameters
+    ----------
+    code : str
+        The source code to compile.
+    **kwargs
+        Additional options for the check, see `Probe`. For instance,
+        ``link=True`` also checks that the code can be linked.
+
+    Returns
+    -------
+    result : bool
+        `True` if the check passed, `False` otherwise.
+    """
+    return run_probes([Probe(code, **kwargs)])[0].success
+
+
+def has_header(header, **kwargs):
+    """
+    Check whether ``header`` can be included.
+
+    Parameters
+    ----------
+    header : str
+        The name of the header, e.g. ``'zlib.h'``.
+    **kwargs
+        Additional options for the check, see `Probe`.
+
+    Returns
+    -------
+    result : bool
+        `True` if the header can be included, `False` otherwise.
+    """
+    return run_probes([Probe.header(header, **kwargs)])[0].success
+
+
+def has_function(function, headers=(), **kwargs):
+    """
+    Check whether ``function`` is available.
+
+    Parameters
+    ----------
+    function : str
+        The name of the function.
+    headers : list of str, optional
+        The headers declaring the function. If not given, the function is
+        only checked by linking against it.
+    **kwargs
+        Additional options for the check, see `Probe`. The libraries providing
+        the function should be given as ``libraries``.
+
+    Returns
+    -------
+    result : bool
+        `True` if the function is available, `False` otherwise.
+    """
+    return run_probes([Probe.function(function, headers=headers, **kwargs)])[0].success
+
+
+def has_flag(flag, **kwargs):
+    """
+    Check whether the compiler accepts ``flag``.
+
+    Flags which are accepted with a warning mentioning the flag, for instance
+    because they are unused, are considered not to be supported.
+
+    Parameters
+    ----------
+    flag : str
+        The compiler flag, e.g. ``'-mavx2'``.
+    **kwargs
+        Additional options for the check, see `Probe`.
+
+    Returns
+    -------
+    result : bool
+        `True` if the flag is supported, `False` otherwise.
+    """
+    return run_probes([Probe.flag(flag, **kwargs)])[0].success
+
+
+def has_linker_flag(flag, **kwargs):
+    """
+    Check whether the linker accepts ``flag``.
+
+    Parameters
+    ----------
+    flag : str
+        The linker flag, e.g. ``'-Wl,--as-needed'``.
+    **kwargs
+        Additional options for the check, see `Probe`.
+
+    Returns
+    -------
+    result : bool
+        `True` if the flag is supported, `False` otherwise.
+    """
+    return run_probes([Probe.linker_flag(flag, **kwargs)])[0].success
@@ -0,0 +1,218 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements build profiles, which are named sets of optimization
+settings declared in the ``[tool.extension-helpers.profiles]`` section of
+``pyproject.toml`` and applied to all extensions.
+"""
+
+import copy
+import fnmatch
+import logging
+import os
+
+from ._probes import Probe, run_probes
+from ._utils import get_extension_helpers_config
+
+__all__ = []
+
+log = logging.getLogger(__name__)
+
+# The profiles available without any configuration. Profiles with the same
+# names in pyproject.toml are merged into these.
+BUILTIN_PROFILES = {
+    "release": {"optimization": "3", "define-macros": ["NDEBUG"]},
+    "native": {"optimization": "3", "march": "native", "define-macros": ["NDEBUG"]},
+    "debug": {
+        "optimization": "0",
+        "debug": True,
+        "frame-pointers": True,
+        "undef-macros": ["NDEBUG"],
+    },
+}
+
+# The settings which can be set in profiles and in their overrides
+PROFILE_SETTINGS = (
+    "optimization",
+    "march",
+    "fast-math",
+    "frame-pointers",
+    "debug",
+    "define-macros",
+    "undef-macros",
+    "extra-compile-args",
+    "extra-link-args",
+)
+
+_MSVC_OPTIMIZATION = {"0": "/Od", "1": "/O1", "2": "/O2", "3": "/O2", "s": "/O1"}
+
+
+def get_profile(srcdir="."):
+    """
+    Return the name and settings of the build profile to use, if any.
+
+    The profile is selected with the ``EXTENSION_HELPERS_PROFILE`` environment
+    variable or, if this is not set, the ``profile`` option in the
+    ``[tool.extension-helpers]`` section of ``pyproject.toml``. Profiles are
+    defined in ``[tool.extension-helpers.profiles.<name>]`` sections, and the
+    ``release``, ``native`` and ``debug`` profiles are always available.
+
+    Returns
+    -------
+    name : str or None
+        The name of the profile, or `None` if no profile is selected.
+    settings : dict
+        The settings of the profile.
+    """
+
+    config = get_extension_helpers_config(srcdir)
+
+    name = os.environ.get("EXTENSION_HELPERS_PROFILE", "").strip()
+    if not name:
+        name = config.get("profile", "")
+    if not name or name == "none":
+        return None, {}
+
+    profiles = copy.deepcopy(BUILTIN_PROFILES)
+    for profile_name, settings in config.get("profiles", {}).items():
+        profiles.setdefault(profile_name, {}).update(settings)
+
+    if name not in profiles:
+        raise ValueError(
+            f"Unknown build profile {name!r}, should be one of {', '.join(sorted(profiles))}"
+        )
+
+    settings = profiles[name]
+    unknown = [key for key in settings if key not in PROFILE_SETTINGS and key != "overrides"]
+    for override in settings.get("overrides", []):
+        unknown.extend(
+            key for key in override if key not in PROFILE_SETTINGS and key != "extensions"
+        )
+    if unknown:
+        raise ValueError(
+            f"Unknown settings in build profile {name!r}: {', '.join(sorted(set(unknown)))}"
+        )
+
+    return name, settings
+
+
+def get_extension_settings(settings, name):
+    """
+    Return the settings of a profile which apply to the extension ``name``,
+    taking into account the overrides whose ``extensions`` glob-style patterns
+    match the name. Later overrides take precedence.
+    """
+
+    result = {key: value for key, value in settings.items() if key != "overrides"}
+    for override in settings.get("overrides", []):
+        if any(fnmatch.fnmatchcase(name, pattern) for pattern in override.get("extensions", [])):
+            result.update((key, value) for key, value in override.items() if key != "extensions")
+    return result
+
+
+def get_profile_flags(compiler_type, settings):
+    """
+    Convert the settings of a profile to compiler and linker flags.
+
+    Returns
+    -------
+    compile_flags, link_flags : list of str
+    """
+
+    msvc = compiler_type == "msvc"
+    compile_flags = []
+    link_flags = []
+
+    optimization = settings.get("optimization")
+    if optimization is not None:
+        optimization = str(optimization)
+        if msvc:
+            compile_flags.append(_MSVC_OPTIMIZATION.get(optimization, f"/O{optimization}"))
+        else:
+            compile_flags.append(f"-O{optimization}")
+
+    march = settings.get("march")
+    if march:
+        if not msvc:
+            compile_flags.append(f"-march={march}")
+        elif march != "native":
+            compile_flags.append(f"/arch:{march}")
+
+    if settings.get("fast-math"):
+        compile_flags.append("/fp:fast" if msvc else "-ffast-math")
+
+    frame_pointers = settings.get("frame-pointers")
+    if frame_pointers is not None:
+        if msvc:
+            compile_flags.append("/Oy-" if frame_pointers else "/Oy")
+        else:
+            compile_flags.append(
+                "-fno-omit-frame-pointer" if frame_pointers else "-fomit-frame-pointer"
+            )
+
+    if settings.get("debug"):
+        compile_flags.append("/Zi" if msvc else "-g")
+        if msvc:
+            link_flags.append("/DEBUG")
+
+    compile_flags.extend(settings.get("extra-compile-args", []))
+    link_flags.extend(settings.get("extra-link-args", []))
+
+    return compile_flags, link_flags
+
+
+def _parse_macro(macro):
+    name, sep, value = str(macro).partition("=")
+    return (name, value if sep else None)
+
+
+def apply_profile(extensions, compiler_type, srcdir="."):
+    """
+    Apply the selected build profile, if any, to ``extensions`` built with a
+    compiler of type ``compiler_type``.
+
+    Compiler flags are checked before being added, and flags which the
+    compiler does not support are dropped with a warning.
+
+    Returns
+    -------
+    name : str or None
+        The name of the profile applied, or `None` if no profile is selected.
+    """
+
+    name, settings = get_profile(srcdir)
+    if name is None:
+        return None
+
+    ext_flags = []
+    for ext in extensions:
+        ext_settings = get_extension_settings(settings, ext.name)
+        ext_flags.append((ext, ext_settings, *get_profile_flags(compiler_type, ext_settings)))
+
+    # Check all the compiler flags at once
+    flags = list(
+        dict.fromkeys(flag for _, _, compile_flags, _ in ext_flags for flag in compile_flags)
+    )
+    results = run_probes([Probe.flag(flag) for flag in flags])
+    unsupported = {flag for flag, result in zip(flags, results, strict=True) if not result}
+    if unsupported:
+        log.warning(
+            "the compiler does not support the flags %s from the %s build profile, ignoring them",
+            ", ".join(sorted(unsupported)),
+            name,
+        )
+
+    for ext, ext_settings, compile_flags, link_flags in ext_flags:
+        ext.extra_compile_args = [
+            *ext.extra_compile_args,
+            *(flag for flag in compile_flags if flag not in unsupported),
+        ]
+        ext.extra_link_args = [*ext.extra_link_args, *link_flags]
+        ext.define_macros = [
+            *ext.define_macros,
+            *(_parse_macro(macro) for macro in ext_settings.get("define-macros", [])),
+        ]
+        ext.undef_macros = [*ext.undef_macros, *ext_settings.get("undef-macros", [])]
+
+    log.info("using the %s build profile", name)
+
+    return name
@@ -4,24 +4,36 @@ This module contains a number of utilities for use during
 setup/build/packaging that are useful to astropy as a whole.
 """
 
+import functools
 import logging
+import multiprocessing
 import os
-import shutil
 import subprocess
 import sys
+import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-from setuptools import Extension, find_packages
+from setuptools import Extension
 from setuptools.command.build_ext import new_compiler
 
+from ._cache import hash_key, read_cache, write_cache
+from ._cython import get_cython_directives_config, get_module_directives
+from ._depends import add_dependencies
+from ._manifest import read_manifest, write_manifest
+from ._profiles import apply_profile
+from ._simd import generate_cpu_features_py, is_simd_variant
+from ._source_tree import get_ignore_patterns, index_source_tree
 from ._utils import (
     abi_to_versions,
+    get_env_flag,
     get_limited_api_option,
     import_file,
     walk_skip_hidden,
+    write_if_different,
 )
 
-__all__ = ["get_compiler", "get_extensions", "pkg_config"]
+__all__ = ["get_compiler", "get_extensions", "pkg_config", "pkg_config_batch"]
 
 log = logging.getLogger(__name__)
 
@@ -41,7 +53,7 @@ def get_compiler():
     return new_compiler().compiler_type
 
 
-def get_extensions(srcdir="."):
+def get_extensions(srcdir=".", use_cache=None, jobs=None):
     """
     Collect all extensions from Cython files and ``setup_package.py`` files.
 
@@ -53,41 +65,51 @@ def get_extensions(srcdir="."):
     This module can contain the ``get_extensions()`` function which returns
     a list of :class:`setuptools.Extension` objects.
 
+    Parameters
+    ----------
+    srcdir : str, optional
+        The root of the source tree in which to look for extensions.
+    use_cache : bool, optional
+        If `True`, the discovered extensions are stored in a manifest on disk
+        and are reused by subsequent calls as long as none of the packages,
+        ``setup_package.py`` files and ``.pyx`` files in ``srcdir`` have
+        changed. If not specified, this is enabled by setting the
+        ``EXTENSION_HELPERS_DISCOVERY_CACHE`` environment variable.
+    jobs : int, optional
+        The number of processes to use to evaluate the ``get_extensions()``
+        functions of ``setup_package.py`` files. If larger than one, each
+        ``setup_package.py`` file is evaluated in a separate process. If not
+        specified, this is set by the ``EXTENSION_HELPERS_DISCOVERY_JOBS``
+        environment variable, and defaults to one.
+
+    Notes
+    -----
+    The ``depends`` attribute of each extension is extended with the headers
+    from ``srcdir`` included (directly or indirectly) by its C/C++ sources,
+    so that extensions are rebuilt when these headers change. This can be
+    disabled by setting the ``EXTENSION_HELPERS_SCAN_DEPENDS`` environment
+    variable to ``0``.
     """
-    ext_modules = []
-    packages = []
-    package_dir = {}
 
-    # Use the find_packages tool to locate all packages and modules
-    packages = find_packages(srcdir)
+    if use_cache is None:
+        use_cache = get_env_flag("EXTENSION_HELPERS_DISCOVERY_CACHE")
 
-    # Update package_dir if the package lies in a subdirectory
-    if srcdir != ".":
-        package_dir[""] = srcdir
+    if jobs is None:
+        jobs = _get_discovery_jobs()
 
-    for setuppkg in iter_setup_packages(srcdir, packages):
-        # get_extensions must include any Cython extensions by their .pyx
-        # filename.
-        if hasattr(setuppkg, "get_extensions"):
-            ext_modules.extend(setuppkg.get_extensions())
+    # Index the source tree once, this is then used both to check whether
+    # the discovery manifest is up to date and to discover extensions.
+    index = index_source_tree(srcdir, ignore=get_ignore_patterns(srcdir))
 
-    # Locate any .pyx files not already specified, and add their extensions in.
-    # The default include dirs include numpy to facilitate numerical work.
-    includes = []
-    try:
-        import numpy
-
-        includes = [numpy.get_include()]
-    except ImportError:
-        pass
-
-    ext_modules.extend(get_cython_extensions(srcdir, packages, ext_modules, includes))
+    if use_cache:
+        manifest_key, packages, ext_modules = read_manifest(index)
+    else:
+        packages = ext_modules = None
 
-    # Now remove extensions that have the special name 'skip_cython', as they
-    # exist Only to indicate that the cython extensions shouldn't be built
-    for i, ext in reversed(list(enumerate(ext_modules))):
-        if ext.name == "skip_cython":
-            del ext_modules[i]
+    if ext_modules is None:
+        packages, ext_modules = _discover_extensions(srcdir, index, jobs=jobs)
+        if use_cache:
+            write_manifest(manifest_key, packages, ext_modules)
 
     # On Microsoft compilers, we need to pass the '/MANIFEST'
     # commandline argument.  This was the default on MSVC 9.0, but is
@@ -100,16 +122,22 @@ def get_extensions(srcdir="."):
     if len(ext_modules) > 0:
         main_package_dir = min(packages, key=len)
         src_path = os.path.join(os.path.dirname(__file__), "src")
-        shutil.copyfile(
-            os.path.join(src_path, "compiler.c"),
-            os.path.join(srcdir, main_package_dir, "_compiler.c"),
-        )
+        # Only write the file if needed so that the compiler_version extension
+        # is not rebuilt unnecessarily.
+        with open(os.path.join(src_path, "compiler.c"), "rb") as f:
+            write_if_different(os.path.join(srcdir, main_package_dir, "_compiler.c"), f.read())
         ext = Extension(
             main_package_dir + ".compiler_version",
             [os.path.join(srcdir, main_package_dir, "_compiler.c")],
         )
         ext_modules.append(ext)
 
+        # Extensions built for several SIMD targets select their variant
+        # using the cpu_features module of their top-level package.
+        simd_packages = {ext.name.split(".")[0] for ext in ext_modules if is_simd_variant(ext)}
+        for packagename in sorted(simd_packages):
+            ext_modules.append(generate_cpu_features_py(packagename, srcdir))
+
     # Since https://github.com/astropy/extension-helpers/pull/67,
     # extensions that used absolute paths in source names stopped working.
     # Absolute paths in source paths are undesirable but we need to
@@ -141,6 +169,16 @@ def get_extensions(srcdir="."):
 
         extension.sources = sources
 
+    # Make sure that extensions are rebuilt if any of the headers they include
+    # from the source tree change.
+    if get_env_flag("EXTENSION_HELPERS_SCAN_DEPENDS", default=True):
+        for extension in ext_modules:
+            add_dependencies(extension, root=srcdir)
+
+    # Optimization settings from the build profile selected in pyproject.toml
+    # or with EXTENSION_HELPERS_PROFILE
+    apply_profile(ext_modules, get_compiler(), srcdir=srcdir)
+
     abi = get_limited_api_option(srcdir=srcdir)
     if abi:
         version_info, version_hex = abi_to_versions(abi)
@@ -159,6 +197,290 @@ def get_extensions(srcdir="."):
     return ext_modules
 
 
+class _LazyExtensionList(list):
+    """
+    A list of extensions which is only populated, by calling
+    :func:`get_extensions`, the first time its content is accessed.
+
+    This is used as ``ext_modules`` when extension-helpers is enabled through
+    the configuration files, so that commands which only need the metadata of
+    the package (such as ``egg_info`` or ``dist_info``) do not need to
+    discover extensions.
+
+    This needs to be a subclass of `list`, since setuptools checks the type
+    of ``ext_modules``. All the methods of `list` which access its content
+    are therefore overridden, including the reflected operators and
+    comparisons, which would otherwise be handled by the `list` on the left
+    side of the operation without calling any method of this class.
+    """
+
+    def __init__(self, srcdir="."):
+        super().__init__()
+        self.srcdir = srcdir
+        self.loaded = False
+
+    def load(self):
+        if not self.loaded:
+            list.extend(self, get_extensions(self.srcdir))
+            self.loaded = True
+
+    def __radd__(self, other):
+        # list does not define __radd__, but since this class does, Python
+        # calls it first for ``other + self`` if other is a list.
+        if not isinstance(other, list):
+            return NotImplemented
+        self.load()
+        return list.__add__(other, self)
+
+
+def _make_lazy_method(name):
+    method = getattr(list, name)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.load()
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+for _name in (
+    "__add__",
+    "__contains__",
+    "__delitem__",
+    "__eq__",
+    "__ge__",
+    "__getitem__",
+    "__gt__",
+    "__iadd__",
+    "__imul__",
+    "__iter__",
+    "__le__",
+    "__len__",
+    "__lt__",
+    "__mul__",
+    "__ne__",
+    "__repr__",
+    "__reversed__",
+    "__rmul__",
+    "__setitem__",
+    "append",
+    "clear",
+    "copy",
+    "count",
+    "extend",
+    "index",
+    "insert",
+    "pop",
+    "remove",
+    "reverse",
+    "sort",
+):
+    setattr(_LazyExtensionList, _name, _make_lazy_method(_name))
+
+del _name
+
+
+# The commands which only deal with the metadata of the package
+_METADATA_COMMANDS = {"egg_info", "dist_info"}
+
+
+def set_lazy_extensions(distribution, srcdir="."):
+    """
+    Set the ``ext_modules`` of ``distribution`` to a list of extensions which
+    is only collected once a command actually needs it.
+    """
+
+    ext_modules = _LazyExtensionList(srcdir)
+    distribution.ext_modules = ext_modules
+
+    # Keep track of the commands being run, including sub-commands, so that
+    # we can tell whether the distribution is only used to write metadata.
+    running = []
+
+    def run_command(command):
+        running.append(command)
+        try:
+            type(distribution).run_command(distribution, command)
+        finally:
+            running.pop()
+
+    def has_ext_modules():
+        # This is called by egg_info (to add the sources of the extensions to
+        # the manifest) and dist_info (to determine whether wheels are pure
+        # Python), but the result is not needed for the metadata they write.
+        if not ext_modules.loaded and running and set(running) <= _METADATA_COMMANDS:
+            return False
+        return len(ext_modules) > 0
+
+    def iter_distribution_names():
+        # Extensions collected by get_extensions() are defined in the packages
+        # of the distribution, so their top-level names are already covered
+        # by the package names.
+        if ext_modules.loaded:
+            yield from type(distribution).iter_distribution_names(distribution)
+        else:
+            yield from distribution.packages or ()
+            yield from distribution.py_modules or ()
+
+    distribution.run_command = run_command
+    distribution.has_ext_modules = has_ext_modules
+    distribution.iter_distribution_names = iter_distribution_names
+
+
+def _get_discovery_jobs():
+    jobs = os.environ.get("EXTENSION_HELPERS_DISCOVERY_JOBS")
+    if not jobs:
+        return 1
+    try:
+        return max(1, int(jobs))
+    except ValueError:
+        raise ValueError(
+            f"EXTENSION_HELPERS_DISCOVERY_JOBS should be an integer, got {jobs!r}"
+        ) from None
+
+
+def _evaluate_setup_package(packagename, filename):
+    """
+    Import a ``setup_package.py`` file and call its ``get_extensions()``
+    function, if any.
+
+    Returns
+    -------
+    ext_modules : list
+        The extensions returned by ``get_extensions()``.
+    elapsed : float
+        The wall-clock time taken, in seconds.
+    """
+
+    start = time.perf_counter()
+    setuppkg = import_file(filename, name=packagename + ".setup_package")
+    # get_extensions must include any Cython extensions by their .pyx
+    # filename.
+    if hasattr(setuppkg, "get_extensions"):
+        ext_modules = list(setuppkg.get_extensions())
+    else:
+        ext_modules = []
+    return ext_modules, time.perf_counter() - start
+
+
+def _get_fork_context():
+    # Evaluating setup_package.py files in separate processes is only done
+    # using fork, since other start methods would re-run the main module
+    # (typically setup.py) in each process. We also avoid macOS, where
+    # forking is unsafe if some system frameworks have been loaded.
+    if sys.platform == "darwin" or "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context("fork")
+
+
+def _evaluate_setup_packages(setup_packages, jobs=1):
+    """
+    Evaluate several ``setup_package.py`` files, optionally in parallel.
+
+    Parameters
+    ----------
+    setup_packages : list
+        A list of ``(packagename, filename)`` tuples.
+    jobs : int, optional
+        The number of processes to use. If larger than one, each file is
+        evaluated in isolation in a separate process.
+
+    Returns
+    -------
+    results : list
+        The ``(ext_modules, elapsed)`` tuple for each file, in the same order
+        as ``setup_packages``.
+    """
+
+    context = _get_fork_context() if jobs > 1 and len(setup_packages) > 1 else None
+
+    if jobs > 1 and context is None and len(setup_packages) > 1:
+        log.info("Parallel evaluation of setup_package.py files is not supported on this platform")
+
+    if context is None:
+        return [_evaluate_setup_package(*args) for args in setup_packages]
+
+    results = []
+
+    # Each process is only used for a single file, so that setup_package.py
+    # files cannot affect each other.
+    with context.Pool(processes=min(jobs, len(setup_packages)), maxtasksperchild=1) as pool:
+        async_results = [pool.apply_async(_evaluate_setup_package, args) for args in setup_packages]
+        for args, async_result in zip(setup_packages, async_results, strict=True):
+            try:
+                results.append(async_result.get())
+            except Exception as exc:  # noqa: BLE001
+                # This can happen if the extensions could not be transferred
+                # back from the worker (for example if they use a class
+                # defined in the setup_package.py file), or if an error
+                # occurred - in both cases we evaluate the file again here,
+                # so that any error is raised normally.
+                log.debug("Evaluating %s in a separate process failed: %s", args[1], exc)
+                results.append(_evaluate_setup_package(*args))
+
+    return results
+
+
+def _discover_extensions(srcdir, index, jobs=1):
+    """
+    Collect the extensions defined in ``setup_package.py`` files as well as
+    automatic Cython extensions for all packages in ``srcdir``.
+
+    Parameters
+    ----------
+    srcdir : str
+        The root of the source tree.
+    index : `~extension_helpers._source_tree.SourceTreeIndex`
+        The index of the source tree.
+    jobs : int, optional
+        The number of processes to use to evaluate ``setup_package.py``
+        files.
+
+    Returns
+    -------
+    packages : list
+        The names of all packages found in ``srcdir``.
+    ext_modules : list
+        The extensions found.
+    """
+
+    ext_modules = []
+    packages = index.packages
+
+    setup_packages = [
+        (packagename, index.setup_packages[packagename])
+        for packagename in packages
+        if packagename in index.setup_packages
+    ]
+
+    for (_, filename), (extensions, elapsed) in zip(
+        setup_packages, _evaluate_setup_packages(setup_packages, jobs=jobs), strict=True
+    ):
+        log.info("Evaluated %s in %.2fs", filename, elapsed)
+        ext_modules.extend(extensions)
+
+    # Locate any .pyx files not already specified, and add their extensions in.
+    # The default include dirs include numpy to facilitate numerical work.
+    includes = []
+    try:
+        import numpy
+
+        includes = [numpy.get_include()]
+    except ImportError:
+        pass
+
+    ext_modules.extend(get_cython_extensions(srcdir, packages, ext_modules, includes, index=index))
+
+    # Now remove extensions that have the special name 'skip_cython', as they
+    # exist Only to indicate that the cython extensions shouldn't be built
+    for i, ext in reversed(list(enumerate(ext_modules))):
+        if ext.name == "skip_cython":
+            del ext_modules[i]
+
+    return packages, ext_modules
+
+
 def iter_setup_packages(srcdir, packages):
     """A generator that finds and imports all of the ``setup_package.py``
     modules in the source packages.
@@ -205,7 +527,7 @@ def iter_pyx_files(package_dir, package_name):
         break  # Don't recurse into subdirectories
 
 
-def get_cython_extensions(srcdir, packages, prevextensions=(), extincludedirs=None):
+def get_cython_extensions(srcdir, packages, prevextensions=(), extincludedirs=None, index=None):
     """
     Looks for Cython files and generates Extensions if needed.
 
@@ -220,12 +542,17 @@ def get_cython_extensions(srcdir, packages, prevextensions=(), extincludedirs=No
     extincludedirs : list or None
         Directories to include as the `include_dirs` argument to the generated
         `~setuptools.Extension` objects, as a list of strings.
+    index : `~extension_helpers._source_tree.SourceTreeIndex`, optional
+        An index of ``srcdir``. If given, the ``.pyx`` files are taken from
+        the index rather than by searching the package directories.
 
     Returns
     -------
     exts : list
         The new extensions that are needed to compile all .pyx files (does not
-        include any already in `prevextensions`).
+        include any already in `prevextensions`). Their ``cython_directives``
+        are set from the ``[tool.extension-helpers.cython-directives]``
+        section of ``pyproject.toml``.
     """
 
     # Vanilla setuptools and old versions of distribute include Cython files
@@ -233,27 +560,53 @@ def get_cython_extensions(srcdir, packages, prevextensions=(), extincludedirs=No
     # existing .pyx sources in the previous sources, but we should also check
     # for .c files with the same remaining filename. So we look for .pyx and
     # .c files, and we strip the extension.
-    prevsourcepaths = []
+    prevsourcepaths = set()
     ext_modules = []
+    directives_config = get_cython_directives_config(srcdir)
 
     for ext in prevextensions:
         for s in ext.sources:
             if s.endswith((".pyx", ".c", ".cpp")):
                 sourcepath = os.path.realpath(os.path.splitext(s)[0])
-                prevsourcepaths.append(sourcepath)
+                prevsourcepaths.add(sourcepath)
 
     for package_name in packages:
-        package_parts = package_name.split(".")
-        package_path = os.path.join(srcdir, *package_parts)
+        if index is None:
+            package_parts = package_name.split(".")
+            package_path = os.path.join(srcdir, *package_parts)
+            pyx_files = iter_pyx_files(package_path, package_name)
+        else:
+            pyx_files = (
+                (".".join([package_name, os.path.basename(pyxfn)[:-4]]), pyxfn)
+                for pyxfn in index.pyx_files.get(package_name, [])
+            )
 
-        for extmod, pyxfn in iter_pyx_files(package_path, package_name):
+        for extmod, pyxfn in pyx_files:
             sourcepath = os.path.realpath(os.path.splitext(pyxfn)[0])
             if sourcepath not in prevsourcepaths:
-                ext_modules.append(Extension(extmod, [pyxfn], include_dirs=extincludedirs))
+                ext = Extension(extmod, [pyxfn], include_dirs=extincludedirs)
+                directives = get_module_directives(directives_config, extmod)
+                if directives:
+                    ext.cython_directives = directives
+                ext_modules.append(ext)
 
     return ext_modules
 
 
+# In-process cache of pkg-config results, keyed by the packages, executable
+# and pkg-config search path environment variables.
+_PKG_CONFIG_RESULTS = {}
+_PKG_CONFIG_SEARCH_PATHS = {}
+
+_PKG_CONFIG_FLAG_MAP = {
+    "-I": "include_dirs",
+    "-L": "library_dirs",
+    "-l": "libraries",
+    "-D": "define_macros",
+    "-U": "undef_macros",
+}
+
+
 def pkg_config(packages, default_libraries, executable="pkg-config"):
     """
     Uses pkg-config to update a set of setuptools Extension arguments
@@ -262,6 +615,12 @@ def pkg_config(packages, default_libraries, executable="pkg-config"):
     If the pkg-config lookup fails, default_libraries is applied to
     libraries.
 
+    The results of pkg-config lookups are cached for the duration of the
+    process. If the ``EXTENSION_HELPERS_PKG_CONFIG_CACHE`` environment
+    variable is set, they are also stored in the persistent extension-helpers
+    cache, and are invalidated if any ``.pc`` file in the pkg-config search
+    path changes.
+
     Parameters
     ----------
     packages : list
@@ -286,17 +645,153 @@ def pkg_config(packages, default_libraries, executable="pkg-config"):
           the compiler
     """
 
-    flag_map = {
-        "-I": "include_dirs",
-        "-L": "library_dirs",
-        "-l": "libraries",
-        "-D": "define_macros",
-        "-U": "undef_macros",
-    }
-    command = f"{executable} --libs --cflags {' '.join(packages)}"
+    key = (
+        tuple(packages),
+        executable,
+        os.environ.get("PKG_CONFIG_PATH"),
+        os.environ.get("PKG_CONFIG_LIBDIR"),
+    )
+
+    if key not in _PKG_CONFIG_RESULTS:
+        _PKG_CONFIG_RESULTS[key] = _cached_pkg_config_lookup(packages, executable, key)
+
+    flags = _PKG_CONFIG_RESULTS[key]
 
     result = defaultdict(list)
 
+    if flags is None:
+        result["libraries"].extend(default_libraries)
+    else:
+        for name, values in flags.items():
+            if name == "define_macros":
+                result[name].extend(tuple(value) for value in values)
+            else:
+                result[name].extend(values)
+
+    return result
+
+
+def pkg_config_batch(requests, executable="pkg-config", max_workers=None):
+    """
+    Run several :func:`pkg_config` lookups concurrently.
+
+    Parameters
+    ----------
+    requests : iterable
+        The lookups to run, as ``(packages, default_libraries)`` tuples
+        with the same meaning as for :func:`pkg_config`.
+    executable : str, optional
+        The pkg-config executable to use.
+    max_workers : int, optional
+        The maximum number of pkg-config processes to run concurrently.
+        Defaults to the number of distinct lookups, capped to the number of
+        CPUs.
+
+    Returns
+    -------
+    configs : list
+        The result of :func:`pkg_config` for each request, in the same order
+        as ``requests``.
+    """
+
+    requests = [
+        (list(packages), list(default_libraries)) for packages, default_libraries in requests
+    ]
+
+    # Make sure each distinct set of packages is only looked up once, after
+    # which all requests are served from the in-process cache.
+    distinct = list({tuple(packages): packages for packages, _ in requests}.values())
+
+    if len(distinct) > 1:
+        if max_workers is None:
+            max_workers = min(len(distinct), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(lambda packages: pkg_config(packages, [], executable), distinct))
+
+    return [
+        pkg_config(packages, default_libraries, executable)
+        for packages, default_libraries in requests
+    ]
+
+
+def _get_pkg_config_search_path(executable):
+    """
+    Return the directories in which pkg-config looks for ``.pc`` files.
+    """
+
+    if "PKG_CONFIG_LIBDIR" in os.environ:
+        default_path = os.environ["PKG_CONFIG_LIBDIR"]
+    else:
+        if executable not in _PKG_CONFIG_SEARCH_PATHS:
+            pipe = subprocess.Popen(
+                f"{executable} --variable pc_path pkg-config",
+                shell=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            output = pipe.communicate()[0]
+            _PKG_CONFIG_SEARCH_PATHS[executable] = output.decode(
+                sys.getfilesystemencoding(), errors="replace"
+            ).strip()
+        default_path = _PKG_CONFIG_SEARCH_PATHS[executable]
+
+    search_path = os.environ.get("PKG_CONFIG_PATH", "").split(os.pathsep)
+    search_path.extend(default_path.split(os.pathsep))
+
+    return [directory for directory in search_path if directory]
+
+
+def _get_pc_files_fingerprint(executable):
+    """
+    Return the names, sizes and modification times of all ``.pc`` files in
+    the pkg-config search path.
+    """
+
+    fingerprint = []
+    for directory in _get_pkg_config_search_path(executable):
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".pc"):
+                        stat = entry.stat()
+                        fingerprint.append((entry.path, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            continue
+    return sorted(fingerprint)
+
+
+def _cached_pkg_config_lookup(packages, executable, key):
+    """
+    Run pkg-config, using the persistent cache if enabled.
+    """
+
+    if not get_env_flag("EXTENSION_HELPERS_PKG_CONFIG_CACHE"):
+        return _pkg_config_lookup(packages, executable)
+
+    cache_key = hash_key(*key, _get_pc_files_fingerprint(executable))
+
+    # Failed lookups are cached too, and are stored as {"flags": None}
+    cached = read_cache("pkg-config", cache_key)
+    if cached is None:
+        cached = {"flags": _pkg_config_lookup(packages, executable)}
+        write_cache("pkg-config", cache_key, cached)
+
+    return cached["flags"]
+
+
+def _pkg_config_lookup(packages, executable):
+    """
+    Run pkg-config for the given packages.
+
+    Returns
+    -------
+    flags : dict or None
+        The parsed flags, in the same format as returned by
+        :func:`pkg_config`, or `None` if the lookup failed.
+    """
+
+    command = f"{executable} --libs --cflags {' '.join(packages)}"
+
     try:
         pipe = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE)
         output = pipe.communicate()[0].strip()
@@ -308,31 +803,33 @@ def pkg_config(packages, default_libraries, executable="pkg-config"):
             f"  output: {e.output}",
         ]
         log.warning("\n".join(lines))
-        result["libraries"].extend(default_libraries)
-    else:
-        if pipe.returncode != 0:
-            lines = [
-                f"pkg-config could not lookup up package(s) {', '.join(packages)}.",
-                "This may cause the build to fail below.",
-            ]
-            log.warning("\n".join(lines))
-            result["libraries"].extend(default_libraries)
+        return None
+
+    if pipe.returncode != 0:
+        lines = [
+            f"pkg-config could not lookup up package(s) {', '.join(packages)}.",
+            "This may cause the build to fail below.",
+        ]
+        log.warning("\n".join(lines))
+        return None
+
+    flags = {}
+
+    for token in output.split():
+        # It's not clear what encoding the output of
+        # pkg-config will come to us in.  It will probably be
+        # some combination of pure ASCII (for the compiler
+        # flags) and the filesystem encoding (for any argument
+        # that includes directories or filenames), but this is
+        # just conjecture, as the pkg-config documentation
+        # doesn't seem to address it.
+        arg = token[:2].decode("ascii")
+        value = token[2:].decode(sys.getfilesystemencoding())
+        if arg in _PKG_CONFIG_FLAG_MAP:
+            if arg == "-D":
+                value = value.split("=", 1)
+            flags.setdefault(_PKG_CONFIG_FLAG_MAP[arg], []).append(value)
         else:
-            for token in output.split():
-                # It's not clear what encoding the output of
-                # pkg-config will come to us in.  It will probably be
-                # some combination of pure ASCII (for the compiler
-                # flags) and the filesystem encoding (for any argument
-                # that includes directories or filenames), but this is
-                # just conjecture, as the pkg-config documentation
-                # doesn't seem to address it.
-                arg = token[:2].decode("ascii")
-                value = token[2:].decode(sys.getfilesystemencoding())
-                if arg in flag_map:
-                    if arg == "-D":
-                        value = tuple(value.split("=", 1))
-                    result[flag_map[arg]].append(value)
-                else:
-                    result["extra_compile_args"].append(value)
+            flags.setdefault("extra_compile_args", []).append(value)
 
-    return result
+    return flags
@@ -0,0 +1,105 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module finds the C/C++ sources which are compiled identically for
+several extensions, so that they can be compiled only once and the resulting
+object files linked into each of these extensions.
+"""
+
+import logging
+import os
+from collections import namedtuple
+
+from setuptools.command.build_ext import Library
+
+__all__ = []
+
+log = logging.getLogger(__name__)
+
+SharedSource = namedtuple("SharedSource", ["source", "extensions"])
+
+_SHARED_SUFFIXES = (".c", ".cpp", ".cxx", ".cc", ".C")
+
+
+def compile_options(ext):
+    """
+    Return the options which determine how the sources of ``ext`` are
+    compiled - sources can only be shared between extensions which compile
+    them in the same way.
+    """
+
+    return (
+        tuple(tuple(macro) for macro in ext.define_macros),
+        tuple(ext.undef_macros),
+        tuple(ext.include_dirs),
+        tuple(ext.extra_compile_args),
+    )
+
+
+def _normalize(source):
+    return os.path.normcase(os.path.abspath(source))
+
+
+def find_shared_sources(extensions):
+    """
+    Find the sources which are compiled with the same options by several
+    extensions.
+
+    Only C/C++ sources are taken into account, and sources generated by
+    Cython (which have a ``.pyx`` file next to them) are never shared. The
+    setuptools ``Library`` extensions are also left alone.
+
+    Returns
+    -------
+    shared : list of `SharedSource`
+        The shared sources, in the order in which they first appear, each
+        with the extensions which use it.
+    """
+
+    users = {}
+    for ext in extensions:
+        if isinstance(ext, Library):
+            continue
+        options = compile_options(ext)
+        for source in ext.sources:
+            if not source.endswith(_SHARED_SUFFIXES) or os.path.exists(
+                os.path.splitext(source)[0] + ".pyx"
+            ):
+                continue
+            exts = users.setdefault((_normalize(source), options), (source, []))[1]
+            if ext not in exts:
+                exts.append(ext)
+
+    return [SharedSource(source, exts) for source, exts in users.values() if len(exts) > 1]
+
+
+def remove_shared_sources(ext, sources):
+    """
+    Remove ``sources`` from the sources of ``ext`` and add them to its
+    ``depends`` instead, so that the extension is still linked again when
+    they change.
+    """
+
+    normalized = {_normalize(source) for source in sources}
+    ext.sources = [source for source in ext.sources if _normalize(source) not in normalized]
+    ext.depends = list(ext.depends) + [source for source in sources if source not in ext.depends]
+
+
+def is_outdated(target, sources):
+    """
+    Return whether ``target`` does not exist or is older than any of
+    ``sources`` which exist.
+    """
+
+    try:
+        target_mtime = os.path.getmtime(target)
+    except OSError:
+        return True
+
+    for source in sources:
+        try:
+            if os.path.getmtime(source) > target_mtime:
+                return True
+        except OSError:
+            pass
+
+    return False
@@ -0,0 +1,280 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements SIMD multi-target builds, in which an extension is
+built several times with different instruction set flags, and the variant
+best suited to the CPU is selected when the extension is imported.
+"""
+
+import copy
+import logging
+import os
+from collections import namedtuple
+
+from setuptools import Extension
+from setuptools.command.build_ext import new_compiler
+
+from ._probes import Probe, run_probes
+from ._utils import write_if_different
+
+__all__ = ["add_simd_variants"]
+
+log = logging.getLogger(__name__)
+
+SimdTarget = namedtuple("SimdTarget", ["features", "flags", "msvc_flags", "macro"])
+
+# The targets which variants can be built for, from the most to the least
+# capable. The features are the names reported by the _cpu_features module,
+# and the macro is defined by the compiler when the flags are used.
+SIMD_TARGETS = {
+    "avx512": SimdTarget(
+        ("avx", "avx2", "fma", "avx512f", "avx512cd", "avx512bw", "avx512dq", "avx512vl"),
+        ["-mavx512f", "-mavx512cd", "-mavx512bw", "-mavx512dq", "-mavx512vl", "-mavx2", "-mfma"],
+        ["/arch:AVX512"],
+        "__AVX512F__",
+    ),
+    "avx2": SimdTarget(("avx", "avx2", "fma"), ["-mavx2", "-mfma"], ["/arch:AVX2"], "__AVX2__"),
+    "avx": SimdTarget(("avx",), ["-mavx"], ["/arch:AVX"], "__AVX__"),
+}
+
+# The macro defined when building each variant, followed by the target name
+TARGET_MACRO_PREFIX = "EXTENSION_HELPERS_SIMD_TARGET_"
+
+_TARGET_CODE = """
+#ifndef {macro}
+#error the flags do not enable {target}
+#endif
+
+int main(void) {{
+  return 0;
+}}
+"""
+
+_DISPATCH_SRC = """\
+# Autogenerated by {packagename}'s setup.py - this module imports the variant
+# of the {name} extension best suited to the CPU.
+import importlib as _importlib
+
+from {packagename}.cpu_features import get_simd_target as _get_simd_target
+
+__simd_target__ = _get_simd_target({targets!r})
+
+_variant = _importlib.import_module(__name__ + "_" + __simd_target__)
+_skipped = (
+    "__name__",
+    "__file__",
+    "__spec__",
+    "__loader__",
+    "__package__",
+    "__cached__",
+    "__builtins__",
+)
+for _key, _value in vars(_variant).items():
+    if _key not in _skipped:
+        globals()[_key] = _value
+
+del _importlib, _get_simd_target, _variant, _skipped, _key, _value
+"""
+
+_CPU_FEATURES_SRC = """\
+# Autogenerated by {packagename}'s setup.py
+\"\"\"
+Detection of the SIMD features of the CPU, used to select the variant of
+extensions built for several SIMD targets.
+\"\"\"
+
+from ._cpu_features import features as _features
+
+__all__ = ["get_cpu_features", "get_simd_target"]
+
+SIMD_FEATURES = {simd_features!r}
+
+
+def get_cpu_features():
+    \"\"\"
+    Return the set of SIMD features supported by the CPU and the operating
+    system.
+    \"\"\"
+    return _features
+
+
+def get_simd_target(targets):
+    \"\"\"
+    Return the first of ``targets`` supported by the CPU, or ``'baseline'`` if
+    none of them are.
+    \"\"\"
+    for target in targets:
+        if _features.issuperset(SIMD_FEATURES[target]):
+            return target
+    return "baseline"
+"""
+
+
+def get_simd_flags(compiler_type, target):
+    """
+    Return the compiler flags which enable the instructions of ``target``.
+    """
+
+    if compiler_type == "msvc":
+        return list(SIMD_TARGETS[target].msvc_flags)
+    return list(SIMD_TARGETS[target].flags)
+
+
+def get_supported_simd_targets(targets, compiler_type=None):
+    """
+    Return the targets from ``targets`` for which the compiler can generate
+    code, checking all of them concurrently.
+    """
+
+    if compiler_type is None:
+        compiler_type = new_compiler().compiler_type
+
+    probes = [
+        Probe(
+            _TARGET_CODE.format(macro=SIMD_TARGETS[target].macro, target=target),
+            description=f"{target} support",
+            extra_compile_args=get_simd_flags(compiler_type, target),
+        )
+        for target in targets
+    ]
+    return [
+        target for target, result in zip(targets, run_probes(probes), strict=True) if result.success
+    ]
+
+
+def is_simd_variant(extension):
+    """
+    Return whether ``extension`` is a variant created by `add_simd_variants`.
+    """
+
+    return any(name.startswith(TARGET_MACRO_PREFIX) for name, _ in extension.define_macros)
+
+
+def _make_variant(extension, target, flags):
+    package, _, module = extension.name.rpartition(".")
+
+    variant = copy.copy(extension)
+    variant.name = f"{package}.{module}_{target}"
+    variant.extra_compile_args = [*extension.extra_compile_args, *flags]
+    variant.define_macros = [
+        *extension.define_macros,
+        # The module initialization function needs to match the name of the
+        # variant, so it is renamed by the preprocessor.
+        (f"PyInit_{module}", f"PyInit_{module}_{target}"),
+        (TARGET_MACRO_PREFIX + target.upper(), None),
+    ]
+    for attr in ("sources", "include_dirs", "libraries", "library_dirs", "extra_link_args"):
+        setattr(variant, attr, list(getattr(extension, attr)))
+    variant.depends = list(extension.depends)
+    return variant
+
+
+def add_simd_variants(extension, targets=("avx512", "avx2"), srcdir="."):
+    """
+    Build an extension for several SIMD targets and select the best variant
+    at import time.
+
+    For each of ``targets`` that the compiler supports, a variant of the
+    extension is built with the flags enabling the instructions of the target
+    (for instance ``-mavx2 -mfma`` or ``/arch:AVX2``), and a baseline variant
+    is built with the original flags. The variants are named after the
+    extension followed by ``_<target>`` or ``_baseline``, and a module with
+    the name of the extension is written to the source tree, which imports
+    the best variant supported by the CPU and exposes its content.
+
+    The CPU features are detected by the ``cpu_features`` module which
+    :func:`~extension_helpers.get_extensions` adds to the top-level package.
+    Each variant is compiled with the macro
+    ``EXTENSION_HELPERS_SIMD_TARGET_<TARGET>`` defined, e.g.
+    ``EXTENSION_HELPERS_SIMD_TARGET_AVX2`` or
+    ``EXTENSION_HELPERS_SIMD_TARGET_BASELINE``.
+
+    Parameters
+    ----------
+    extension : `setuptools.Extension`
+        The extension, which should be made up of C/C++ sources and be part of
+        a package.
+    targets : iterable of str, optional
+        The SIMD targets to build variants for, among ``'avx512'``,
+        ``'avx2'`` and ``'avx'``.
+    srcdir : str, optional
+        The root of the source tree, in which the dispatch module is written.
+
+    Returns
+    -------
+    extensions : list of `setuptools.Extension`
+        The variants of the extension, which should be built instead of it.
+    """
+
+    unknown = [target for target in targets if target not in SIMD_TARGETS]
+    if unknown:
+        raise ValueError(
+            f"Unknown SIMD targets {', '.join(unknown)}, should be among "
+            f"{', '.join(SIMD_TARGETS)}"
+        )
+
+    package = extension.name.rpartition(".")[0]
+    if not package:
+        raise ValueError(f"The extension {extension.name} should be part of a package")
+    if any(source.endswith(".pyx") for source in extension.sources):
+        raise ValueError(
+            f"SIMD variants can only be built for C/C++ extensions, but {extension.name} "
+            "has Cython sources"
+        )
+
+    # Most capable targets first, as they are checked in order at import time
+    targets = [target for target in SIMD_TARGETS if target in targets]
+
+    compiler_type = new_compiler().compiler_type
+    supported = get_supported_simd_targets(targets, compiler_type=compiler_type)
+    if supported:
+        log.info("building %s for SIMD targets: %s", extension.name, ", ".join(supported))
+    else:
+        log.info("no SIMD targets supported by the compiler, building %s as is", extension.name)
+
+    variants = [
+        _make_variant(extension, target, get_simd_flags(compiler_type, target))
+        for target in supported
+    ]
+    variants.append(_make_variant(extension, "baseline", []))
+
+    dispatch_src = _DISPATCH_SRC.format(
+        packagename=package.split(".")[0],
+        name=extension.name,
+        targets=tuple(supported),
+    )
+    filename = os.path.join(srcdir, *extension.name.split(".")) + ".py"
+    write_if_different(filename, dispatch_src.encode("utf-8"))
+
+    return variants
+
+
+def generate_cpu_features_py(packagename, srcdir="."):
+    """
+    Generate ``package.cpu_features``, which detects the SIMD features of the
+    CPU at import time, and return the extension it relies on.
+
+    The files are only written if their content changes, so that they do not
+    appear modified after every build.
+
+    Returns
+    -------
+    extension : `setuptools.Extension`
+        The ``package._cpu_features`` extension, which should be built along
+        with the other extensions.
+    """
+
+    package_srcdir = os.path.join(srcdir, *packagename.split("."))
+
+    src = _CPU_FEATURES_SRC.format(
+        packagename=packagename,
+        simd_features={name: target.features for name, target in SIMD_TARGETS.items()},
+    )
+    write_if_different(os.path.join(package_srcdir, "cpu_features.py"), src.encode("utf-8"))
+
+    src_path = os.path.join(os.path.dirname(__file__), "src")
+    with open(os.path.join(src_path, "cpu_features.c"), "rb") as f:
+        write_if_different(os.path.join(package_srcdir, "_cpu_features.c"), f.read())
+
+    return Extension(
+        packagename + "._cpu_features", [os.path.join(package_srcdir, "_cpu_features.c")]
+    )
@@ -0,0 +1,175 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements a single-pass indexer for source trees, which is used
+to find packages, ``setup_package.py`` files and ``.pyx`` files without
+walking the tree several times.
+"""
+
+import fnmatch
+import os
+
+from ._utils import _has_hidden_attribute, get_extension_helpers_config
+
+__all__ = []
+
+# Directories which are never searched for packages or sources. The build
+# and dist directories are only ignored at the root of the tree, since
+# packages can have sub-packages with these names.
+DEFAULT_IGNORE = ("/build", "/dist", "__pycache__", "*.egg-info")
+
+SOURCE_EXTENSIONS = (".c", ".cc", ".cpp", ".cxx")
+
+
+class SourceTreeIndex:
+    """
+    An index of the packages and source files in a source tree.
+
+    Attributes
+    ----------
+    srcdir : str
+        The root of the source tree.
+    packages : list
+        The names of all packages, in the same form as returned by
+        `setuptools.find_packages`, sorted alphabetically.
+    setup_packages : dict
+        The path to the ``setup_package.py`` file of each package that has
+        one, keyed by package name.
+    pyx_files : dict
+        The paths to the ``.pyx`` files directly inside each package, keyed by
+        package name.
+    """
+
+    def __init__(self, srcdir):
+        self.srcdir = srcdir
+        self.packages = []
+        self.setup_packages = {}
+        self.pyx_files = {}
+
+
+def get_ignore_patterns(srcdir):
+    """
+    Return the patterns for directories to ignore when indexing ``srcdir``.
+
+    In addition to `DEFAULT_IGNORE`, this includes any patterns listed in the
+    ``ignore`` option of the ``[tool.extension-helpers]`` section of
+    ``pyproject.toml``, as well as the directory patterns (i.e. the patterns
+    ending in ``/``) in the top-level ``.gitignore`` file.
+    """
+
+    patterns = list(DEFAULT_IGNORE)
+
+    patterns.extend(get_extension_helpers_config(srcdir).get("ignore", []))
+
+    try:
+        with open(os.path.join(srcdir, ".gitignore"), encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except (OSError, UnicodeDecodeError):
+        lines = []
+
+    for line in lines:
+        line = line.strip()
+        # Only consider patterns that explicitly refer to directories, since
+        # ignoring files could hide sources that are generated during builds.
+        if line.endswith("/") and not line.startswith(("#", "!")):
+            patterns.append(line)
+
+    return patterns
+
+
+def _is_ignored(name, relpath, patterns):
+    for pattern in patterns:
+        pattern = pattern.rstrip("/")
+        if "/" in pattern:
+            if fnmatch.fnmatch(relpath, pattern.lstrip("/")):
+                return True
+        elif fnmatch.fnmatch(name, pattern):
+            return True
+    return False
+
+
+def _is_hidden(entry):
+    return entry.name.startswith(".") or _has_hidden_attribute(entry.path)
+
+
+def index_source_tree(srcdir, ignore=DEFAULT_IGNORE):
+    """
+    Index the packages and source files in ``srcdir`` using a single
+    traversal of the tree.
+
+    Hidden files and directories are always skipped. Packages are found using
+    the same rules as `setuptools.find_packages`, and as with it, only the
+    root of the tree and the directories of packages are searched, so that
+    large directories which are not part of any package (such as data or
+    documentation) are not traversed.
+
+    Parameters
+    ----------
+    srcdir : str
+        The root of the source tree.
+    ignore : iterable of str, optional
+        Glob-style patterns for directories to skip. Patterns containing a
+        ``/`` are matched against the path of the directory relative to
+        ``srcdir`` (using ``/`` as separator), and other patterns against the
+        name of the directory.
+
+    Returns
+    -------
+    index : `SourceTreeIndex`
+    """
+
+    ignore = tuple(ignore)
+    index = SourceTreeIndex(srcdir)
+
+    # Each item is (path, relative path, package name), where the package
+    # name is empty for the root directory.
+    stack = [(srcdir, "", "")]
+
+    while stack:
+        path, relpath, package = stack.pop()
+
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        filenames = []
+        subdirs = []
+
+        for entry in entries:
+            if _is_hidden(entry):
+                continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                subdirs.append(entry)
+            else:
+                filenames.append(entry.name)
+
+        if package:
+            index.packages.append(package)
+            if "setup_package.py" in filenames:
+                index.setup_packages[package] = os.path.join(path, "setup_package.py")
+            pyx_files = [os.path.join(path, fn) for fn in filenames if fn.endswith(".pyx")]
+            if pyx_files:
+                index.pyx_files[package] = pyx_files
+
+        # Push sub-packages in reverse order so that they are processed in
+        # alphabetical order. As done by find_packages, directories which are
+        # not packages are not searched any further.
+        for entry in reversed(subdirs):
+            if "." in entry.name:
+                continue
+            sub_relpath = f"{relpath}/{entry.name}" if relpath else entry.name
+            if _is_ignored(entry.name, sub_relpath, ignore):
+                continue
+            if not os.path.isfile(os.path.join(entry.path, "__init__.py")):
+                continue
+            sub_package = f"{package}.{entry.name}" if package else entry.name
+            stack.append((entry.path, sub_relpath, sub_package))
+
+    index.packages.sort()
+
+    return index
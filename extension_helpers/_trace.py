@@ -0,0 +1,269 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements an optional recorder for the time and resources used
+by each step of a build (Cython translation, compilation and linking), which
+are written out in the Chrome trace event format. Trace files can be viewed
+with https://ui.perfetto.dev or ``chrome://tracing``.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from setuptools.errors import ExecError
+
+from ._source_tree import SOURCE_EXTENSIONS
+from ._utils import _write_atomic, get_compiler_runner
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+__all__ = []
+
+log = logging.getLogger(__name__)
+
+# Extensions of the files compiled by compilers - these are used to find the
+# name of the file compiled by a compiler command.
+_COMPILED_EXTENSIONS = (*SOURCE_EXTENSIONS, ".m", ".mm", ".C", ".c++")
+
+# ru_maxrss is in bytes on macOS and in kilobytes on other platforms
+_MAXRSS_TO_MB = 1 / 1024**2 if sys.platform == "darwin" else 1 / 1024
+
+
+def get_trace_filename():
+    """
+    Return the file to which the build trace should be written, as set by the
+    ``EXTENSION_HELPERS_TRACE`` environment variable, or `None` if tracing is
+    disabled.
+    """
+    return os.environ.get("EXTENSION_HELPERS_TRACE") or None
+
+
+def get_resource_usage():
+    """
+    Return the CPU time (in seconds) and the peak memory use (in MB) of the
+    current process, or `None` for both if these are not available.
+    """
+    if resource is None:
+        return None, None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime, usage.ru_maxrss * _MAXRSS_TO_MB
+
+
+def _basename(path):
+    # Commands may use either separator on Windows
+    return path.replace("\\", "/").rsplit("/", 1)[-1]
+
+
+def _describe_command(cmd):
+    # Determine the type of step and the main file for a compiler or linker
+    # command, e.g. ('compile', 'module.c') or ('link', 'module.so').
+    if "-c" in cmd or "/c" in cmd:
+        for arg in cmd:
+            if arg.startswith(("/Tc", "/Tp")):
+                arg = arg[3:]
+            if arg.endswith(_COMPILED_EXTENSIONS):
+                return "compile", _basename(arg)
+        return "compile", _basename(cmd[0])
+    for i, arg in enumerate(cmd):
+        if arg == "-o" and i + 1 < len(cmd):
+            return "link", _basename(cmd[i + 1])
+        if arg.upper().startswith("/OUT:"):
+            return "link", _basename(arg[5:])
+    return "link", _basename(cmd[0])
+
+
+class BuildTrace:
+    """
+    A recorder for the steps of a build.
+
+    Each step is recorded as a 'complete' event in the Chrome trace event
+    format, with the wall time, the CPU time and the peak memory use of the
+    step as arguments. Steps are associated with the extension set by
+    :meth:`extension` in the current thread.
+
+    Parameters
+    ----------
+    filename : str
+        The file to which the trace is written by :meth:`write`.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread_ids = {}
+
+    @contextlib.contextmanager
+    def extension(self, name):
+        """
+        Associate the steps recorded in the current thread with the
+        extension ``name``.
+        """
+        previous = getattr(self._local, "extension", None)
+        self._local.extension = name
+        try:
+            yield
+        finally:
+            self._local.extension = previous
+
+    def current_extension(self):
+        return getattr(self._local, "extension", None)
+
+    def add_event(self, name, category, start, end, cpu_time=None, max_rss=None, **args):
+        """
+        Record a step.
+
+        Parameters
+        ----------
+        name : str
+            The name of the step, typically the file processed.
+        category : str
+            The type of step, e.g. ``'compile'``.
+        start, end : float
+            The start and end of the step, as returned by `time.perf_counter`.
+        cpu_time : float, optional
+            The CPU time used by the step, in seconds.
+        max_rss : float, optional
+            The peak memory use of the step, in MB.
+        **args
+            Additional information to include in the event. By default, the
+            ``extension`` and ``pid`` are taken from the current thread and
+            process.
+        """
+
+        args.setdefault("extension", self.current_extension())
+        pid = args.pop("pid", os.getpid())
+
+        with self._lock:
+            tid = self._thread_ids.setdefault((pid, threading.get_ident()), len(self._thread_ids))
+            self.events.append(
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": start * 1e6,
+                    "dur": (end - start) * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"cpu_time": cpu_time, "max_rss": max_rss, **args},
+                }
+            )
+
+    def trace_compiler(self, ccompiler):
+        """
+        Record each command run by ``ccompiler`` as a step.
+        """
+        runner = get_compiler_runner(ccompiler)
+        original_run = getattr(ccompiler, runner)
+
+        def run(cmd, **kwargs):
+            start = time.perf_counter()
+            cpu_time = max_rss = None
+            if hasattr(os, "wait4"):
+                cpu_time, max_rss = self._run(cmd, translate_errors=runner == "spawn", **kwargs)
+            else:
+                original_run(cmd, **kwargs)
+            category, name = _describe_command(cmd)
+            self.add_event(name, category, start, time.perf_counter(), cpu_time, max_rss)
+
+        setattr(ccompiler, runner, run)
+
+    def _run(self, cmd, env=None, translate_errors=False, **kwargs):
+        # This mirrors the call method of compilers (or distutils.spawn.spawn
+        # if translate_errors is set), but uses os.wait4 to obtain the
+        # resources used by the process.
+        log.info(subprocess.list2cmdline(cmd))
+
+        if sys.platform == "darwin":
+            from distutils.util import MACOSX_VERSION_VAR, get_macosx_target_ver
+
+            target = get_macosx_target_ver()
+            if target:
+                env = {**(env if env is not None else os.environ), MACOSX_VERSION_VAR: target}
+
+        try:
+            process = subprocess.Popen(cmd, env=env)
+        except OSError as exc:
+            if translate_errors:
+                raise ExecError(f"command {cmd[0]!r} failed: {exc.args[-1]}") from exc
+            raise
+
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        if process.returncode:
+            if translate_errors:
+                raise ExecError(f"command {cmd[0]!r} failed with exit code {process.returncode}")
+            raise subprocess.CalledProcessError(process.returncode, cmd)
+
+        return usage.ru_utime + usage.ru_stime, usage.ru_maxrss * _MAXRSS_TO_MB
+
+    def get_summary(self):
+        """
+        Return the total wall time, CPU time and peak memory use for each
+        extension, sorted by decreasing cost.
+
+        Returns
+        -------
+        summary : list of tuple
+            A list of ``(extension, steps, wall_time, cpu_time, max_rss)``
+            tuples. The CPU time and peak memory use are `None` if they were
+            not measured for any step.
+        """
+
+        totals = {}
+        for event in self.events:
+            name = event["args"]["extension"] or "(other)"
+            steps, wall_time, cpu_time, max_rss = totals.get(name, (0, 0.0, None, None))
+            if event["args"]["cpu_time"] is not None:
+                cpu_time = (cpu_time or 0.0) + event["args"]["cpu_time"]
+            if event["args"]["max_rss"] is not None:
+                max_rss = max(max_rss or 0.0, event["args"]["max_rss"])
+            totals[name] = (steps + 1, wall_time + event["dur"] / 1e6, cpu_time, max_rss)
+
+        summary = [(name, *values) for name, values in totals.items()]
+        summary.sort(key=lambda item: item[3] if item[3] is not None else item[2], reverse=True)
+        return summary
+
+    def format_summary(self):
+        """
+        Return the summary returned by :meth:`get_summary` as a table.
+        """
+
+        def format_value(value, fmt):
+            return "-" if value is None else format(value, fmt)
+
+        rows = [("extension", "steps", "wall [s]", "cpu [s]", "peak RSS [MB]")]
+        for name, steps, wall_time, cpu_time, max_rss in self.get_summary():
+            rows.append(
+                (
+                    name,
+                    str(steps),
+                    format_value(wall_time, ".2f"),
+                    format_value(cpu_time, ".2f"),
+                    format_value(max_rss, ".1f"),
+                )
+            )
+
+        width = max(len(row[0]) for row in rows)
+        return "\n".join(
+            f"{name:<{width}}  {steps:>5}  {wall:>8}  {cpu:>8}  {rss:>13}"
+            for name, steps, wall, cpu, rss in rows
+        )
+
+    def write(self):
+        """
+        Write the trace to :attr:`filename`.
+        """
+        with self._lock:
+            data = {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+        _write_atomic(self.filename, json.dumps(data, indent=1).encode("utf-8"))
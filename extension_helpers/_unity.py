@@ -0,0 +1,180 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+"""
+This module implements unity (or 'jumbo') builds, in which the C/C++ sources
+of an extension are merged into a few generated translation units that
+``#include`` them. For extensions with many small sources, this avoids
+starting the compiler and parsing the same headers for every source.
+"""
+
+import fnmatch
+import logging
+import math
+import os
+
+from ._utils import get_extension_helpers_config, write_if_different
+
+__all__ = []
+
+log = logging.getLogger(__name__)
+
+# The suffix of the generated translation unit for each type of source which
+# can be merged. Other sources (for instance Fortran or Objective-C sources)
+# are compiled separately as usual.
+UNITY_SUFFIXES = {".c": ".c", ".cpp": ".cpp", ".cxx": ".cpp", ".cc": ".cpp", ".C": ".cpp"}
+
+_HEADER = "/* Generated by extension-helpers for the unity build of {name} - do not edit */\n"
+
+
+def get_unity_build_options(srcdir="."):
+    """
+    Determine whether unity builds are enabled.
+
+    The number of translation units per extension is set with the
+    ``EXTENSION_HELPERS_UNITY_BUILD`` environment variable or, if this is not
+    set, the ``unity-build`` option in the ``[tool.extension-helpers]`` section
+    of ``pyproject.toml``. Sources which cannot be merged with others are
+    listed as glob-style patterns in the ``unity-build-exclude`` option.
+
+    Returns
+    -------
+    units : int
+        The maximum number of translation units per extension, or 0 if unity
+        builds are disabled.
+    exclude : list of str
+        The patterns of the sources which should not be merged.
+    """
+
+    config = get_extension_helpers_config(srcdir)
+
+    units = os.environ.get("EXTENSION_HELPERS_UNITY_BUILD", "").strip()
+    if not units:
+        units = config.get("unity-build", 0)
+
+    try:
+        units = int(units)
+    except ValueError:
+        raise ValueError(
+            f"EXTENSION_HELPERS_UNITY_BUILD should be an integer, got {units!r}"
+        ) from None
+
+    return max(0, units), list(config.get("unity-build-exclude", []))
+
+
+def _is_excluded(source, patterns, root):
+    # As for ignored directories, patterns containing a / are matched against
+    # the path relative to the root, and other patterns against the name.
+    relative = os.path.relpath(os.path.abspath(source), root).replace(os.sep, "/")
+    name = os.path.basename(source)
+    return any(
+        fnmatch.fnmatchcase(relative if "/" in pattern else name, pattern) for pattern in patterns
+    )
+
+
+def _include_path(source, directory):
+    try:
+        path = os.path.relpath(source, directory)
+    except ValueError:  # Different drives on Windows
+        path = os.path.abspath(source)
+    return path.replace(os.sep, "/")
+
+
+def apply_unity_build(extensions, build_dir, units, exclude=(), root="."):
+    """
+    Replace the C/C++ sources of extensions by unity translation units.
+
+    For each extension, the C sources and the C++ sources are each split into
+    at most ``units`` groups of at least two consecutive sources, and each
+    group is replaced by a generated file in ``build_dir`` which includes the
+    sources of the group. The merged sources are added to the ``depends`` of
+    the extension. Generated files are only written if their content changes,
+    so that they do not cause unnecessary recompilation.
+
+    Sources matching ``exclude``, sources generated by Cython (which have a
+    ``.pyx`` file next to them) and extensions with a single source of each
+    type are left unchanged.
+
+    Parameters
+    ----------
+    extensions : list of `setuptools.Extension`
+        The extensions to process.
+    build_dir : str
+        The directory in which to write the generated files.
+    units : int
+        The maximum number of translation units per extension and language.
+    exclude : iterable of str, optional
+        Glob-style patterns of sources which should be compiled separately.
+    root : str, optional
+        The directory relative to which patterns containing a ``/`` are
+        matched.
+
+    Returns
+    -------
+    generated : list of str
+        The generated translation units.
+    """
+
+    if units < 1:
+        return []
+
+    exclude = list(exclude)
+    root = os.path.abspath(root)
+    build_dir_abs = os.path.abspath(build_dir)
+
+    generated = []
+
+    for ext in extensions:
+        groups = {}
+        for source in ext.sources:
+            suffix = UNITY_SUFFIXES.get(os.path.splitext(source)[1])
+            if (
+                suffix is None
+                # Translation units generated by a previous run
+                or os.path.abspath(source).startswith(build_dir_abs + os.sep)
+                or os.path.exists(os.path.splitext(source)[0] + ".pyx")
+                or _is_excluded(source, exclude, root)
+            ):
+                continue
+            groups.setdefault(suffix, []).append(source)
+
+        directory = os.path.join(build_dir, *ext.name.split("."))
+        unity_sources = []
+        merged = set()
+
+        for suffix, sources in groups.items():
+            if len(sources) < 2:
+                continue
+
+            os.makedirs(directory, exist_ok=True)
+
+            # Consecutive sources are grouped together, so that adding or
+            # removing a source only changes the units around it. Each unit
+            # merges at least two sources.
+            size = math.ceil(len(sources) / min(units, len(sources) // 2))
+            for index, start in enumerate(range(0, len(sources), size)):
+                filename = os.path.join(directory, f"unity_{suffix[1:]}{index}{suffix}")
+                content = _HEADER.format(name=ext.name) + "".join(
+                    f'#include "{_include_path(source, directory)}"\n'
+                    for source in sources[start : start + size]
+                )
+                write_if_different(filename, content.encode("utf-8"))
+                unity_sources.append(filename)
+                merged.update(sources[start : start + size])
+
+        if not merged:
+            continue
+
+        log.debug(
+            "unity build of %s: %d sources merged into %d translation units",
+            ext.name,
+            len(merged),
+            len(unity_sources),
+        )
+
+        merged_sources = [source for source in ext.sources if source in merged]
+        ext.sources = [source for source in ext.sources if source not in merged] + unity_sources
+        ext.depends = list(ext.depends) + [
+            source for source in merged_sources if source not in ext.depends
+        ]
+        generated.extend(unity_sources)
+
+    return generated
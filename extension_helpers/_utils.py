@@ -4,6 +4,7 @@ import os
 import re
 import sys
 import tempfile
+import uuid
 from configparser import ConfigParser
 from importlib import machinery as import_machinery
 from importlib.util import module_from_spec, spec_from_file_location
@@ -58,7 +59,10 @@ def is_path_hidden(filepath):
         Returns `True` if the file is hidden
     """
 
-    name = os.path.basename(os.path.abspath(filepath))
+    name = os.path.basename(filepath)
+    # Only resolve the path if needed, e.g. for '.', '..' or trailing slashes
+    if name in ("", ".", "..", b"", b".", b".."):
+        name = os.path.basename(os.path.abspath(filepath))
     if isinstance(name, bytes):
         is_dotted = name.startswith(b".")
     else:
@@ -66,6 +70,34 @@ def is_path_hidden(filepath):
     return is_dotted or _has_hidden_attribute(filepath)
 
 
+def get_env_flag(name, default=False):
+    """
+    Interpret the environment variable ``name`` as a boolean flag.
+
+    The values ``1``, ``true``, ``yes`` and ``on`` (in any case) are
+    considered true, any other non-empty value is considered false. If the
+    variable is not set or is empty, ``default`` is returned.
+    """
+
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def get_compiler_runner(ccompiler):
+    """
+    Return the name of the method which ``ccompiler`` uses to run commands.
+
+    Recent versions of setuptools run the compiler and linker commands with
+    ``call``, which raises the exceptions of `subprocess`, and deprecate
+    ``spawn``, which raises `~setuptools.errors.ExecError` and is the only
+    method available in older versions.
+    """
+
+    return "call" if hasattr(ccompiler, "call") else "spawn"
+
+
 def walk_skip_hidden(top, onerror=None, followlinks=False):
     """
     A wrapper for `os.walk` that skips hidden files and directories.
@@ -87,12 +119,38 @@ def walk_skip_hidden(top, onerror=None, followlinks=False):
         yield root, dirs, files
 
 
+def _write_atomic(filename, data):
+    """
+    Write ``data`` to ``filename`` atomically.
+
+    The data is first written to a temporary file in the same directory which
+    is then moved into place, so that concurrent readers (for example parallel
+    builds sharing a cache directory) never see a partially written file.
+    """
+
+    filepath = Path(filename)
+    tmp_path = filepath.with_name(f".{filepath.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+    try:
+        # Opening the file normally (rather than with tempfile.mkstemp) means
+        # that the file permissions follow the umask, as for any other file.
+        with open(tmp_path, "xb") as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
 def write_if_different(filename, data):
     """
     Write ``data`` to ``filename``, if the content of the file is different.
 
     This can be useful if e.g. generating ``.c`` or ``.h`` files, to make sure
-    that Python does not re-build unchanged files.
+    that Python does not re-build unchanged files. If the file is written, it
+    is replaced atomically.
 
     Parameters
     ----------
@@ -112,7 +170,7 @@ def write_if_different(filename, data):
         original_data = None
 
     if original_data != data:
-        filepath.write_bytes(data)
+        _write_atomic(filepath, data)
 
 
 def import_file(filename, name=None):
@@ -149,6 +207,23 @@ def import_file(filename, name=None):
     return mod
 
 
+def get_extension_helpers_config(srcdir):
+    """
+    Return the ``[tool.extension-helpers]`` section of the ``pyproject.toml``
+    file in ``srcdir`` as a dictionary, or an empty dictionary if there is no
+    such file or section.
+    """
+
+    pyproject = Path(srcdir) / "pyproject.toml"
+    if not pyproject.exists():
+        return {}
+
+    with pyproject.open("rb") as f:
+        pyproject_cfg = tomllib.load(f)
+
+    return pyproject_cfg.get("tool", {}).get("extension-helpers", {})
+
+
 def get_limited_api_option(srcdir):
     """
     Checks setup.cfg and pyproject.toml files in the current directory
@@ -7,6 +7,8 @@
 import glob
 import os
 
+import pytest
+
 try:
     from coverage import CoverageData
     from coverage import __version__ as coverage_version
@@ -21,6 +23,17 @@ else:
 SUBPROCESS_COVERAGE = []
 
 
+@pytest.fixture(autouse=True)
+def _isolate_extension_helpers_cache(tmp_path_factory, monkeypatch):
+    # Make sure that the tests never read from or write to the user's
+    # persistent cache, and that results cached in-process by one test do not
+    # leak into another.
+    from ._probes import _PROBE_RESULTS
+
+    monkeypatch.setenv("EXTENSION_HELPERS_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
+    _PROBE_RESULTS.clear()
+
+
 def pytest_configure(config):
     if HAS_COVERAGE:
         SUBPROCESS_COVERAGE.clear()
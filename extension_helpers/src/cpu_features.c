@@ -0,0 +1,181 @@
+#include <Python.h>
+
+/***************************************************************************
+ * Runtime detection of the SIMD features supported by the CPU and the
+ * operating system, used to select the SIMD variant of extensions.
+ ***************************************************************************/
+
+#if defined(__x86_64__) || defined(__i386__) || defined(_M_X64) || defined(_M_IX86)
+#    define HAVE_X86 1
+#endif
+
+#if defined(HAVE_X86) && defined(_MSC_VER)
+#    include <intrin.h>
+#elif defined(HAVE_X86) && (defined(__GNUC__) || defined(__clang__))
+#    include <cpuid.h>
+#else
+#    undef HAVE_X86
+#endif
+
+#if defined(HAVE_X86) && defined(__APPLE__)
+#    include <sys/sysctl.h>
+#endif
+
+#ifdef HAVE_X86
+
+static void cpuid(unsigned int leaf, unsigned int subleaf, unsigned int regs[4]) {
+#    ifdef _MSC_VER
+  int info[4];
+  __cpuidex(info, (int)leaf, (int)subleaf);
+  regs[0] = (unsigned int)info[0];
+  regs[1] = (unsigned int)info[1];
+  regs[2] = (unsigned int)info[2];
+  regs[3] = (unsigned int)info[3];
+#    else
+  __cpuid_count(leaf, subleaf, regs[0], regs[1], regs[2], regs[3]);
+#    endif
+}
+
+static unsigned long long xgetbv(void) {
+#    ifdef _MSC_VER
+  return _xgetbv(0);
+#    else
+  unsigned int eax, edx;
+  __asm__ volatile("xgetbv" : "=a"(eax), "=d"(edx) : "c"(0));
+  return ((unsigned long long)edx << 32) | eax;
+#    endif
+}
+
+static int avx512_enabled(unsigned long long xcr0) {
+#    ifdef __APPLE__
+  /* macOS only enables the AVX-512 state once a thread uses it, so XCR0 does
+     not tell whether it is supported. */
+  int enabled = 0;
+  size_t size = sizeof(enabled);
+  (void)xcr0;
+  if (sysctlbyname("hw.optional.avx512f", &enabled, &size, NULL, 0) != 0) {
+    return 0;
+  }
+  return enabled;
+#    else
+  /* The opmask, upper ZMM and high ZMM registers as well as the AVX state */
+  return (xcr0 & 0xe6) == 0xe6;
+#    endif
+}
+
+#endif
+
+static int add_feature(PyObject *features, const char *name) {
+  PyObject *feature = PyUnicode_FromString(name);
+  int result;
+  if (feature == NULL) {
+    return -1;
+  }
+  result = PySet_Add(features, feature);
+  Py_DECREF(feature);
+  return result;
+}
+
+static int add_features(PyObject *features) {
+#ifdef HAVE_X86
+  unsigned int regs[4];
+  unsigned long long xcr0;
+  int max_leaf, avx_enabled;
+
+  cpuid(0, 0, regs);
+  max_leaf = (int)regs[0];
+  if (max_leaf < 1) {
+    return 0;
+  }
+
+#    define ADD_FEATURE(condition, name)                    \
+      if ((condition) && add_feature(features, name) < 0) { \
+        return -1;                                          \
+      }
+
+  cpuid(1, 0, regs);
+  ADD_FEATURE(regs[2] & (1u << 20), "sse4.2")
+
+  /* The AVX registers can only be used if the operating system saves them */
+  if (!(regs[2] & (1u << 27))) {
+    return 0;
+  }
+  xcr0 = xgetbv();
+  avx_enabled = (xcr0 & 0x6) == 0x6;
+  if (!avx_enabled) {
+    return 0;
+  }
+
+  ADD_FEATURE(regs[2] & (1u << 28), "avx")
+  ADD_FEATURE(regs[2] & (1u << 12), "fma")
+
+  if (max_leaf < 7) {
+    return 0;
+  }
+
+  cpuid(7, 0, regs);
+  ADD_FEATURE(regs[1] & (1u << 5), "avx2")
+
+  if (!avx512_enabled(xcr0)) {
+    return 0;
+  }
+
+  ADD_FEATURE(regs[1] & (1u << 16), "avx512f")
+  ADD_FEATURE(regs[1] & (1u << 17), "avx512dq")
+  ADD_FEATURE(regs[1] & (1u << 28), "avx512cd")
+  ADD_FEATURE(regs[1] & (1u << 30), "avx512bw")
+  ADD_FEATURE(regs[1] & (1u << 31), "avx512vl")
+
+#    undef ADD_FEATURE
+#endif
+  return 0;
+}
+
+/***************************************************************************
+ * Module-level
+ ***************************************************************************/
+
+static int m_exec(PyObject *module) {
+  PyObject *features, *frozen;
+
+  features = PySet_New(NULL);
+  if (features == NULL) {
+    return -1;
+  }
+  if (add_features(features) < 0) {
+    Py_DECREF(features);
+    return -1;
+  }
+
+  frozen = PyFrozenSet_New(features);
+  Py_DECREF(features);
+  if (frozen == NULL) {
+    return -1;
+  }
+  if (PyModule_AddObject(module, "features", frozen) < 0) {
+    Py_DECREF(frozen);
+    return -1;
+  }
+  return 0;
+}
+
+static struct PyModuleDef moduledef = {
+    PyModuleDef_HEAD_INIT,
+    "_cpu_features",
+    NULL,
+    0,
+    NULL,
+    (PyModuleDef_Slot []) {
+        {Py_mod_exec, m_exec},
+        {/* terminal element, all NULL */}
+    },
+    NULL,
+    NULL,
+    NULL
+};
+
+PyMODINIT_FUNC
+PyInit__cpu_features(void)
+{
+  return PyModuleDef_Init(&moduledef);
+}
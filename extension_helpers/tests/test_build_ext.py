@@ -0,0 +1,358 @@
+import glob
+import importlib
+import json
+import os
+import re
+import shutil
+import sys
+import sysconfig
+import threading
+import time
+from textwrap import dedent
+
+import pytest
+
+from .._build_ext import _JobScheduler
+from . import cleanup_import, run_setup
+
+if sys.version_info >= (3, 11):
+    from contextlib import chdir
+else:
+    from .py311_backports import chdir
+
+extension_helpers_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+MODULE_C = """\
+#include <Python.h>
+
+int {name}_helper(void);
+
+static struct PyModuleDef moduledef = {{
+    PyModuleDef_HEAD_INIT,
+    "{name}",
+    NULL,
+    -1,
+    NULL
+}};
+
+PyMODINIT_FUNC
+PyInit_{name}(void) {{
+    PyObject *module = PyModule_Create(&moduledef);
+    PyModule_AddIntConstant(module, "value", {name}_helper());
+    return module;
+}}
+"""
+
+HELPER_C = """\
+int {name}_helper(void) {{
+    return {value};
+}}
+"""
+
+
+@pytest.fixture
+def build_ext_test_package(tmp_path, request):
+    """
+    Creates a test package with several extensions, each made up of two C
+    source files.
+    """
+
+    test_pkg = tmp_path / "test_pkg"
+    package = test_pkg / "build_ext_test_package"
+    os.makedirs(package)
+    (package / "__init__.py").touch()
+
+    extensions = []
+    for value, name in enumerate(["ext_a", "ext_b", "ext_c"]):
+        (package / f"{name}.c").write_text(MODULE_C.format(name=name))
+        (package / f"{name}_helper.c").write_text(HELPER_C.format(name=name, value=value))
+        extensions.append(
+            f"Extension('build_ext_test_package.{name}', "
+            f"[join('build_ext_test_package', '{name}.c'), "
+            f"join('build_ext_test_package', '{name}_helper.c')])"
+        )
+
+    (package / "setup_package.py").write_text(dedent(f"""\
+        from setuptools import Extension
+        from os.path import join
+        def get_extensions():
+            return [{", ".join(extensions)}]
+    """))
+
+    (test_pkg / "setup.py").write_text(dedent(f"""\
+        import sys
+        from setuptools import setup, find_packages
+        sys.path.insert(0, r'{extension_helpers_PATH}')
+        from extension_helpers import BuildExt, get_extensions
+
+        setup(
+            name='build_ext_test_package',
+            version='0.1',
+            packages=find_packages(),
+            ext_modules=get_extensions(),
+            cmdclass={{'build_ext': BuildExt}},
+        )
+    """))
+
+    request.addfinalizer(lambda: cleanup_import("build_ext_test_package"))
+
+    return test_pkg
+
+
+def check_built_extensions(test_pkg):
+    """
+    Check that the extensions of the package created by
+    `build_ext_test_package`, built in place, can be imported and work.
+    """
+
+    sys.path.insert(0, str(test_pkg))
+    try:
+        for value, name in enumerate(["ext_a", "ext_b", "ext_c"]):
+            module = importlib.import_module(f"build_ext_test_package.{name}")
+            assert module.value == value
+        assert importlib.import_module("build_ext_test_package.compiler_version").compiler
+    finally:
+        sys.path.remove(str(test_pkg))
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_build_ext_parallel(build_ext_test_package, jobs):
+    with chdir(build_ext_test_package):
+        run_setup("setup.py", ["build_ext", "--inplace", f"--parallel={jobs}"])
+
+    check_built_extensions(build_ext_test_package)
+
+
+FAKE_CCACHE = """\
+#!/bin/sh
+# Counts compilations as cache misses and reports them in the same format as
+# ccache --print-stats.
+if [ "$1" = "--print-stats" ]; then
+    printf "cache_miss\\t%s\\n" "$(cat "$0.log" 2>/dev/null | wc -l)"
+    exit 0
+fi
+echo "$@" >> "$0.log"
+exec "$@"
+"""
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Uses a shell script as launcher")
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_build_ext_compiler_launcher(build_ext_test_package, tmp_path, monkeypatch, capfd, jobs):
+    launcher = tmp_path / "bin" / "ccache"
+    launcher.parent.mkdir()
+    launcher.write_text(FAKE_CCACHE)
+    launcher.chmod(0o755)
+
+    monkeypatch.setenv("EXTENSION_HELPERS_COMPILER_LAUNCHER", str(launcher))
+
+    with chdir(build_ext_test_package):
+        run_setup("setup.py", ["build_ext", "--inplace", f"--parallel={jobs}"])
+
+    # Only compilations should go through the launcher
+    commands = (tmp_path / "bin" / "ccache.log").read_text().splitlines()
+    assert len(commands) == 7
+    assert all(" -c " in command for command in commands)
+
+    output = "".join(capfd.readouterr())
+    assert "ccache: 0 cache hits, 7 cache misses (0% hit rate)" in output
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_build_ext_trace(build_ext_test_package, tmp_path, monkeypatch, capfd, jobs):
+    trace_file = tmp_path / "trace.json"
+    monkeypatch.setenv("EXTENSION_HELPERS_TRACE", str(trace_file))
+
+    with chdir(build_ext_test_package):
+        run_setup("setup.py", ["build_ext", "--inplace", f"--parallel={jobs}"])
+
+    with open(trace_file) as f:
+        events = json.load(f)["traceEvents"]
+
+    steps = sorted((event["args"]["extension"], event["cat"], event["name"]) for event in events)
+    expected = [("build_ext_test_package.compiler_version", "compile", "_compiler.c")]
+    for name in ["ext_a", "ext_b", "ext_c"]:
+        extension = f"build_ext_test_package.{name}"
+        expected.append((extension, "compile", f"{name}.c"))
+        expected.append((extension, "compile", f"{name}_helper.c"))
+    for name in ["compiler_version", "ext_a", "ext_b", "ext_c"]:
+        extension = f"build_ext_test_package.{name}"
+        expected.append((extension, "link", f"{name}{sysconfig.get_config_var('EXT_SUFFIX')}"))
+    assert steps == sorted(expected)
+
+    output = "".join(capfd.readouterr())
+    assert f"build trace written to {trace_file}" in output
+    assert "build_ext_test_package.ext_a" in output.split("build trace written to")[1]
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_build_ext_unity(build_ext_test_package, monkeypatch, jobs):
+    monkeypatch.setenv("EXTENSION_HELPERS_UNITY_BUILD", "1")
+
+    with chdir(build_ext_test_package):
+        run_setup("setup.py", ["build_ext", "--inplace", f"--parallel={jobs}"])
+        pattern = os.path.join("build", "*", "unity", "**", "unity_c0.c")
+        generated = glob.glob(pattern, recursive=True)
+
+    assert len(generated) == 3
+
+    check_built_extensions(build_ext_test_package)
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_build_ext_shared_sources(build_ext_test_package, jobs):
+    package = build_ext_test_package / "build_ext_test_package"
+    (package / "common.c").write_text("int common_value(void) {\n    return 42;\n}\n")
+    (package / "setup_package.py").write_text(dedent("""\
+        from setuptools import Extension
+        from os.path import join
+        def get_extensions():
+            return [
+                Extension(
+                    f'build_ext_test_package.{name}',
+                    [join('build_ext_test_package', f'{name}.c'),
+                     join('build_ext_test_package', f'{name}_helper.c'),
+                     join('build_ext_test_package', 'common.c')],
+                )
+                for name in ['ext_a', 'ext_b', 'ext_c']
+            ]
+    """))
+
+    with chdir(build_ext_test_package):
+        run_setup("setup.py", ["build_ext", "--inplace", f"--parallel={jobs}"])
+        objects = glob.glob(os.path.join("build", "**", "common.o*"), recursive=True)
+
+    # The common source should only have been compiled once
+    assert len(objects) == 1
+    assert os.sep + "shared" + os.sep in objects[0]
+
+    check_built_extensions(build_ext_test_package)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="The object cache is not supported with MSVC")
+def test_build_ext_object_cache(build_ext_test_package, monkeypatch, capfd):
+    from .._object_cache import get_object_cache_stats
+
+    monkeypatch.setenv("EXTENSION_HELPERS_OBJECT_CACHE", "1")
+
+    with chdir(build_ext_test_package):
+        run_setup("setup.py", ["build_ext", "--inplace", "--parallel=2"])
+        output = "".join(capfd.readouterr())
+        assert "object cache: 0 cache hits, 7 cache misses" in output
+
+        # A clean build should retrieve all object files from the cache
+        shutil.rmtree("build")
+        run_setup("setup.py", ["build_ext", "--inplace", "--parallel=2"])
+        output = "".join(capfd.readouterr())
+        assert "object cache: 7 cache hits, 0 cache misses (100% hit rate)" in output
+
+    stats = get_object_cache_stats()
+    assert stats["objects"] == 7
+    assert (stats["hits"], stats["misses"]) == (7, 7)
+
+    check_built_extensions(build_ext_test_package)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="PGO is not supported with MSVC")
+def test_build_ext_pgo(build_ext_test_package, monkeypatch, capfd):
+    training = "import build_ext_test_package.ext_a as m; assert m.value == 0"
+    monkeypatch.setenv("EXTENSION_HELPERS_PGO", "1")
+    monkeypatch.setenv("EXTENSION_HELPERS_PGO_COMMAND", f"python -c '{training}'")
+
+    with chdir(build_ext_test_package):
+        run_setup("setup.py", ["build_ext", "--inplace", "--parallel=2"])
+        profiles = glob.glob(os.path.join("build", "*", "pgo", "**", "*.gc*"), recursive=True)
+
+    output = "".join(capfd.readouterr())
+    assert "PGO: building instrumented extensions" in output
+    assert "PGO: building optimized extensions" in output
+    assert "-fprofile-use=" in output
+    assert profiles
+
+    check_built_extensions(build_ext_test_package)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Checks GCC/clang flags")
+def test_build_ext_lto(build_ext_test_package, monkeypatch, capfd):
+    monkeypatch.setenv("EXTENSION_HELPERS_LTO", "full")
+
+    with chdir(build_ext_test_package):
+        run_setup("setup.py", ["build_ext", "--inplace", "--parallel=8"])
+
+    output = "".join(capfd.readouterr())
+    if "not supported by the compiler" in output:
+        pytest.skip("LTO is not supported by the compiler")
+    # With GCC, the build jobs should be shared between the four extensions,
+    # which can all be linked at the same time
+    assert re.search(r"using full link-time optimization \(-flto(=2)?\)", output)
+
+    check_built_extensions(build_ext_test_package)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Not supported with MSVC")
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_build_ext_precompiled_headers(build_ext_test_package, capfd, jobs):
+    (build_ext_test_package / "pyproject.toml").write_text(dedent("""\
+        [tool.extension-helpers.precompiled-headers]
+        "build_ext_test_package.*" = ["Python.h"]
+        "build_ext_test_package.ext_c" = ["Python.h", "stdio.h"]
+    """))
+
+    with chdir(build_ext_test_package):
+        run_setup("setup.py", ["build_ext", "--inplace", f"--parallel={jobs}"])
+        output = "".join(capfd.readouterr())
+        if "not supported with the" in output:
+            pytest.skip("Precompiled headers are not supported by the compiler")
+
+        # ext_a and ext_b share the same precompiled header
+        headers = glob.glob(os.path.join("build", "**", "pch.h.[gp]ch"), recursive=True)
+        assert len(headers) == 2
+        assert output.count("precompiling Python.h\n") == 1
+        assert output.count("precompiling Python.h, stdio.h\n") == 1
+
+        # Precompiled headers are only built again if they are out of date
+        now = time.time()
+        os.utime(os.path.join("build_ext_test_package", "ext_a.c"), (now + 10, now + 10))
+        run_setup("setup.py", ["build_ext", "--inplace", f"--parallel={jobs}"])
+        output = "".join(capfd.readouterr())
+        assert "precompiling" not in output
+        assert "ext_a.c" in output and "ext_b.c" not in output
+
+    check_built_extensions(build_ext_test_package)
+
+
+def test_job_scheduler_priority():
+    scheduler = _JobScheduler(1)
+
+    order = []
+    started = threading.Event()
+
+    def block():
+        started.set()
+        time.sleep(0.1)
+
+    try:
+        # Occupy the single worker so that the following jobs are queued
+        scheduler.submit((0,), block)
+        started.wait()
+        futures = [
+            scheduler.submit((1, 1), order.append, "compile-1"),
+            scheduler.submit((1, 0), order.append, "compile-0"),
+            scheduler.submit((0, 2), order.append, "link-2"),
+        ]
+        for future in futures:
+            future.result()
+    finally:
+        scheduler.shutdown()
+
+    assert order == ["link-2", "compile-0", "compile-1"]
+
+
+def test_job_scheduler_exception():
+    scheduler = _JobScheduler(2)
+    try:
+        future = scheduler.submit((0,), int, "spam")
+        with pytest.raises(ValueError):
+            future.result()
+    finally:
+        scheduler.shutdown()
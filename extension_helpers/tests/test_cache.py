@@ -0,0 +1,46 @@
+import os
+
+from .._cache import get_cache_dir, hash_key, read_cache, write_cache
+
+
+def test_get_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXTENSION_HELPERS_CACHE_DIR", str(tmp_path))
+    assert get_cache_dir() == str(tmp_path)
+
+    monkeypatch.setenv("EXTENSION_HELPERS_CACHE_DIR", "")
+    assert get_cache_dir() is None
+
+    monkeypatch.delenv("EXTENSION_HELPERS_CACHE_DIR")
+    assert get_cache_dir().endswith("extension-helpers")
+
+
+def test_hash_key():
+    assert hash_key("a", [1, 2], {"b": None}) == hash_key("a", [1, 2], {"b": None})
+    assert hash_key("a", [1, 2]) != hash_key("a", [2, 1])
+
+
+def test_read_write_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXTENSION_HELPERS_CACHE_DIR", str(tmp_path))
+
+    key = hash_key("spam")
+
+    assert read_cache("test", key) is None
+    assert read_cache("test", key, default=1) == 1
+
+    write_cache("test", key, {"eggs": [1, 2, 3]})
+    assert read_cache("test", key) == {"eggs": [1, 2, 3]}
+
+    # No temporary files should be left behind
+    (directory,) = os.listdir(tmp_path)
+    assert os.listdir(tmp_path / directory) == [key + ".json"]
+
+    # Corrupted entries should be ignored
+    (tmp_path / directory / (key + ".json")).write_text("{")
+    assert read_cache("test", key, default=2) == 2
+
+
+def test_cache_disabled(monkeypatch):
+    monkeypatch.setenv("EXTENSION_HELPERS_CACHE_DIR", "")
+    key = hash_key("spam")
+    write_cache("test", key, True)
+    assert read_cache("test", key) is None
@@ -0,0 +1,248 @@
+import os
+import sys
+import types
+from textwrap import dedent
+
+import pytest
+from setuptools import Extension
+
+from .. import _cython
+from .._cython import (
+    cythonize_extensions,
+    find_cython_dependencies,
+    get_cython_directives_config,
+    get_module_directives,
+    scan_cython_file,
+)
+
+
+def test_scan_cython_file(tmp_path):
+    source = tmp_path / "module.pyx"
+    source.write_text(dedent("""\
+        cimport numpy as np
+        cimport libc.math, cpython
+        from libc.stdlib cimport malloc, free
+        from . cimport sibling
+        from ..parent cimport (a as b,
+                               c)
+        include "defs.pxi"
+        # cimport commented
+        def f():
+            pass
+    """))
+
+    cimports, includes = scan_cython_file(str(source))
+
+    assert cimports == [
+        "numpy",
+        "libc.math",
+        "cpython",
+        "libc.stdlib",
+        "libc.stdlib.malloc",
+        "libc.stdlib.free",
+        ".sibling",
+        "..parent",
+        "..parent.a",
+    ]
+    assert includes == ["defs.pxi"]
+
+
+def test_find_cython_dependencies(tmp_path):
+    pkg = tmp_path / "pkg"
+    sub = pkg / "sub"
+    os.makedirs(sub)
+    (sub / "module.pyx").write_text(dedent("""\
+        from . cimport sibling
+        from pkg.other cimport thing
+        from .. cimport parent
+        cimport external
+        cimport missing
+        include "defs.pxi"
+    """))
+    (sub / "module.pxd").write_text("")
+    (sub / "sibling.pxd").write_text("cimport pkg.sub\n")
+    (sub / "__init__.pxd").write_text('include "common.pxi"\n')
+    (sub / "common.pxi").write_text("")
+    (sub / "defs.pxi").write_text("")
+    (pkg / "other.pxd").write_text("")
+    (pkg / "parent.pxd").write_text("")
+
+    external = tmp_path / "external"
+    external.mkdir()
+    (external / "external.pxd").write_text("")
+
+    dependencies = find_cython_dependencies(
+        str(sub / "module.pyx"), "pkg.sub.module", [str(tmp_path), str(external)]
+    )
+
+    assert sorted(dependencies) == sorted(
+        [
+            str(sub / "module.pxd"),
+            str(sub / "sibling.pxd"),
+            str(sub / "__init__.pxd"),
+            str(sub / "common.pxi"),
+            str(sub / "defs.pxi"),
+            str(pkg / "other.pxd"),
+            str(pkg / "parent.pxd"),
+            str(external / "external.pxd"),
+        ]
+    )
+
+
+def test_get_module_directives(tmp_path):
+    assert get_cython_directives_config(str(tmp_path)) == []
+
+    (tmp_path / "pyproject.toml").write_text(dedent("""\
+        [tool.extension-helpers.cython-directives]
+        "*" = {language_level = 3}
+        "pkg.fast" = {boundscheck = false, wraparound = false}
+        "pkg.*.kernels" = {initializedcheck = false}
+        "pkg.fast.checked" = {boundscheck = true}
+    """))
+    config = get_cython_directives_config(str(tmp_path))
+
+    assert get_module_directives(config, "other") == {"language_level": 3}
+    assert get_module_directives(config, "pkg.slow") == {"language_level": 3}
+    # Package names apply to all the modules they contain
+    assert get_module_directives(config, "pkg.fast.kernels") == {
+        "language_level": 3,
+        "boundscheck": False,
+        "wraparound": False,
+        "initializedcheck": False,
+    }
+    # Later patterns take precedence
+    assert get_module_directives(config, "pkg.fast.checked") == {
+        "language_level": 3,
+        "boundscheck": True,
+        "wraparound": False,
+    }
+
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.extension-helpers.cython-directives]\n"pkg" = "boundscheck=False"\n'
+    )
+    with pytest.raises(TypeError, match="directives for 'pkg' in pyproject.toml"):
+        get_cython_directives_config(str(tmp_path))
+
+
+def _fake_run_cython(name, source, options):
+    output = os.path.splitext(source)[0] + (".cpp" if options["language"] == "c++" else ".c")
+    with open(output, "w") as f:
+        f.write(f"/* {source} {options['directives']} */")
+
+
+@pytest.fixture
+def fake_cython(monkeypatch):
+    """
+    Replace Cython by a function which writes the name of the source and the
+    directives to the output file.
+    """
+    monkeypatch.setitem(sys.modules, "Cython", types.SimpleNamespace(__version__="3.0"))
+    monkeypatch.setattr(_cython, "_run_cython", _fake_run_cython)
+
+
+@pytest.fixture
+def cython_package(tmp_path):
+    pkg = tmp_path / "pkg"
+    pkg.mkdir()
+    (pkg / "a.pyx").write_text("from pkg.shared cimport x\n")
+    (pkg / "b.pyx").write_text("")
+    (pkg / "shared.pxd").write_text("")
+    return pkg
+
+
+def _make_extensions(pkg):
+    return [
+        Extension("pkg.a", [str(pkg / "a.pyx"), str(pkg / "helper.c")]),
+        Extension("pkg.b", [str(pkg / "b.pyx")]),
+        Extension("pkg.c", [str(pkg / "c.c")]),
+    ]
+
+
+@pytest.mark.usefixtures("fake_cython")
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_cythonize_extensions_cached(cython_package, jobs):
+    pkg = cython_package
+    a_pyx, b_pyx = str(pkg / "a.pyx"), str(pkg / "b.pyx")
+
+    extensions = _make_extensions(pkg)
+    assert sorted(cythonize_extensions(extensions, jobs=jobs)) == [a_pyx, b_pyx]
+    assert (pkg / "a.c").is_file() and (pkg / "b.c").is_file()
+    assert [ext.sources for ext in extensions] == [
+        [str(pkg / "a.c"), str(pkg / "helper.c")],
+        [str(pkg / "b.c")],
+        [str(pkg / "c.c")],
+    ]
+
+    # Nothing should be converted again if nothing changed
+    assert cythonize_extensions(_make_extensions(pkg), jobs=jobs) == []
+
+    # Changing a .pxd file should only affect the modules depending on it
+    (pkg / "shared.pxd").write_text("cdef int x\n")
+    assert cythonize_extensions(_make_extensions(pkg), jobs=jobs) == [a_pyx]
+
+    # Modifying the generated file should also trigger conversion
+    (pkg / "a.c").write_text("")
+    assert cythonize_extensions(_make_extensions(pkg), jobs=jobs) == [a_pyx]
+
+    # Changing the directives or the language should also trigger conversion
+    extensions = _make_extensions(pkg)
+    extensions[1].cython_directives = {"boundscheck": False}
+    assert cythonize_extensions(extensions, jobs=jobs) == [b_pyx]
+
+    extensions = _make_extensions(pkg)
+    assert sorted(cythonize_extensions(extensions, jobs=jobs, cplus=True)) == [a_pyx, b_pyx]
+    assert extensions[1].sources == [str(pkg / "b.cpp")]
+
+    assert sorted(cythonize_extensions(_make_extensions(pkg), force=True)) == [a_pyx, b_pyx]
+
+
+@pytest.mark.usefixtures("fake_cython")
+@pytest.mark.usefixtures("fake_cython")
+def test_cythonize_extensions_report(cython_package, caplog):
+    extensions = _make_extensions(cython_package)
+    extensions[0].cython_directives = {"boundscheck": False, "language_level": 3}
+
+    with caplog.at_level("INFO", logger="extension_helpers._cython"):
+        cythonize_extensions(extensions, directives={"boundscheck": True, "cdivision": True})
+
+    # The directives of the extensions take precedence over the global ones
+    assert "cythonizing pkg.a with boundscheck=False, cdivision=True, language_level=3" in (
+        caplog.text
+    )
+    assert "cythonizing pkg.b with boundscheck=True, cdivision=True" in caplog.text
+    generated = (cython_package / "a.c").read_text()
+    assert generated.endswith("{'boundscheck': False, 'cdivision': True, 'language_level': 3} */")
+
+
+@pytest.mark.usefixtures("fake_cython")
+def test_cythonize_extensions_no_cache(cython_package, monkeypatch):
+    monkeypatch.setenv("EXTENSION_HELPERS_CACHE_DIR", "")
+
+    pkg = cython_package
+    assert len(cythonize_extensions(_make_extensions(pkg))) == 2
+    assert cythonize_extensions(_make_extensions(pkg)) == []
+
+    # Without the cache, modification times are used instead
+    os.utime(pkg / "shared.pxd", ns=(2**62, 2**62))
+    assert cythonize_extensions(_make_extensions(pkg)) == [str(pkg / "a.pyx")]
+
+
+def test_cythonize_extensions_no_cython(cython_package, monkeypatch):
+    monkeypatch.setitem(sys.modules, "Cython", None)
+    extensions = _make_extensions(cython_package)
+    assert cythonize_extensions(extensions) == []
+    assert extensions[1].sources == [str(cython_package / "b.pyx")]
+
+
+def test_cythonize_extensions_real(tmp_path):
+    pytest.importorskip("Cython")
+
+    pkg = tmp_path / "pkg"
+    pkg.mkdir()
+    (pkg / "a.pyx").write_text("from pkg.shared cimport twice\ndef f():\n    return twice(2)\n")
+    (pkg / "shared.pxd").write_text("cdef inline int twice(int x):\n    return 2 * x\n")
+
+    extension = Extension("pkg.a", [str(pkg / "a.pyx")], include_dirs=[str(tmp_path)])
+    assert cythonize_extensions([extension]) == [str(pkg / "a.pyx")]
+    assert extension.sources == [str(pkg / "a.c")]
+    assert os.path.isfile(pkg / "a.c")
@@ -0,0 +1,136 @@
+import os
+from textwrap import dedent
+
+from setuptools import Extension
+
+from .. import _depends
+from .._depends import add_dependencies, find_dependencies, scan_includes
+from .._setup_helpers import get_extensions
+
+
+def test_scan_includes(tmp_path):
+    source = tmp_path / "source.c"
+    source.write_text(dedent("""\
+        #include <Python.h>
+        #include "local.h"
+          #  include   "spaced.h"
+        #include HEADER_MACRO
+        #if 0
+        #include <sub/other.h>
+        #endif
+        const char *text = "#include <not_an_include.h>";
+    """))
+
+    assert scan_includes(str(source)) == [
+        ("Python.h", False),
+        ("local.h", True),
+        ("spaced.h", True),
+        ("sub/other.h", False),
+    ]
+
+    assert scan_includes(str(tmp_path / "missing.c")) == []
+
+
+def test_scan_includes_cached(tmp_path, monkeypatch):
+    source = tmp_path / "source.c"
+    source.write_text('#include "a.h"\n')
+
+    monkeypatch.setattr(_depends, "_SCAN_CACHE", {})
+
+    assert scan_includes(str(source)) == [("a.h", True)]
+    assert str(source) in _depends._SCAN_CACHE
+
+    # Files which have not changed are not read again
+    _depends._SCAN_CACHE[str(source)][1].append(("cached.h", True))
+    assert scan_includes(str(source)) == [("a.h", True), ("cached.h", True)]
+
+    # Files which have changed are scanned again
+    source.write_text('#include "a.h"\n#include "b.h"\n')
+    assert scan_includes(str(source)) == [("a.h", True), ("b.h", True)]
+
+
+def test_find_dependencies(tmp_path):
+    src = tmp_path / "src"
+    include = tmp_path / "include"
+    external = tmp_path / "external"
+    for directory in (src, include, external):
+        directory.mkdir()
+
+    (src / "module.c").write_text(dedent("""\
+        #include <stdio.h>
+        #include "local.h"
+        #include <public.h>
+        #include <external.h>
+        #include "missing.h"
+        #include "module.pyx"
+    """))
+    (src / "local.h").write_text('#include "public.h"\n')
+    (src / "module.pyx").write_text("")
+    (include / "public.h").write_text('#include "detail.h"\n#include "local.h"\n')
+    (include / "detail.h").write_text('#include "public.h"\n')
+    (external / "external.h").write_text('#include "external_detail.h"\n')
+    (external / "external_detail.h").write_text("")
+
+    depends = find_dependencies(
+        [str(src / "module.c"), str(src / "module.pyx")],
+        [str(include), str(external)],
+        root=str(tmp_path / "src"),
+    )
+
+    # Only the headers within the root directory are taken into account
+    assert depends == [str(src / "local.h"), str(src / "module.pyx")]
+
+    depends = find_dependencies(
+        [str(src / "module.c")], [str(include), str(external)], root=str(tmp_path)
+    )
+
+    assert sorted(depends) == sorted(
+        [
+            str(src / "local.h"),
+            str(src / "module.pyx"),
+            str(include / "public.h"),
+            str(include / "detail.h"),
+            str(external / "external.h"),
+            str(external / "external_detail.h"),
+        ]
+    )
+
+
+def test_add_dependencies(tmp_path):
+    (tmp_path / "module.c").write_text('#include "module.h"\n#include "other.h"\n')
+    (tmp_path / "module.h").touch()
+    (tmp_path / "other.h").touch()
+
+    extension = Extension(
+        "module", [str(tmp_path / "module.c")], depends=[str(tmp_path / "other.h")]
+    )
+    add_dependencies(extension, root=str(tmp_path))
+
+    assert extension.depends == [str(tmp_path / "other.h"), str(tmp_path / "module.h")]
+
+
+def test_get_extensions_depends(tmp_path, monkeypatch):
+    test_pkg = tmp_path / "test_pkg"
+    package = test_pkg / "depends_test_package"
+    os.makedirs(package / "include")
+    (package / "__init__.py").touch()
+    (package / "module.c").write_text('#include <Python.h>\n#include "module.h"\n')
+    (package / "include" / "module.h").touch()
+    (package / "setup_package.py").write_text(dedent("""\
+        from os.path import join
+        from setuptools import Extension
+        def get_extensions():
+            return [Extension('depends_test_package.module',
+                              [join('depends_test_package', 'module.c')],
+                              include_dirs=[join('depends_test_package', 'include')])]
+    """))
+
+    monkeypatch.chdir(test_pkg)
+
+    extension = get_extensions()[0]
+    assert extension.depends == [os.path.join("depends_test_package", "include", "module.h")]
+
+    monkeypatch.setenv("EXTENSION_HELPERS_SCAN_DEPENDS", "0")
+
+    extension = get_extensions()[0]
+    assert extension.depends == []
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+from setuptools.command.build_ext import customize_compiler, new_compiler
+
+from .. import _launcher
+from .._launcher import (
+    _parse_ccache_stats,
+    _parse_sccache_stats,
+    apply_compiler_launcher,
+    format_stats_difference,
+    get_compiler_launcher,
+)
+
+
+def test_get_compiler_launcher(tmp_path, monkeypatch):
+    monkeypatch.delenv("EXTENSION_HELPERS_COMPILER_LAUNCHER", raising=False)
+    assert get_compiler_launcher(str(tmp_path)) is None
+
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.extension-helpers]\ncompiler-launcher = "sccache --flag"\n'
+    )
+    assert get_compiler_launcher(str(tmp_path)) == ["sccache", "--flag"]
+
+    # The environment variable takes precedence
+    monkeypatch.setenv("EXTENSION_HELPERS_COMPILER_LAUNCHER", "none")
+    assert get_compiler_launcher(str(tmp_path)) is None
+
+    monkeypatch.setenv("EXTENSION_HELPERS_COMPILER_LAUNCHER", "auto")
+    monkeypatch.setattr(_launcher.shutil, "which", lambda name: None)
+    assert get_compiler_launcher(str(tmp_path)) is None
+
+    found = {"sccache": "/usr/bin/sccache"}
+    monkeypatch.setattr(_launcher.shutil, "which", found.get)
+    assert get_compiler_launcher(str(tmp_path)) == ["/usr/bin/sccache"]
+
+    found["ccache"] = "/usr/bin/ccache"
+    assert get_compiler_launcher(str(tmp_path)) == ["/usr/bin/ccache"]
+
+
+def test_apply_compiler_launcher():
+    ccompiler = new_compiler(compiler="unix")
+    customize_compiler(ccompiler)
+
+    compiler_so = list(ccompiler.compiler_so)
+    linker_so = list(ccompiler.linker_so)
+
+    assert apply_compiler_launcher(ccompiler, ["ccache"])
+    assert ccompiler.compiler_so == ["ccache", *compiler_so]
+    assert ccompiler.linker_so == linker_so
+
+    # The launcher should not be added twice, and other launchers should not
+    # be added in front of it
+    assert not apply_compiler_launcher(ccompiler, ["ccache"])
+    assert not apply_compiler_launcher(ccompiler, ["/opt/bin/sccache"])
+    assert ccompiler.compiler_so == ["ccache", *compiler_so]
+
+    assert not apply_compiler_launcher(ccompiler, None)
+
+
+def test_parse_stats():
+    output = (
+        "cache_miss\t3\n"
+        "direct_cache_hit\t4\n"
+        "preprocessed_cache_hit\t1\n"
+        "stats_updated_timestamp\t0\n"
+    )
+    assert _parse_ccache_stats(output) == {"hits": 5, "misses": 3}
+
+    output = json.dumps(
+        {
+            "stats": {
+                "cache_hits": {"counts": {"C/C++": 4, "CUDA": 1}},
+                "cache_misses": {"counts": {"C/C++": 2}},
+            }
+        }
+    )
+    assert _parse_sccache_stats(output) == {"hits": 5, "misses": 2}
+
+
+@pytest.mark.parametrize(
+    ("after", "expected"),
+    [
+        ({"hits": 13, "misses": 2}, "ccache: 3 cache hits, 1 cache misses (75% hit rate)"),
+        ({"hits": 10, "misses": 1}, "ccache: 0 cache hits, 0 cache misses"),
+    ],
+)
+def test_format_stats_difference(after, expected):
+    before = {"hits": 10, "misses": 1}
+    assert format_stats_difference(["/usr/bin/ccache"], before, after) == expected
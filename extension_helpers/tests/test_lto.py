@@ -0,0 +1,57 @@
+import pytest
+
+from .._lto import check_lto_support, get_lto_flags, get_lto_mode
+from .._pgo import get_compiler_family
+from .._setup_helpers import get_compiler
+
+
+def test_get_lto_mode(tmp_path, monkeypatch):
+    monkeypatch.delenv("EXTENSION_HELPERS_LTO", raising=False)
+    assert get_lto_mode(str(tmp_path)) is None
+
+    (tmp_path / "pyproject.toml").write_text('[tool.extension-helpers]\nlto = "thin"\n')
+    assert get_lto_mode(str(tmp_path)) == "thin"
+
+    (tmp_path / "pyproject.toml").write_text("[tool.extension-helpers]\nlto = true\n")
+    assert get_lto_mode(str(tmp_path)) == "full"
+
+    # The environment variable takes precedence
+    monkeypatch.setenv("EXTENSION_HELPERS_LTO", "none")
+    assert get_lto_mode(str(tmp_path)) is None
+
+    monkeypatch.setenv("EXTENSION_HELPERS_LTO", "Full")
+    assert get_lto_mode(str(tmp_path)) == "full"
+
+    monkeypatch.setenv("EXTENSION_HELPERS_LTO", "fat")
+    with pytest.raises(ValueError, match="The LTO mode should be"):
+        get_lto_mode(str(tmp_path))
+
+
+@pytest.mark.parametrize(
+    ("compiler_type", "family", "mode", "jobs", "expected"),
+    [
+        ("unix", "gcc", "full", None, (["-flto"], ["-flto"])),
+        ("unix", "gcc", "full", 4, (["-flto"], ["-flto=4"])),
+        ("unix", "gcc", "thin", 4, (["-flto"], ["-flto=4"])),
+        ("unix", "clang", "full", 4, (["-flto"], ["-flto"])),
+        ("unix", "clang", "thin", None, (["-flto=thin"], ["-flto=thin"])),
+        ("unix", "clang", "thin", 4, (["-flto=thin"], ["-flto=thin", "-flto-jobs=4"])),
+        ("msvc", None, "full", 16, (["/GL"], ["/LTCG", "/CGTHREADS:8"])),
+        ("unix", None, "full", 4, None),
+    ],
+)
+def test_get_lto_flags(compiler_type, family, mode, jobs, expected):
+    assert get_lto_flags(compiler_type, family, mode, jobs=jobs) == expected
+
+
+def test_check_lto_support():
+    from setuptools.command.build_ext import customize_compiler, new_compiler
+
+    ccompiler = new_compiler()
+    customize_compiler(ccompiler)
+    flags = get_lto_flags(get_compiler(), get_compiler_family(ccompiler), "full")
+    if flags is None:
+        pytest.skip("LTO is not supported with this compiler")
+
+    assert check_lto_support(*flags)
+    assert not check_lto_support(["--extension-helpers-invalid-flag"], [])
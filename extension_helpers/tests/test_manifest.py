@@ -0,0 +1,70 @@
+import pytest
+from setuptools import Extension
+from setuptools.command.build_ext import Library
+
+from .._manifest import deserialize_extension, get_tree_fingerprint, serialize_extension
+from .._source_tree import index_source_tree
+
+
+@pytest.mark.parametrize("cls", [Extension, Library])
+def test_serialize_extension_roundtrip(cls):
+    extension = cls(
+        "spam.eggs",
+        ["spam/eggs.c", "spam/ham.c"],
+        include_dirs=["include"],
+        define_macros=[("A", "1"), ("B", None)],
+        extra_compile_args=["-O3"],
+        language="c",
+        optional=True,
+    )
+    extension.custom = {"key": ("a", 1)}
+
+    result = deserialize_extension(serialize_extension(extension))
+
+    assert type(result) is cls
+    assert vars(result) == vars(extension)
+    assert result.define_macros == [("A", "1"), ("B", None)]
+
+
+def test_serialize_extension_invalid():
+    class CustomExtension(Extension):
+        pass
+
+    with pytest.raises(TypeError):
+        serialize_extension(CustomExtension("spam", ["spam.c"]))
+
+    extension = Extension("spam", ["spam.c"])
+    extension.custom = object()
+
+    with pytest.raises(TypeError):
+        serialize_extension(extension)
+
+
+def test_tree_fingerprint_ignores_unrelated_files(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "__init__.py").touch()
+    (tmp_path / "pkg" / "mod.pyx").write_text("pass")
+
+    fingerprint = get_tree_fingerprint(index_source_tree(str(tmp_path)))
+
+    # Build products, files generated during discovery and files which are
+    # not read by discovery should not change the fingerprint
+    (tmp_path / "pkg" / "mod.c").write_text("/* generated */")
+    (tmp_path / "pkg" / "mod.cpython-311-x86_64-linux-gnu.so").touch()
+    (tmp_path / "pkg" / "_compiler.c").touch()
+    (tmp_path / "pkg" / "_kernels.py").write_text("# SIMD dispatch module")
+    (tmp_path / "pkg" / "data.txt").touch()
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "index.rst").touch()
+    (tmp_path / "build").mkdir()
+    (tmp_path / "build" / "mod.o").touch()
+
+    assert get_tree_fingerprint(index_source_tree(str(tmp_path))) == fingerprint
+
+    (tmp_path / "pkg" / "mod.pyx").write_text("pass  # changed")
+    changed = get_tree_fingerprint(index_source_tree(str(tmp_path)))
+    assert changed != fingerprint
+
+    (tmp_path / "pkg" / "sub").mkdir()
+    (tmp_path / "pkg" / "sub" / "__init__.py").touch()
+    assert get_tree_fingerprint(index_source_tree(str(tmp_path))) != changed
@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from .. import _object_cache
+from ..__main__ import main
+from .._object_cache import (
+    DEFAULT_MAX_SIZE,
+    ObjectCache,
+    get_object_cache,
+    get_object_cache_dir,
+    get_object_cache_options,
+    get_object_cache_stats,
+    parse_size,
+)
+
+
+def test_parse_size():
+    assert parse_size(1000) == 1000
+    assert parse_size("500M") == 500 * 1024**2
+    assert parse_size("1.5 GiB") == int(1.5 * 1024**3)
+    assert parse_size("2k") == 2048
+    with pytest.raises(ValueError, match="Invalid size 'big'"):
+        parse_size("big")
+
+
+def test_get_object_cache_options(tmp_path, monkeypatch):
+    monkeypatch.delenv("EXTENSION_HELPERS_OBJECT_CACHE", raising=False)
+    monkeypatch.delenv("EXTENSION_HELPERS_OBJECT_CACHE_SIZE", raising=False)
+    assert get_object_cache_options(str(tmp_path)) == (False, DEFAULT_MAX_SIZE)
+
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.extension-helpers]\nobject-cache = true\nobject-cache-size = "1G"\n'
+    )
+    assert get_object_cache_options(str(tmp_path)) == (True, 1024**3)
+
+    # The environment variables take precedence
+    monkeypatch.setenv("EXTENSION_HELPERS_OBJECT_CACHE", "0")
+    monkeypatch.setenv("EXTENSION_HELPERS_OBJECT_CACHE_SIZE", "10M")
+    assert get_object_cache_options(str(tmp_path)) == (False, 10 * 1024**2)
+
+    monkeypatch.setenv("EXTENSION_HELPERS_OBJECT_CACHE", "1")
+    assert isinstance(get_object_cache(str(tmp_path)), ObjectCache)
+
+    monkeypatch.setenv("EXTENSION_HELPERS_CACHE_DIR", "")
+    assert get_object_cache(str(tmp_path)) is None
+
+
+def test_get_key(tmp_path, monkeypatch):
+    preprocessed = {}
+    monkeypatch.setattr(
+        ObjectCache, "_preprocess", staticmethod(lambda command: preprocessed.get(command[-2]))
+    )
+    monkeypatch.setattr(_object_cache, "_get_compiler_version", lambda executable: "gcc 13")
+
+    cache = ObjectCache(str(tmp_path), 1024)
+
+    def key(src, obj, *args):
+        return cache.get_key(["ccache", "gcc", *args, "-c", src, "-o", obj], obj)
+
+    # Sources which cannot be preprocessed are not cached
+    assert key("a.c", "build/a.o", "-O2") is None
+
+    preprocessed["a.c"] = b"int a;"
+    preprocessed["b.c"] = b"int a;"
+    assert key("a.c", "build/a.o", "-O2") is not None
+
+    # The output and the launcher are not part of the key, unlike the flags
+    # and the source
+    assert key("a.c", "build/a.o", "-O2") == key("a.c", "other/a.o", "-O2")
+    assert key("a.c", "build/a.o", "-O2") == cache.get_key(
+        ["gcc", "-O2", "-c", "a.c", "-o", "build/a.o"], "build/a.o"
+    )
+    assert key("a.c", "build/a.o", "-O2") != key("a.c", "build/a.o", "-O3")
+    assert key("a.c", "build/a.o", "-O2") != key("b.c", "build/a.o", "-O2")
+
+    preprocessed["a.c"] = b"int b;"
+    assert key("a.c", "build/a.o", "-O2") != key("b.c", "build/a.o", "-O2")
+
+    assert key("a.c", "build/a.o", "-fprofile-use=/pgo") is None
+
+
+def test_store_fetch_and_evict(tmp_path):
+    cache = ObjectCache(get_object_cache_dir(), 150)
+    keys = [f"{index:02d}" + "0" * 62 for index in range(3)]
+
+    for index, key in enumerate(keys):
+        obj = tmp_path / f"{index}.o"
+        obj.write_bytes(bytes([index]) * 100)
+        cache.store(key, str(obj))
+        os.utime(cache._entry_path(key, str(obj)), (index, index))
+
+    # Fetching an object file marks it as recently used
+    restored = tmp_path / "restored.o"
+    assert cache.fetch(keys[0], str(restored))
+    assert restored.read_bytes() == bytes([0]) * 100
+    assert not cache.fetch("ff" + "0" * 62, str(restored))
+
+    cache.hits, cache.misses = 1, 3
+    cache.close()
+
+    # The least recently used object files are evicted to get back under the
+    # maximum size
+    stats = get_object_cache_stats()
+    assert (stats["objects"], stats["size"]) == (1, 100)
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 3, 2)
+    assert os.path.exists(cache._entry_path(keys[0], "0.o"))
+
+
+def test_main_cache_stats(monkeypatch, capsys):
+    monkeypatch.delenv("EXTENSION_HELPERS_OBJECT_CACHE_SIZE", raising=False)
+    assert main(["cache", "stats"]) == 0
+    output = capsys.readouterr().out
+    assert "object files          0" in output
+    assert "hit rate              n/a" in output
+
+    monkeypatch.setenv("EXTENSION_HELPERS_CACHE_DIR", "")
+    main(["cache", "stats"])
+    assert capsys.readouterr().out.strip() == "The extension-helpers cache is disabled"
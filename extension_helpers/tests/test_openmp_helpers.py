@@ -5,7 +5,11 @@ from importlib import machinery
 import pytest
 from setuptools import Extension
 
-from .._openmp_helpers import add_openmp_flags_if_available, generate_openmp_enabled_py
+from .._openmp_helpers import (
+    add_openmp_flags_if_available,
+    check_openmp_support,
+    generate_openmp_enabled_py,
+)
 
 
 @pytest.fixture
@@ -46,3 +50,139 @@ def test_generate_openmp_enabled_py(openmp_expected):
 
     if openmp_expected is not None:
         assert openmp_expected is is_openmp_enabled
+
+
+def test_generate_openmp_enabled_py_unchanged(tmp_path):
+    # Generating the file again with the same result should not modify it, so
+    # that it does not trigger rebuilds or show up as changed
+    generate_openmp_enabled_py("", srcdir=str(tmp_path), disable_openmp=True)
+    filename = tmp_path / "openmp_enabled.py"
+    content = filename.read_bytes()
+    os.utime(filename, ns=(0, 0))
+
+    generate_openmp_enabled_py("", srcdir=str(tmp_path), disable_openmp=True)
+    assert filename.read_bytes() == content
+    assert filename.stat().st_mtime_ns == 0
+
+    generate_openmp_enabled_py("", srcdir=str(tmp_path), disable_openmp=False)
+    assert filename.stat().st_mtime_ns != 0
+
+
+def test_openmp_probe_cached(monkeypatch):
+    from .. import _probes
+
+    calls = []
+
+    def fake_run_probe(ccompiler, probe, directory):
+        calls.append(probe.extra_compile_args)
+        return _probes.ProbeResult(True, "nthreads=2\nnthreads=2\n")
+
+    monkeypatch.setattr(_probes, "_run_probe", fake_run_probe)
+
+    flags = {"compiler_flags": ["-fopenmp"], "linker_flags": ["-fopenmp"]}
+
+    assert check_openmp_support(openmp_flags=flags) is True
+    assert check_openmp_support(openmp_flags=flags) is True
+    assert len(calls) == 1
+
+    # The result should be persisted on disk and reused by a new process
+    _probes._PROBE_RESULTS.clear()
+    assert check_openmp_support(openmp_flags=flags) is True
+    assert len(calls) == 1
+
+    # Changing the flags or the environment should invalidate the cache
+    flags = {"compiler_flags": ["-fopenmp", "-O2"], "linker_flags": ["-fopenmp"]}
+    assert check_openmp_support(openmp_flags=flags) is True
+    assert len(calls) == 2
+
+    monkeypatch.setenv("CFLAGS", "-O3")
+    assert check_openmp_support(openmp_flags=flags) is True
+    assert len(calls) == 3
+
+
+def test_openmp_probe_failure_not_persisted(monkeypatch):
+    from .. import _probes
+
+    available = []
+
+    def fake_run_probe(ccompiler, probe, directory):
+        return _probes.ProbeResult(bool(available), "nthreads=1\n" if available else "")
+
+    monkeypatch.setattr(_probes, "_run_probe", fake_run_probe)
+
+    flags = {"compiler_flags": ["-fopenmp"], "linker_flags": ["-fopenmp"]}
+
+    assert check_openmp_support(openmp_flags=flags) is False
+
+    # Installing the OpenMP library should be detected by the next build
+    available.append(True)
+    _probes._PROBE_RESULTS.clear()
+    assert check_openmp_support(openmp_flags=flags) is True
+
+
+def test_openmp_probe_cache_disabled(monkeypatch):
+    from .. import _probes
+
+    calls = []
+
+    def fake_run_probe(ccompiler, probe, directory):
+        calls.append(probe.extra_compile_args)
+        return _probes.ProbeResult(False, "")
+
+    monkeypatch.setattr(_probes, "_run_probe", fake_run_probe)
+    monkeypatch.setenv("EXTENSION_HELPERS_CACHE_DIR", "")
+
+    flags = {"compiler_flags": ["-fopenmp"], "linker_flags": ["-fopenmp"]}
+
+    assert check_openmp_support(openmp_flags=flags) is False
+    _probes._PROBE_RESULTS.clear()
+    assert check_openmp_support(openmp_flags=flags) is False
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize(
+    ("outputs", "expected_flags"),
+    [
+        # A single program determines the compiler and checks OpenMP support
+        (["nthreads=1\n"], [["-fopenmp"]]),
+        # With icx, the program is built again with the icx flags
+        (["compiler=icx\nnthreads=1\n"] * 2, [["-fopenmp"], ["-qopenmp"]]),
+        # If the program cannot be built, a separate check for icx is done
+        ([None, "", "nthreads=1\n"], [["-fopenmp"], [], ["-qopenmp"]]),
+    ],
+)
+def test_openmp_fused_probe(monkeypatch, outputs, expected_flags):
+    from .. import _openmp_helpers, _probes
+
+    monkeypatch.setattr(_openmp_helpers, "get_compiler", lambda: "unix")
+    monkeypatch.setattr(_openmp_helpers, "_get_flag_value_from_var", lambda flag, var: None)
+
+    outputs = list(outputs)
+    calls = []
+
+    def fake_run_probe(ccompiler, probe, directory):
+        calls.append(probe.extra_compile_args)
+        output = outputs.pop(0)
+        return _probes.ProbeResult(output is not None, output or "")
+
+    monkeypatch.setattr(_probes, "_run_probe", fake_run_probe)
+
+    extension = Extension("test", [])
+    assert add_openmp_flags_if_available(extension)
+    assert calls == expected_flags
+    assert extension.extra_compile_args == expected_flags[-1]
+
+
+@pytest.mark.parametrize(
+    ("output", "expected"),
+    [
+        ("nthreads=2\nnthreads=2\n", True),
+        ("compiler=icx\nnthreads=1\n", True),
+        ("nthreads=2\n", False),
+        ("", False),
+    ],
+)
+def test_check_openmp_output(output, expected):
+    from .._openmp_helpers import _check_openmp_output
+
+    assert _check_openmp_output(output) is expected
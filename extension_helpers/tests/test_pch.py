@@ -0,0 +1,123 @@
+import sys
+from textwrap import dedent
+
+import pytest
+from setuptools import Extension
+
+from .._pch import (
+    PrecompiledHeaders,
+    get_extension_headers,
+    get_pch_language,
+    get_precompiled_headers_config,
+    read_dependency_file,
+)
+from .._pgo import get_compiler_family
+from .._setup_helpers import get_compiler
+
+
+def test_get_precompiled_headers_config(tmp_path, monkeypatch):
+    monkeypatch.delenv("EXTENSION_HELPERS_PRECOMPILED_HEADERS", raising=False)
+    assert get_precompiled_headers_config(str(tmp_path)) == []
+
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.extension-helpers]\nprecompiled-headers = ["Python.h"]\n'
+    )
+    assert get_precompiled_headers_config(str(tmp_path)) == [("*", ["Python.h"])]
+
+    (tmp_path / "pyproject.toml").write_text(dedent("""\
+        [tool.extension-helpers.precompiled-headers]
+        "pkg.*" = ["Python.h"]
+        "pkg.core.*" = ["Python.h", "numpy/arrayobject.h"]
+    """))
+    config = get_precompiled_headers_config(str(tmp_path))
+    assert config == [("pkg.*", ["Python.h"]), ("pkg.core.*", ["Python.h", "numpy/arrayobject.h"])]
+
+    # Later patterns take precedence, and extensions can set their own headers
+    assert get_extension_headers(config, Extension("pkg.io", [])) == ["Python.h"]
+    assert get_extension_headers(config, Extension("pkg.core._fast", [])) == [
+        "Python.h",
+        "numpy/arrayobject.h",
+    ]
+    assert get_extension_headers(config, Extension("other", [])) == []
+    ext = Extension("pkg.io", [])
+    ext.precompiled_headers = []
+    assert get_extension_headers(config, ext) == []
+
+    monkeypatch.setenv("EXTENSION_HELPERS_PRECOMPILED_HEADERS", "0")
+    assert get_precompiled_headers_config(str(tmp_path)) == []
+
+    monkeypatch.delenv("EXTENSION_HELPERS_PRECOMPILED_HEADERS")
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.extension-helpers.precompiled-headers]\n"pkg.*" = "Python.h"\n'
+    )
+    with pytest.raises(TypeError, match="headers for 'pkg.*' in pyproject.toml"):
+        get_precompiled_headers_config(str(tmp_path))
+
+
+def test_get_pch_language():
+    from setuptools.command.build_ext import new_compiler
+
+    ccompiler = new_compiler()
+    assert get_pch_language(ccompiler, ["a.c", "b.c"]) == "c"
+    assert get_pch_language(ccompiler, ["a.cpp", "b.cxx"]) == "c++"
+    assert get_pch_language(ccompiler, ["a.c", "b.cpp"]) is None
+    assert get_pch_language(ccompiler, ["a.m"]) is None
+    assert get_pch_language(ccompiler, []) is None
+
+
+def test_read_dependency_file(tmp_path):
+    assert read_dependency_file(str(tmp_path / "missing.d")) is None
+
+    dependency_file = tmp_path / "pch.d"
+    dependency_file.write_text(
+        "build/pch.h.gch: build/pch.h /usr/include/Python.h \\\n"
+        " /home/my\\ project/include/big.hpp\n"
+    )
+    assert read_dependency_file(str(dependency_file)) == [
+        "build/pch.h",
+        "/usr/include/Python.h",
+        "/home/my project/include/big.hpp",
+    ]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Not supported with MSVC")
+def test_precompiled_headers(tmp_path, caplog):
+    from setuptools.command.build_ext import customize_compiler, new_compiler
+
+    ccompiler = new_compiler()
+    customize_compiler(ccompiler)
+    family = get_compiler_family(ccompiler)
+    if family is None or get_compiler() != "unix":
+        pytest.skip("Precompiled headers are only supported with GCC and clang")
+
+    (tmp_path / "include").mkdir()
+    (tmp_path / "include" / "big.h").write_text("#define BIG 1\n")
+
+    def extension(name, sources, **kwargs):
+        ext = Extension(name, sources, include_dirs=[str(tmp_path / "include")], **kwargs)
+        ext.precompiled_headers = ["big.h"]
+        return ext
+
+    headers = PrecompiledHeaders(ccompiler, family, str(tmp_path / "pch"), [])
+
+    flags = headers.get_flags(extension("a", ["a.c"]))
+    assert flags
+    assert headers.built == 1
+
+    # Extensions with the same options share the precompiled header, while
+    # different options result in a different one
+    assert headers.get_flags(extension("b", ["b.c"])) == flags
+    other_flags = headers.get_flags(extension("c", ["c.c"], define_macros=[("SMALL", "1")]))
+    assert other_flags and other_flags != flags
+    assert headers.built == 2
+
+    # Headers which are up to date are not compiled again
+    headers = PrecompiledHeaders(ccompiler, family, str(tmp_path / "pch"), [])
+    assert headers.get_flags(extension("a", ["a.c"])) == flags
+    assert headers.built == 0
+
+    # If the header cannot be compiled, the extension is built without it
+    ext = extension("d", ["d.c"])
+    ext.precompiled_headers = ["missing.h"]
+    assert headers.get_flags(ext) == []
+    assert "could not precompile missing.h" in caplog.text
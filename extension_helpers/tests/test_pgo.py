@@ -0,0 +1,109 @@
+import os
+import sys
+import types
+
+import pytest
+from setuptools.errors import ExecError
+
+from .. import _pgo
+from .._pgo import (
+    get_compiler_family,
+    get_pgo_command,
+    get_pgo_flags,
+    merge_profiles,
+    run_training_command,
+)
+
+
+def test_get_pgo_command(tmp_path, monkeypatch):
+    monkeypatch.delenv("EXTENSION_HELPERS_PGO", raising=False)
+    monkeypatch.delenv("EXTENSION_HELPERS_PGO_COMMAND", raising=False)
+
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.extension-helpers]\npgo-command = "python -m pkg.bench --quick"\n'
+    )
+
+    # PGO needs to be enabled explicitly
+    assert get_pgo_command(str(tmp_path)) is None
+
+    monkeypatch.setenv("EXTENSION_HELPERS_PGO", "1")
+    assert get_pgo_command(str(tmp_path)) == [sys.executable, "-m", "pkg.bench", "--quick"]
+
+    monkeypatch.setenv("EXTENSION_HELPERS_PGO_COMMAND", "./train.sh")
+    assert get_pgo_command(str(tmp_path)) == ["./train.sh"]
+
+    monkeypatch.delenv("EXTENSION_HELPERS_PGO_COMMAND")
+    (tmp_path / "pyproject.toml").unlink()
+    with pytest.raises(ValueError, match="no training command"):
+        get_pgo_command(str(tmp_path))
+
+
+@pytest.mark.parametrize(
+    ("compiler_type", "version", "expected"),
+    [
+        ("unix", "gcc (GCC) 13.2.0\nCopyright (C) 2023 Free Software Foundation, Inc.", "gcc"),
+        ("unix", "Apple clang version 15.0.0 (clang-1500.1.0.2.5)", "clang"),
+        ("unix", "icx (ICX) 2024.0.0", None),
+        ("msvc", "", None),
+    ],
+)
+def test_get_compiler_family(monkeypatch, compiler_type, version, expected):
+    versions = {}
+
+    def fake_get_compiler_version(executable):
+        versions[executable] = version
+        return version
+
+    monkeypatch.setattr(_pgo, "_get_compiler_version", fake_get_compiler_version)
+
+    ccompiler = types.SimpleNamespace(
+        compiler_type=compiler_type, compiler_so=["/usr/bin/ccache", "cc", "-O2"]
+    )
+    assert get_compiler_family(ccompiler) == expected
+
+    # Compiler launchers should be skipped
+    if compiler_type == "unix":
+        assert list(versions) == ["cc"]
+
+
+def test_get_pgo_flags():
+    assert get_pgo_flags("gcc", "generate", "/pgo") == (
+        ["-fprofile-generate=/pgo"],
+        ["-fprofile-generate=/pgo"],
+    )
+    assert get_pgo_flags("gcc", "use", "/pgo") == (
+        ["-fprofile-use=/pgo", "-fprofile-correction"],
+        ["-fprofile-use=/pgo"],
+    )
+    assert get_pgo_flags("clang", "use", "/pgo/merged.profdata") == (
+        ["-fprofile-use=/pgo/merged.profdata"],
+        ["-fprofile-use=/pgo/merged.profdata"],
+    )
+
+
+def test_merge_profiles(tmp_path, monkeypatch):
+    with pytest.raises(ExecError, match="did not write profile data"):
+        merge_profiles("gcc", str(tmp_path))
+    with pytest.raises(ExecError, match="did not write profile data"):
+        merge_profiles("clang", str(tmp_path))
+
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "module.gcda").write_bytes(b"")
+    assert merge_profiles("gcc", str(tmp_path)) == str(tmp_path)
+
+    (tmp_path / "default_1.profraw").write_bytes(b"")
+    monkeypatch.setenv("LLVM_PROFDATA", f"{sys.executable} -c pass")
+    assert merge_profiles("clang", str(tmp_path)) == str(tmp_path / "merged.profdata")
+
+
+def test_run_training_command(tmp_path, monkeypatch):
+    monkeypatch.setenv("PYTHONPATH", "existing")
+
+    output = tmp_path / "pythonpath.txt"
+    script = f"import os; open({str(output)!r}, 'w').write(os.environ['PYTHONPATH'])"
+    run_training_command([sys.executable, "-c", script], pythonpath=["first", "second"])
+
+    assert output.read_text() == os.pathsep.join(["first", "second", "existing"])
+
+    with pytest.raises(ExecError, match="failed with exit code 3"):
+        run_training_command([sys.executable, "-c", "raise SystemExit(3)"])
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from .. import _probes
+from .._probes import (
+    Probe,
+    compiles,
+    has_flag,
+    has_function,
+    has_header,
+    has_linker_flag,
+    run_probes,
+    run_probes_async,
+)
+
+unix_only = pytest.mark.skipif(sys.platform == "win32", reason="uses GCC-style flags")
+
+
+def test_has_header():
+    assert has_header("stdio.h")
+    assert not has_header("extension_helpers_missing.h")
+
+
+def test_has_function():
+    assert has_function("printf", headers=["stdio.h"])
+    assert has_function("strlen")
+    assert not has_function("extension_helpers_missing_function")
+    assert not has_function("extension_helpers_missing_function", headers=["stdio.h"])
+
+
+def test_compiles():
+    assert compiles("int f(void) { return 1; }")
+    assert not compiles("int f(void) { return 1 }")
+    assert compiles("int f(int x) { return x; }", language="c++")
+
+    # Code without main can be compiled but not linked
+    assert not compiles("int f(void) { return 1; }", link=True)
+
+
+@unix_only
+def test_has_flag():
+    assert has_flag("-O2")
+    assert not has_flag("--extension-helpers-invalid-flag")
+    assert has_linker_flag("-lm")
+    assert not has_linker_flag("--extension-helpers-invalid-flag")
+
+    # Flags which are only accepted with a warning are rejected
+    assert not has_flag("-std=c++17")
+    assert has_flag("-std=c++17", language="c++")
+
+
+def test_run_probes(tmp_path):
+    start_dir = os.getcwd()
+    probes = [
+        Probe('#include <stdio.h>\nint main(void) { printf("hello"); return 0; }', run=True),
+        Probe.header("extension_helpers_missing.h"),
+        Probe("int main(void) { return 1; }", run=True),
+        Probe.header("stdio.h"),
+    ]
+
+    results = run_probes(probes, max_workers=4)
+
+    assert [result.success for result in results] == [True, False, False, True]
+    assert results[0].output == "hello"
+    assert results[3].output == ""
+
+    # The probes should not change the current directory or write to it
+    assert os.getcwd() == start_dir
+    assert not os.path.exists("probe.c")
+
+
+def test_run_probes_cached(monkeypatch):
+    calls = []
+
+    def fake_run_probe(ccompiler, probe, directory):
+        calls.append(probe.description)
+        assert os.path.isabs(directory)
+        return _probes.ProbeResult(probe.description != "header b.h", "")
+
+    monkeypatch.setattr(_probes, "_run_probe", fake_run_probe)
+
+    # Identical probes should only be run once
+    probes = [Probe.header("a.h"), Probe.header("b.h"), Probe.header("a.h")]
+    assert [bool(result) for result in run_probes(probes)] == [True, False, True]
+    assert sorted(calls) == ["header a.h", "header b.h"]
+
+    # Results should be cached in-process, and on disk only if successful
+    assert has_header("a.h")
+    assert not has_header("b.h")
+    assert len(calls) == 2
+    _probes._PROBE_RESULTS.clear()
+    assert has_header("a.h")
+    assert len(calls) == 2
+    assert not has_header("b.h")
+    assert len(calls) == 3
+
+    # Any option should invalidate the cache
+    assert has_header("a.h", include_dirs=["include"])
+    assert len(calls) == 4
+
+    monkeypatch.setenv("CFLAGS", "-O3")
+    assert has_header("a.h")
+    assert len(calls) == 5
+
+
+def test_run_probes_threads(monkeypatch):
+    calls = []
+    lock = threading.Lock()
+
+    def fake_run_probe(ccompiler, probe, directory):
+        with lock:
+            calls.append(probe.description)
+        time.sleep(0.05)
+        return _probes.ProbeResult(True, "")
+
+    monkeypatch.setattr(_probes, "_run_probe", fake_run_probe)
+
+    # Probes needed by several threads at the same time should only be run once
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda i: has_header(f"header{i % 2}.h"), range(16)))
+
+    assert all(results)
+    assert sorted(calls) == ["header header0.h", "header header1.h"]
+
+
+def test_run_probes_async():
+    async def check_extensions():
+        return await asyncio.gather(
+            run_probes_async([Probe.header("stdio.h")]),
+            run_probes_async([Probe.header("extension_helpers_missing.h"), Probe.header("math.h")]),
+        )
+
+    first, second = asyncio.run(check_extensions())
+    assert [bool(result) for result in first] == [True]
+    assert [bool(result) for result in second] == [False, True]
+
+
+def test_probe_invalid_language():
+    with pytest.raises(ValueError, match="language should be"):
+        Probe("", language="fortran")
@@ -0,0 +1,142 @@
+import pytest
+from setuptools import Extension
+
+from .. import _profiles
+from .._probes import ProbeResult
+from .._profiles import (
+    apply_profile,
+    get_extension_settings,
+    get_profile,
+    get_profile_flags,
+)
+
+PYPROJECT = """\
+[tool.extension-helpers]
+profile = "fast"
+
+[tool.extension-helpers.profiles.fast]
+optimization = 3
+fast-math = true
+define-macros = ["NDEBUG", "FAST=1"]
+
+[[tool.extension-helpers.profiles.fast.overrides]]
+extensions = ["pkg.exact.*"]
+fast-math = false
+
+[tool.extension-helpers.profiles.native]
+frame-pointers = true
+"""
+
+
+def test_get_profile(tmp_path, monkeypatch):
+    monkeypatch.delenv("EXTENSION_HELPERS_PROFILE", raising=False)
+    assert get_profile(str(tmp_path)) == (None, {})
+
+    # Built-in profiles are available without configuration
+    monkeypatch.setenv("EXTENSION_HELPERS_PROFILE", "debug")
+    name, settings = get_profile(str(tmp_path))
+    assert name == "debug"
+    assert settings["optimization"] == "0"
+
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+
+    # Profiles from pyproject.toml are merged into the built-in ones
+    monkeypatch.setenv("EXTENSION_HELPERS_PROFILE", "native")
+    name, settings = get_profile(str(tmp_path))
+    assert settings == {
+        "optimization": "3",
+        "march": "native",
+        "define-macros": ["NDEBUG"],
+        "frame-pointers": True,
+    }
+
+    monkeypatch.delenv("EXTENSION_HELPERS_PROFILE")
+    name, settings = get_profile(str(tmp_path))
+    assert name == "fast"
+    assert settings["optimization"] == 3
+
+    monkeypatch.setenv("EXTENSION_HELPERS_PROFILE", "none")
+    assert get_profile(str(tmp_path)) == (None, {})
+
+    monkeypatch.setenv("EXTENSION_HELPERS_PROFILE", "turbo")
+    with pytest.raises(ValueError, match="Unknown build profile 'turbo'"):
+        get_profile(str(tmp_path))
+
+    (tmp_path / "pyproject.toml").write_text(
+        "[tool.extension-helpers.profiles.turbo]\nunroll = true\n"
+    )
+    with pytest.raises(ValueError, match="Unknown settings in build profile 'turbo': unroll"):
+        get_profile(str(tmp_path))
+
+
+def test_get_extension_settings():
+    settings = {
+        "optimization": 3,
+        "fast-math": True,
+        "overrides": [
+            {"extensions": ["pkg.exact.*"], "fast-math": False},
+            {"extensions": ["pkg.exact.slow", "pkg.other"], "optimization": 2},
+        ],
+    }
+    assert get_extension_settings(settings, "pkg.ext") == {"optimization": 3, "fast-math": True}
+    assert get_extension_settings(settings, "pkg.exact.fast") == {
+        "optimization": 3,
+        "fast-math": False,
+    }
+    assert get_extension_settings(settings, "pkg.exact.slow") == {
+        "optimization": 2,
+        "fast-math": False,
+    }
+
+
+def test_get_profile_flags():
+    settings = {
+        "optimization": 3,
+        "march": "native",
+        "fast-math": True,
+        "frame-pointers": True,
+        "debug": True,
+        "extra-compile-args": ["-Wall"],
+        "extra-link-args": ["-Wl,--as-needed"],
+    }
+    assert get_profile_flags("unix", settings) == (
+        ["-O3", "-march=native", "-ffast-math", "-fno-omit-frame-pointer", "-g", "-Wall"],
+        ["-Wl,--as-needed"],
+    )
+    assert get_profile_flags("msvc", {**settings, "extra-link-args": []}) == (
+        ["/O2", "/fp:fast", "/Oy-", "/Zi", "-Wall"],
+        ["/DEBUG"],
+    )
+    assert get_profile_flags("unix", {"optimization": "s", "frame-pointers": False}) == (
+        ["-Os", "-fomit-frame-pointer"],
+        [],
+    )
+
+
+def test_apply_profile(tmp_path, monkeypatch):
+    monkeypatch.delenv("EXTENSION_HELPERS_PROFILE", raising=False)
+    (tmp_path / "pyproject.toml").write_text(PYPROJECT)
+
+    probed = []
+
+    def fake_run_probes(probes):
+        probed.extend(probe.extra_compile_args[-1] for probe in probes)
+        return [ProbeResult(probe.extra_compile_args[-1] != "-ffast-math", "") for probe in probes]
+
+    monkeypatch.setattr(_profiles, "run_probes", fake_run_probes)
+
+    extensions = [
+        Extension("pkg.ext", ["pkg/ext.c"], extra_compile_args=["-Wall"]),
+        Extension("pkg.exact.ext", ["pkg/exact/ext.c"]),
+    ]
+    assert apply_profile(extensions, "unix", srcdir=str(tmp_path)) == "fast"
+
+    # Each flag is only checked once, and unsupported flags are dropped
+    assert probed == ["-O3", "-ffast-math"]
+    assert extensions[0].extra_compile_args == ["-Wall", "-O3"]
+    assert extensions[1].extra_compile_args == ["-O3"]
+    assert extensions[0].define_macros == [("NDEBUG", None), ("FAST", "1")]
+
+    monkeypatch.setenv("EXTENSION_HELPERS_PROFILE", "none")
+    assert apply_profile(extensions, "unix", srcdir=str(tmp_path)) is None
+    assert extensions[1].extra_compile_args == ["-O3"]
@@ -1,5 +1,6 @@
 import importlib
 import os
+import shutil
 import subprocess
 import sys
 import uuid
@@ -7,7 +8,7 @@ from textwrap import dedent
 
 import pytest
 
-from .._setup_helpers import get_compiler, get_extensions
+from .._setup_helpers import get_compiler, get_extensions, pkg_config
 from . import cleanup_import, run_setup
 
 if sys.version_info >= (3, 11):
@@ -166,6 +167,89 @@ def test_cython_autoextensions(tmp_path):
     assert ext_modules[0].name == "yoda.luke.dagobah"
 
 
+def test_cython_autoextensions_nested_dist(tmp_path):
+    """
+    Sub-packages named like the build and dist directories should not be
+    ignored.
+    """
+
+    test_pkg = tmp_path / "test_pkg"
+    os.makedirs(test_pkg / "yoda" / "dist")
+    (test_pkg / "yoda" / "__init__.py").touch()
+    (test_pkg / "yoda" / "dist" / "__init__.py").touch()
+    (test_pkg / "yoda" / "dist" / "fast.pyx").write_text("def testfunc(): pass")
+
+    ext_modules = get_extensions(str(test_pkg))
+
+    assert [ext.name for ext in ext_modules][:1] == ["yoda.dist.fast"]
+
+
+def test_cython_autoextensions_directives(tmp_path):
+    test_pkg = tmp_path / "test_pkg"
+    os.makedirs(test_pkg / "yoda" / "luke")
+    (test_pkg / "yoda" / "__init__.py").touch()
+    (test_pkg / "yoda" / "luke" / "__init__.py").touch()
+    (test_pkg / "yoda" / "force.pyx").write_text("def testfunc(): pass")
+    (test_pkg / "yoda" / "luke" / "dagobah.pyx").write_text("def testfunc(): pass")
+    (test_pkg / "pyproject.toml").write_text(dedent("""\
+        [tool.extension-helpers.cython-directives]
+        "yoda.luke" = {boundscheck = false, initializedcheck = false}
+        "yoda.*" = {language_level = 3}
+    """))
+
+    ext_modules = {ext.name: ext for ext in get_extensions(str(test_pkg))}
+
+    assert ext_modules["yoda.force"].cython_directives == {"language_level": 3}
+    assert ext_modules["yoda.luke.dagobah"].cython_directives == {
+        "boundscheck": False,
+        "initializedcheck": False,
+        "language_level": 3,
+    }
+
+
+def test_cython_autoextensions_directives_cache(tmp_path, monkeypatch):
+    """
+    Make sure that changing the Cython directives in pyproject.toml
+    invalidates the discovery manifest.
+    """
+
+    monkeypatch.setenv("EXTENSION_HELPERS_DISCOVERY_CACHE", "1")
+
+    test_pkg = tmp_path / "test_pkg"
+    os.makedirs(test_pkg / "yoda")
+    (test_pkg / "yoda" / "__init__.py").touch()
+    (test_pkg / "yoda" / "force.pyx").write_text("def testfunc(): pass")
+    pyproject = test_pkg / "pyproject.toml"
+    pyproject.write_text(dedent("""\
+        [tool.extension-helpers.cython-directives]
+        "yoda.*" = {boundscheck = false}
+    """))
+
+    ext_modules = get_extensions(str(test_pkg))
+    assert ext_modules[0].cython_directives == {"boundscheck": False}
+
+    pyproject.write_text(pyproject.read_text().replace("false", "true"))
+    ext_modules = get_extensions(str(test_pkg))
+    assert ext_modules[0].cython_directives == {"boundscheck": True}
+
+
+def test_compiler_module_source_unchanged(c_extension_test_package):
+    """
+    Test that the source of the compiler module is not re-written by
+    subsequent calls to get_extensions, which would cause it to be rebuilt.
+    """
+
+    test_pkg = c_extension_test_package
+
+    get_extensions(str(test_pkg))
+    compiler_c = test_pkg / "helpers_test_package" / "_compiler.c"
+    assert compiler_c.is_file()
+    os.utime(compiler_c, ns=(0, 0))
+
+    get_extensions(str(test_pkg))
+    assert compiler_c.stat().st_mtime_ns == 0
+
+
 def test_compiler_module(capsys, c_extension_test_package):
     """
     Test ensuring that the compiler module is built and installed for packages
@@ -538,3 +622,399 @@ def test_limited_api_invalid_abi(tmp_path, capsys):
         )
 
     assert b"ValueError: Unrecognized abi version for limited API: invalid" in result.stderr
+
+
+def test_get_extensions_discovery_cache(tmp_path):
+    """
+    Make sure that the discovery manifest is reused as long as the source
+    tree does not change, and is invalidated when it does.
+    """
+
+    test_pkg = tmp_path / "test_pkg"
+    os.makedirs(test_pkg / "yoda" / "luke")
+    (test_pkg / "yoda" / "__init__.py").touch()
+    (test_pkg / "yoda" / "luke" / "__init__.py").touch()
+    (test_pkg / "yoda" / "luke" / "dagobah.pyx").write_text("""def testfunc(): pass""")
+
+    # The setup_package.py file records each time it is evaluated
+    calls = tmp_path / "calls.txt"
+    setup_package = test_pkg / "yoda" / "setup_package.py"
+    setup_package.write_text(dedent(f"""\
+        from setuptools import Extension
+        def get_extensions():
+            with open(r'{calls}', 'a') as f:
+                f.write('x')
+            return [Extension('yoda.hoth', ['yoda/hoth.c'], define_macros=[('A', '1')])]
+    """))
+
+    def ext_names(ext_modules):
+        return [ext.name for ext in ext_modules]
+
+    ext_modules = get_extensions(str(test_pkg), use_cache=True)
+    assert ext_names(ext_modules) == ["yoda.hoth", "yoda.luke.dagobah", "yoda.compiler_version"]
+    assert calls.read_text() == "x"
+
+    ext_modules = get_extensions(str(test_pkg), use_cache=True)
+    assert ext_names(ext_modules) == ["yoda.hoth", "yoda.luke.dagobah", "yoda.compiler_version"]
+    assert ext_modules[0].define_macros == [("A", "1")]
+    assert calls.read_text() == "x"
+
+    # Adding a .pyx file should invalidate the manifest
+    (test_pkg / "yoda" / "luke" / "endor.pyx").write_text("""def testfunc(): pass""")
+    ext_modules = get_extensions(str(test_pkg), use_cache=True)
+    assert len(ext_modules) == 4
+    assert calls.read_text() == "xx"
+
+    # As should changing a setup_package.py file
+    setup_package.write_text(setup_package.read_text().replace("'1'", "'2'"))
+    ext_modules = get_extensions(str(test_pkg), use_cache=True)
+    assert ext_modules[0].define_macros == [("A", "2")]
+    assert calls.read_text() == "xxx"
+
+    # And the manifest should not be used if the cache is not enabled
+    get_extensions(str(test_pkg))
+    assert calls.read_text() == "xxxx"
+
+
+def test_get_extensions_discovery_cache_simd(tmp_path):
+    """
+    Make sure that the files written while discovering SIMD variants do not
+    invalidate the discovery manifest.
+    """
+
+    test_pkg = tmp_path / "test_pkg"
+    os.makedirs(test_pkg / "yoda")
+    (test_pkg / "yoda" / "__init__.py").touch()
+    (test_pkg / "yoda" / "_kernels.c").touch()
+
+    calls = tmp_path / "calls.txt"
+    (test_pkg / "yoda" / "setup_package.py").write_text(dedent(f"""\
+        from setuptools import Extension
+        from extension_helpers import add_simd_variants
+
+        def get_extensions():
+            with open(r'{calls}', 'a') as f:
+                f.write('x')
+            return add_simd_variants(Extension('yoda._kernels', ['yoda/_kernels.c']))
+    """))
+
+    with chdir(test_pkg):
+        first = [ext.name for ext in get_extensions(use_cache=True)]
+        assert "yoda._cpu_features" in first
+        assert os.path.exists(os.path.join("yoda", "_kernels.py"))
+        assert os.path.exists(os.path.join("yoda", "cpu_features.py"))
+        second = [ext.name for ext in get_extensions(use_cache=True)]
+
+    assert second == first
+    assert calls.read_text() == "x"
+
+
+def test_lazy_extensions(tmp_path, monkeypatch):
+    """
+    Make sure that enabling extension-helpers through the configuration files
+    does not collect extensions until they are actually needed.
+    """
+
+    from setuptools.dist import Distribution
+
+    from .. import _finalize_distribution_hook, _setup_helpers
+
+    test_pkg = tmp_path / "test_pkg"
+    os.makedirs(test_pkg / "yoda" / "luke")
+    (test_pkg / "yoda" / "__init__.py").touch()
+    (test_pkg / "yoda" / "luke" / "__init__.py").touch()
+    (test_pkg / "yoda" / "luke" / "dagobah.pyx").write_text("""def testfunc(): pass""")
+    (test_pkg / "pyproject.toml").write_text(dedent("""\
+        [tool.extension-helpers]
+        use_extension_helpers = true
+    """))
+
+    calls = []
+    original_get_extensions = _setup_helpers.get_extensions
+
+    def get_extensions(srcdir="."):
+        calls.append(srcdir)
+        return original_get_extensions(srcdir)
+
+    monkeypatch.setattr(_setup_helpers, "get_extensions", get_extensions)
+
+    with chdir(test_pkg):
+        distribution = Distribution({"name": "yoda", "packages": ["yoda", "yoda.luke"]})
+        _finalize_distribution_hook(distribution)
+
+        # Metadata-only operations should not trigger discovery
+        assert isinstance(distribution.ext_modules, list)
+        assert sorted(distribution.iter_distribution_names()) == ["yoda", "yoda.luke"]
+        assert calls == []
+
+        # But accessing the extensions should
+        assert [ext.name for ext in distribution.ext_modules] == [
+            "yoda.luke.dagobah",
+            "yoda.compiler_version",
+        ]
+        assert len(distribution.ext_modules) == 2
+        assert distribution.has_ext_modules()
+        assert calls == ["."]
+
+
+def test_lazy_extensions_build_meta(tmp_path, monkeypatch):
+    """
+    Make sure that the PEP 517 hooks which only need the metadata of the
+    package do not evaluate any setup_package.py file.
+    """
+
+    from setuptools import build_meta
+
+    try:
+        import setuptools.command.bdist_wheel  # noqa: F401
+    except ImportError:
+        pytest.importorskip("wheel")
+
+    # Register the entry point of extension-helpers, as done when it is
+    # installed in the build environment.
+    site = tmp_path / "site"
+    dist_info = site / "extension_helpers_hook-0.0.dist-info"
+    dist_info.mkdir(parents=True)
+    (dist_info / "METADATA").write_text("Metadata-Version: 2.1\nName: extension-helpers-hook\n")
+    (dist_info / "entry_points.txt").write_text(dedent("""\
+        [setuptools.finalize_distribution_options]
+        extension_helpers_get_extensions = extension_helpers:_finalize_distribution_hook
+    """))
+    monkeypatch.syspath_prepend(str(site))
+
+    test_pkg = tmp_path / "test_pkg"
+    os.makedirs(test_pkg / "yoda")
+    (test_pkg / "yoda" / "__init__.py").touch()
+    (test_pkg / "yoda" / "setup_package.py").write_text(dedent("""\
+        with open('evaluated.txt', 'a') as f:
+            f.write('setup_package.py\\n')
+
+        def get_extensions():
+            return []
+    """))
+    (test_pkg / "pyproject.toml").write_text(dedent("""\
+        [project]
+        name = "yoda"
+        version = "0.1"
+
+        [tool.extension-helpers]
+        use_extension_helpers = true
+    """))
+    (tmp_path / "metadata").mkdir()
+
+    with chdir(test_pkg):
+        build_meta.get_requires_for_build_wheel()
+        build_meta.prepare_metadata_for_build_wheel(str(tmp_path / "metadata"))
+        assert not os.path.exists("evaluated.txt")
+
+        build_meta.build_sdist(str(tmp_path / "dist"))
+        assert os.path.exists("evaluated.txt")
+
+
+def test_lazy_extensions_no_extensions(tmp_path):
+    from setuptools.dist import Distribution
+
+    from .._setup_helpers import set_lazy_extensions
+
+    (tmp_path / "yoda").mkdir()
+    (tmp_path / "yoda" / "__init__.py").touch()
+
+    # Outside of the metadata commands, whether the package has extensions is
+    # determined by collecting them
+    distribution = Distribution({"name": "yoda", "packages": ["yoda"]})
+    set_lazy_extensions(distribution, str(tmp_path))
+    assert not distribution.ext_modules.loaded
+    assert not distribution.has_ext_modules()
+    assert distribution.ext_modules.loaded
+    assert distribution.ext_modules == []
+
+
+@pytest.mark.parametrize(
+    ("operation", "expected"),
+    [
+        (lambda ext_modules: [] + ext_modules, ["a", "b"]),
+        (lambda ext_modules: ext_modules + [], ["a", "b"]),
+        (lambda ext_modules: 2 * ext_modules, ["a", "b", "a", "b"]),
+        (lambda ext_modules: ext_modules * 2, ["a", "b", "a", "b"]),
+        (lambda ext_modules: ext_modules.__imul__(1), ["a", "b"]),
+        (lambda ext_modules: [] < ext_modules, True),
+        (lambda ext_modules: [] <= ext_modules, True),
+        (lambda ext_modules: [] > ext_modules, False),
+        (lambda ext_modules: [] >= ext_modules, False),
+        (lambda ext_modules: [] == ext_modules, False),
+        (lambda ext_modules: [] != ext_modules, True),
+    ],
+)
+def test_lazy_extensions_operators(monkeypatch, operation, expected):
+    """
+    Make sure that operations on lists which are implemented by the list on
+    the left side also collect the extensions.
+    """
+
+    from .. import _setup_helpers
+
+    monkeypatch.setattr(_setup_helpers, "get_extensions", lambda srcdir=".": ["a", "b"])
+
+    ext_modules = _setup_helpers._LazyExtensionList()
+    assert operation(ext_modules) == expected
+    assert ext_modules.loaded
+
+
+@pytest.mark.skipif(sys.platform in ("win32", "darwin"), reason="parallel discovery requires fork")
+def test_get_extensions_parallel(tmp_path, caplog):
+    """
+    Make sure that evaluating setup_package.py files in separate processes
+    gives the same result as evaluating them sequentially.
+    """
+
+    test_pkg = tmp_path / "test_pkg"
+    for name in ["alpha", "beta", "gamma"]:
+        os.makedirs(test_pkg / "yoda" / name)
+        (test_pkg / "yoda" / name / "__init__.py").touch()
+        (test_pkg / "yoda" / name / "setup_package.py").write_text(dedent(f"""\
+            import os
+            from setuptools import Extension
+            def get_extensions():
+                return [
+                    Extension('yoda.{name}.ext1', ['yoda/{name}/ext1.c']),
+                    Extension('yoda.{name}.ext2', ['yoda/{name}/ext2.c'],
+                              define_macros=[('PID', str(os.getpid()))]),
+                ]
+        """))
+    (test_pkg / "yoda" / "__init__.py").touch()
+
+    # A setup_package.py file which returns an extension defined in the file
+    # itself, which cannot be transferred between processes
+    (test_pkg / "yoda" / "alpha" / "setup_package.py").write_text(dedent("""\
+        from setuptools import Extension
+        class CustomExtension(Extension):
+            pass
+        def get_extensions():
+            return [CustomExtension('yoda.alpha.ext1', ['yoda/alpha/ext1.c'])]
+    """))
+
+    serial = get_extensions(str(test_pkg))
+
+    caplog.clear()
+    with caplog.at_level("INFO"):
+        parallel = get_extensions(str(test_pkg), jobs=3)
+
+    assert [ext.name for ext in parallel] == [ext.name for ext in serial]
+    assert [ext.name for ext in parallel] == [
+        "yoda.alpha.ext1",
+        "yoda.beta.ext1",
+        "yoda.beta.ext2",
+        "yoda.gamma.ext1",
+        "yoda.gamma.ext2",
+        "yoda.compiler_version",
+    ]
+
+    # Each file should have been evaluated in a different process
+    pids = {ext.define_macros[0][1] for ext in parallel if ext.define_macros}
+    assert len(pids) == 2
+    assert str(os.getpid()) not in pids
+
+    # And the time taken by each file should be reported
+    assert caplog.text.count("Evaluated") == 3
+
+
+PC_FILE = """\
+prefix=/opt/{name}
+Name: {name}
+Description: Test package
+Version: {version}
+Cflags: -I${{prefix}}/include -DHAVE_{upper}=1 -pthread
+Libs: -L${{prefix}}/lib -l{name}
+"""
+
+
+@pytest.fixture
+def pkg_config_dir(tmp_path, monkeypatch):
+    if shutil.which("pkg-config") is None:
+        pytest.skip("pkg-config is not available")
+
+    from .. import _setup_helpers
+
+    pc_dir = tmp_path / "pkgconfig"
+    pc_dir.mkdir()
+    for name in ["spam", "eggs"]:
+        (pc_dir / f"{name}.pc").write_text(
+            PC_FILE.format(name=name, upper=name.upper(), version="1.0")
+        )
+
+    monkeypatch.setenv("PKG_CONFIG_LIBDIR", str(pc_dir))
+    monkeypatch.delenv("PKG_CONFIG_PATH", raising=False)
+    monkeypatch.setattr(_setup_helpers, "_PKG_CONFIG_RESULTS", {})
+
+    calls = []
+    original_lookup = _setup_helpers._pkg_config_lookup
+
+    def lookup(packages, executable):
+        calls.append(list(packages))
+        return original_lookup(packages, executable)
+
+    monkeypatch.setattr(_setup_helpers, "_pkg_config_lookup", lookup)
+
+    return pc_dir, calls
+
+
+def test_pkg_config(pkg_config_dir):
+    _pc_dir, calls = pkg_config_dir
+
+    result = pkg_config(["spam"], ["default"])
+    assert result["include_dirs"] == ["/opt/spam/include"]
+    assert result["library_dirs"] == ["/opt/spam/lib"]
+    assert result["libraries"] == ["spam"]
+    assert result["define_macros"] == [("HAVE_SPAM", "1")]
+
+    # The result should be cached in-process, and modifying the returned
+    # value should not affect the cache
+    result["libraries"].append("modified")
+    assert pkg_config(["spam"], ["default"])["libraries"] == ["spam"]
+    assert calls == [["spam"]]
+
+    # Failed lookups use the default libraries
+    assert pkg_config(["missing"], ["default"])["libraries"] == ["default"]
+    assert pkg_config(["missing"], ["other"])["libraries"] == ["other"]
+    assert calls == [["spam"], ["missing"]]
+
+
+def test_pkg_config_persistent_cache(pkg_config_dir, monkeypatch):
+    from .. import _setup_helpers
+
+    pc_dir, calls = pkg_config_dir
+
+    monkeypatch.setenv("EXTENSION_HELPERS_PKG_CONFIG_CACHE", "1")
+
+    assert pkg_config(["spam"], [])["libraries"] == ["spam"]
+    _setup_helpers._PKG_CONFIG_RESULTS.clear()
+    assert pkg_config(["spam"], [])["libraries"] == ["spam"]
+    assert calls == [["spam"]]
+
+    # Modifying a .pc file should invalidate the cache
+    (pc_dir / "spam.pc").write_text(
+        PC_FILE.format(name="spam", upper="SPAM", version="2.0").replace("-lspam", "-lspam2")
+    )
+    os.utime(pc_dir / "spam.pc", ns=(0, 0))
+    _setup_helpers._PKG_CONFIG_RESULTS.clear()
+    assert pkg_config(["spam"], [])["libraries"] == ["spam2"]
+    assert calls == [["spam"], ["spam"]]
+
+
+def test_pkg_config_batch(pkg_config_dir):
+    from .._setup_helpers import pkg_config_batch
+
+    _pc_dir, calls = pkg_config_dir
+
+    results = pkg_config_batch(
+        [(["spam"], []), (["eggs"], []), (["spam", "eggs"], []), (["spam"], []), (["x"], ["y"])]
+    )
+
+    assert [result["libraries"] for result in results] == [
+        ["spam"],
+        ["eggs"],
+        ["spam", "eggs"],
+        ["spam"],
+        ["y"],
+    ]
+    assert sorted(calls) == [["eggs"], ["spam"], ["spam", "eggs"], ["x"]]
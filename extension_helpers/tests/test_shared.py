@@ -0,0 +1,55 @@
+import os
+
+from setuptools import Extension
+from setuptools.command.build_ext import Library
+
+from .._shared import find_shared_sources, is_outdated, remove_shared_sources
+
+
+def test_find_shared_sources(tmp_path):
+    for name in ["a.c", "b.c", "common.c", "util.cpp", "gen.c", "gen.pyx"]:
+        (tmp_path / name).write_text("")
+
+    def source(name):
+        return str(tmp_path / name)
+
+    ext_a = Extension("pkg.a", [source("a.c"), source("common.c"), source("util.cpp")])
+    # The same source with a different spelling of its path
+    ext_b = Extension(
+        "pkg.b",
+        [source("b.c"), os.path.relpath(source("common.c")), source("gen.c"), source("util.cpp")],
+    )
+    # Sources compiled with different options are not shared
+    ext_c = Extension("pkg.c", [source("common.c")], define_macros=[("DEBUG", "1")])
+    ext_d = Extension("pkg.d", [source("gen.c"), source("util.cpp")])
+    library = Library("pkg.lib", [source("common.c")])
+
+    shared = find_shared_sources([ext_a, ext_b, ext_c, ext_d, library])
+
+    assert [(item.source, item.extensions) for item in shared] == [
+        (source("common.c"), [ext_a, ext_b]),
+        (source("util.cpp"), [ext_a, ext_b, ext_d]),
+    ]
+
+
+def test_remove_shared_sources():
+    ext = Extension("pkg.a", ["pkg/a.c", os.path.abspath("pkg/common.c")], depends=["pkg/a.h"])
+    remove_shared_sources(ext, ["pkg/common.c"])
+    assert ext.sources == ["pkg/a.c"]
+    assert ext.depends == ["pkg/a.h", "pkg/common.c"]
+
+
+def test_is_outdated(tmp_path):
+    source = tmp_path / "source.c"
+    target = tmp_path / "source.o"
+
+    source.write_text("")
+    assert is_outdated(str(target), [str(source)])
+
+    target.write_text("")
+    os.utime(source, (0, 0))
+    assert not is_outdated(str(target), [str(source), str(tmp_path / "missing.h")])
+
+    os.utime(target, (0, 0))
+    os.utime(source, (10, 10))
+    assert is_outdated(str(target), [str(source)])
@@ -0,0 +1,176 @@
+import importlib
+import os
+import sys
+from textwrap import dedent
+
+import pytest
+from setuptools import Extension
+
+from .. import _simd
+from .._setup_helpers import get_compiler
+from .._simd import (
+    add_simd_variants,
+    generate_cpu_features_py,
+    get_simd_flags,
+    get_supported_simd_targets,
+    is_simd_variant,
+)
+from . import cleanup_import, run_setup
+
+if sys.version_info >= (3, 11):
+    from contextlib import chdir
+else:
+    from .py311_backports import chdir
+
+extension_helpers_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def test_get_simd_flags():
+    assert get_simd_flags("unix", "avx2") == ["-mavx2", "-mfma"]
+    assert get_simd_flags("msvc", "avx512") == ["/arch:AVX512"]
+
+
+def test_get_supported_simd_targets():
+    # Whether the targets are supported depends on the platform, but the
+    # order should be preserved and unsupported flags should be rejected.
+    supported = get_supported_simd_targets(["avx2", "avx"])
+    assert supported in ([], ["avx"], ["avx2", "avx"])
+
+
+def test_add_simd_variants(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        _simd,
+        "get_supported_simd_targets",
+        lambda targets, compiler_type=None: [target for target in targets if target != "avx512"],
+    )
+
+    (tmp_path / "pkg" / "sub").mkdir(parents=True)
+    extension = Extension(
+        "pkg.sub._kernels",
+        ["pkg/sub/_kernels.c"],
+        define_macros=[("NDEBUG", None)],
+        extra_compile_args=["-O3"],
+    )
+
+    variants = add_simd_variants(extension, targets=["avx2", "avx512"], srcdir=str(tmp_path))
+
+    assert [variant.name for variant in variants] == [
+        "pkg.sub._kernels_avx2",
+        "pkg.sub._kernels_baseline",
+    ]
+    assert variants[0].extra_compile_args == ["-O3", *get_simd_flags(get_compiler(), "avx2")]
+    assert variants[0].define_macros == [
+        ("NDEBUG", None),
+        ("PyInit__kernels", "PyInit__kernels_avx2"),
+        ("EXTENSION_HELPERS_SIMD_TARGET_AVX2", None),
+    ]
+    assert variants[1].extra_compile_args == ["-O3"]
+    assert all(is_simd_variant(variant) for variant in variants)
+    assert not is_simd_variant(extension)
+
+    # The original extension should not be modified
+    assert extension.extra_compile_args == ["-O3"]
+    assert extension.define_macros == [("NDEBUG", None)]
+
+    dispatch = (tmp_path / "pkg" / "sub" / "_kernels.py").read_text()
+    assert "from pkg.cpu_features import get_simd_target" in dispatch
+    assert "_get_simd_target(('avx2',))" in dispatch
+
+
+def test_add_simd_variants_invalid():
+    with pytest.raises(ValueError, match="Unknown SIMD targets sse9"):
+        add_simd_variants(Extension("pkg._kernels", ["pkg/_kernels.c"]), targets=["sse9"])
+    with pytest.raises(ValueError, match="should be part of a package"):
+        add_simd_variants(Extension("_kernels", ["_kernels.c"]))
+    with pytest.raises(ValueError, match="has Cython sources"):
+        add_simd_variants(Extension("pkg._kernels", ["pkg/_kernels.pyx"]))
+
+
+def test_generate_cpu_features_py(tmp_path):
+    (tmp_path / "pkg").mkdir()
+
+    extension = generate_cpu_features_py("pkg", srcdir=str(tmp_path))
+
+    assert extension.name == "pkg._cpu_features"
+    assert extension.sources == [os.path.join(str(tmp_path), "pkg", "_cpu_features.c")]
+    assert (tmp_path / "pkg" / "_cpu_features.c").exists()
+    assert "def get_simd_target(targets):" in (tmp_path / "pkg" / "cpu_features.py").read_text()
+
+
+MODULE_C = """\
+#include <Python.h>
+
+static struct PyModuleDef moduledef = {
+    PyModuleDef_HEAD_INIT,
+    "_kernels",
+    NULL,
+    -1,
+    NULL
+};
+
+PyMODINIT_FUNC
+PyInit__kernels(void) {
+    PyObject *module = PyModule_Create(&moduledef);
+#if defined(EXTENSION_HELPERS_SIMD_TARGET_AVX512)
+    PyModule_AddStringConstant(module, "target", "avx512");
+#elif defined(EXTENSION_HELPERS_SIMD_TARGET_AVX2)
+    PyModule_AddStringConstant(module, "target", "avx2");
+#else
+    PyModule_AddStringConstant(module, "target", "baseline");
+#endif
+    return module;
+}
+"""
+
+
+def test_build_simd_variants(tmp_path, request):
+    test_pkg = tmp_path / "test_pkg"
+    package = test_pkg / "simd_test_package"
+    os.makedirs(package)
+    (package / "__init__.py").touch()
+    (package / "_kernels.c").write_text(MODULE_C)
+    (package / "setup_package.py").write_text(dedent("""\
+        from os.path import join
+        from setuptools import Extension
+        from extension_helpers import add_simd_variants
+
+        def get_extensions():
+            extension = Extension(
+                'simd_test_package._kernels', [join('simd_test_package', '_kernels.c')]
+            )
+            return add_simd_variants(extension)
+    """))
+    (test_pkg / "setup.py").write_text(dedent(f"""\
+        import sys
+        from setuptools import setup, find_packages
+        sys.path.insert(0, r'{extension_helpers_PATH}')
+        from extension_helpers import get_extensions
+
+        setup(
+            name='simd_test_package',
+            version='0.1',
+            packages=find_packages(),
+            ext_modules=get_extensions(),
+        )
+    """))
+
+    request.addfinalizer(lambda: cleanup_import("simd_test_package"))
+
+    with chdir(test_pkg):
+        run_setup("setup.py", ["build_ext", "--inplace"])
+
+    sys.path.insert(0, str(test_pkg))
+    try:
+        kernels = importlib.import_module("simd_test_package._kernels")
+        cpu_features = importlib.import_module("simd_test_package.cpu_features")
+
+        assert kernels.__name__ == "simd_test_package._kernels"
+        assert kernels.target == kernels.__simd_target__
+        assert kernels.__simd_target__ in ("avx512", "avx2", "baseline")
+        assert isinstance(cpu_features.get_cpu_features(), frozenset)
+        assert cpu_features.get_simd_target([]) == "baseline"
+
+        baseline = importlib.import_module("simd_test_package._kernels_baseline")
+        assert baseline.target == "baseline"
+    finally:
+        sys.path.remove(str(test_pkg))
@@ -0,0 +1,127 @@
+import os
+
+from setuptools import find_packages
+
+from .._source_tree import get_ignore_patterns, index_source_tree
+
+
+def _make_tree(tmp_path, paths):
+    for path in paths:
+        filename = tmp_path / path
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        filename.touch()
+
+
+def test_index_source_tree(tmp_path):
+    _make_tree(
+        tmp_path,
+        [
+            "setup.py",
+            "yoda/__init__.py",
+            "yoda/setup_package.py",
+            "yoda/spam.pyx",
+            "yoda/.hidden.pyx",
+            "yoda/luke/__init__.py",
+            "yoda/luke/dagobah.pyx",
+            "yoda/luke/hoth.c",
+            "yoda/notapackage/mod.pyx",
+            "yoda/notapackage/sub/__init__.py",
+            "yoda/with.dot/__init__.py",
+            "cextern/lib/lib.c",
+            "cextern/lib/lib.h",
+            ".hidden/__init__.py",
+            "build/lib/yoda/__init__.py",
+        ],
+    )
+
+    index = index_source_tree(str(tmp_path))
+
+    assert index.packages == ["yoda", "yoda.luke"]
+    assert index.packages == sorted(
+        pkg for pkg in find_packages(str(tmp_path)) if not pkg.startswith("build")
+    )
+    assert index.setup_packages == {"yoda": os.path.join(str(tmp_path), "yoda", "setup_package.py")}
+    assert index.pyx_files == {
+        "yoda": [os.path.join(str(tmp_path), "yoda", "spam.pyx")],
+        "yoda.luke": [os.path.join(str(tmp_path), "yoda", "luke", "dagobah.pyx")],
+    }
+
+
+def test_index_source_tree_skips_non_packages(tmp_path, monkeypatch):
+    _make_tree(
+        tmp_path,
+        [
+            "yoda/__init__.py",
+            "data/nested/sub/__init__.py",
+            "yoda/notapackage/sub/__init__.py",
+        ],
+    )
+
+    scanned = []
+    original_scandir = os.scandir
+
+    def scandir(path):
+        scanned.append(os.path.relpath(path, tmp_path))
+        return original_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", scandir)
+
+    index = index_source_tree(str(tmp_path))
+
+    # Directories which are not packages are not traversed at all
+    assert index.packages == ["yoda"]
+    assert sorted(scanned) == [".", "yoda"]
+
+
+def test_index_source_tree_nested_build_dist(tmp_path):
+    _make_tree(
+        tmp_path,
+        [
+            "yoda/__init__.py",
+            "yoda/dist/__init__.py",
+            "yoda/dist/fast.pyx",
+            "yoda/build/__init__.py",
+            "dist/yoda/__init__.py",
+            "build/lib/yoda/__init__.py",
+        ],
+    )
+
+    index = index_source_tree(str(tmp_path))
+
+    # Only the build and dist directories at the root of the tree are ignored
+    assert index.packages == ["yoda", "yoda.build", "yoda.dist"]
+    assert index.packages == sorted(
+        pkg for pkg in find_packages(str(tmp_path)) if not pkg.startswith(("build", "dist"))
+    )
+    assert index.pyx_files["yoda.dist"] == [os.path.join(str(tmp_path), "yoda", "dist", "fast.pyx")]
+
+
+def test_index_source_tree_ignore(tmp_path):
+    _make_tree(
+        tmp_path,
+        [
+            "yoda/__init__.py",
+            "yoda/luke/__init__.py",
+            "yoda/luke/dagobah.pyx",
+            "yoda/leia/__init__.py",
+        ],
+    )
+
+    index = index_source_tree(str(tmp_path), ignore=["yoda/luke", "_build"])
+
+    assert index.packages == ["yoda", "yoda.leia"]
+
+
+def test_get_ignore_patterns(tmp_path):
+    assert "/build" in get_ignore_patterns(str(tmp_path))
+
+    (tmp_path / ".gitignore").write_text("# Comment\n*.so\n.tox/\n!keep/\ndocs/_build/\n")
+    (tmp_path / "pyproject.toml").write_text('[tool.extension-helpers]\nignore = ["cextern"]\n')
+
+    patterns = get_ignore_patterns(str(tmp_path))
+
+    assert ".tox/" in patterns
+    assert "docs/_build/" in patterns
+    assert "cextern" in patterns
+    assert "*.so" not in patterns
+    assert "!keep/" not in patterns
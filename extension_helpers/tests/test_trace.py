@@ -0,0 +1,80 @@
+import json
+import sys
+
+import pytest
+from setuptools.command.build_ext import customize_compiler, new_compiler
+from setuptools.errors import CompileError
+
+from .._trace import BuildTrace, _describe_command
+
+
+@pytest.mark.parametrize(
+    ("cmd", "expected"),
+    [
+        (["gcc", "-O2", "-c", "pkg/module.c", "-o", "build/module.o"], ("compile", "module.c")),
+        (["cl.exe", "/c", "/nologo", "/Tcpkg\\module.cpp"], ("compile", "module.cpp")),
+        (["gcc", "-shared", "a.o", "b.o", "-o", "build/module.so"], ("link", "module.so")),
+        (["link.exe", "/DLL", "a.obj", "/OUT:build\\module.pyd"], ("link", "module.pyd")),
+    ],
+)
+def test_describe_command(cmd, expected):
+    assert _describe_command(cmd) == expected
+
+
+def test_summary(tmp_path):
+    trace = BuildTrace(str(tmp_path / "trace.json"))
+
+    with trace.extension("pkg.small"):
+        trace.add_event("small.c", "compile", 0.0, 1.0, cpu_time=0.5, max_rss=10.0)
+    with trace.extension("pkg.large"):
+        trace.add_event("large.c", "compile", 0.0, 2.0, cpu_time=1.5, max_rss=30.0)
+        trace.add_event("large.so", "link", 2.0, 2.5, cpu_time=0.5, max_rss=20.0)
+    trace.add_event("other.pyx", "cythonize", 0.0, 0.5, extension="pkg.other")
+
+    summary = trace.get_summary()
+    assert summary == [
+        ("pkg.large", 2, 2.5, 2.0, 30.0),
+        ("pkg.small", 1, 1.0, 0.5, 10.0),
+        ("pkg.other", 1, 0.5, None, None),
+    ]
+
+    lines = trace.format_summary().splitlines()
+    assert lines[0] == "extension  steps  wall [s]   cpu [s]  peak RSS [MB]"
+    assert lines[1].split() == ["pkg.large", "2", "2.50", "2.00", "30.0"]
+    assert lines[3].split() == ["pkg.other", "1", "0.50", "-", "-"]
+
+    trace.write()
+    with open(tmp_path / "trace.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert [event["name"] for event in events] == ["small.c", "large.c", "large.so", "other.pyx"]
+    assert events[1]["ph"] == "X"
+    assert events[1]["dur"] == 2e6
+    assert events[1]["args"] == {"cpu_time": 1.5, "max_rss": 30.0, "extension": "pkg.large"}
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Uses a Unix compiler")
+def test_trace_compiler(tmp_path):
+    ccompiler = new_compiler()
+    customize_compiler(ccompiler)
+
+    trace = BuildTrace(str(tmp_path / "trace.json"))
+    trace.trace_compiler(ccompiler)
+
+    (tmp_path / "test.c").write_text("int test(void) { return 1; }\n")
+    (tmp_path / "broken.c").write_text("this is not C\n")
+
+    with trace.extension("pkg.test"):
+        ccompiler.compile([str(tmp_path / "test.c")], output_dir=str(tmp_path))
+        with pytest.raises(CompileError):
+            ccompiler.compile([str(tmp_path / "broken.c")], output_dir=str(tmp_path))
+        ccompiler.compiler_so = [str(tmp_path / "missing-command")]
+        with pytest.raises(CompileError):
+            ccompiler.compile([str(tmp_path / "test.c")], output_dir=str(tmp_path / "missing"))
+
+    assert len(trace.events) == 1
+    event = trace.events[0]
+    assert event["name"] == "test.c"
+    assert event["cat"] == "compile"
+    assert event["args"]["extension"] == "pkg.test"
+    assert event["args"]["cpu_time"] >= 0
+    assert event["args"]["max_rss"] > 0
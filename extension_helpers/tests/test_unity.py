@@ -0,0 +1,85 @@
+import os
+
+import pytest
+from setuptools import Extension
+
+from .._unity import apply_unity_build, get_unity_build_options
+
+
+def test_get_unity_build_options(tmp_path, monkeypatch):
+    monkeypatch.delenv("EXTENSION_HELPERS_UNITY_BUILD", raising=False)
+    assert get_unity_build_options(str(tmp_path)) == (0, [])
+
+    (tmp_path / "pyproject.toml").write_text(
+        '[tool.extension-helpers]\nunity-build = 4\nunity-build-exclude = ["*_nounity.c"]\n'
+    )
+    assert get_unity_build_options(str(tmp_path)) == (4, ["*_nounity.c"])
+
+    # The environment variable takes precedence
+    monkeypatch.setenv("EXTENSION_HELPERS_UNITY_BUILD", "0")
+    assert get_unity_build_options(str(tmp_path)) == (0, ["*_nounity.c"])
+
+    monkeypatch.setenv("EXTENSION_HELPERS_UNITY_BUILD", "yes")
+    with pytest.raises(ValueError, match="should be an integer"):
+        get_unity_build_options(str(tmp_path))
+
+
+@pytest.fixture
+def sources(tmp_path):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    names = ["a.c", "b.c", "c.c", "d.c", "e.c", "sub/f.c", "g.cpp", "h.cxx", "i.f90", "j.c"]
+    for name in names:
+        (src / name).write_text("")
+    # Sources generated from .pyx files are never merged
+    (src / "j.pyx").write_text("")
+    return [str(src / name) for name in names]
+
+
+def test_apply_unity_build(tmp_path, sources):
+    build_dir = str(tmp_path / "build")
+    extension = Extension("pkg.ext", list(sources), depends=[sources[0]])
+
+    generated = apply_unity_build(
+        [extension], build_dir, 2, exclude=["e.c", "src/sub/*.c"], root=str(tmp_path)
+    )
+
+    directory = os.path.join(build_dir, "pkg", "ext")
+    assert generated == [
+        os.path.join(directory, "unity_c0.c"),
+        os.path.join(directory, "unity_c1.c"),
+        os.path.join(directory, "unity_cpp0.cpp"),
+    ]
+    assert extension.sources == [sources[4], sources[5], sources[8], sources[9], *generated]
+    assert extension.depends == [sources[0], sources[1], sources[2], sources[3], *sources[6:8]]
+
+    with open(generated[0]) as f:
+        lines = f.read().splitlines()
+    assert lines[0].startswith("/* Generated by extension-helpers")
+    assert lines[1:] == ['#include "../../../src/a.c"', '#include "../../../src/b.c"']
+
+    with open(generated[2]) as f:
+        assert f.read().splitlines()[1:] == [
+            '#include "../../../src/g.cpp"',
+            '#include "../../../src/h.cxx"',
+        ]
+
+    # Running again should not modify the generated files, and the generated
+    # files should not be merged again
+    for filename in generated:
+        os.utime(filename, ns=(0, 0))
+    extension = Extension("pkg.ext", list(sources))
+    options = {"exclude": ["e.c", "src/sub/*.c"], "root": str(tmp_path)}
+    assert apply_unity_build([extension], build_dir, 2, **options) == generated
+    assert all(os.stat(filename).st_mtime_ns == 0 for filename in generated)
+    assert apply_unity_build([extension], build_dir, 2, **options) == []
+
+
+def test_apply_unity_build_unchanged(tmp_path, sources):
+    # Extensions with a single source of each language are left alone
+    extension = Extension("pkg.ext", [sources[0], sources[6], sources[8]])
+    assert apply_unity_build([extension], str(tmp_path / "build"), 4) == []
+    assert extension.sources == [sources[0], sources[6], sources[8]]
+    assert not os.path.exists(tmp_path / "build")
+
+    assert apply_unity_build([Extension("pkg.ext", list(sources))], str(tmp_path), 0) == []
@@ -39,6 +39,21 @@ def test_write_if_different(tmp_path, path_type):
     assert time3 > time1
 
 
+def test_write_if_different_atomic(tmp_path):
+    filepath = tmp_path / "test.txt"
+    write_if_different(filepath, b"abc")
+    write_if_different(filepath, b"abcd")
+    assert filepath.read_bytes() == b"abcd"
+    # No temporary files should be left behind
+    assert os.listdir(tmp_path) == ["test.txt"]
+    # The permissions of the file should be the default ones rather than
+    # the restrictive ones used for temporary files.
+    umask = os.umask(0)
+    os.umask(umask)
+    if os.name != "nt":
+        assert filepath.stat().st_mode & 0o777 == 0o666 & ~umask
+
+
 class TestGetLimitedAPIOption:
 
     def test_nofiles(self, tmp_path):